@@ -1,11 +1,30 @@
+import asyncio
+import json
+from datetime import datetime, timezone
 from fastapi import APIRouter, Request, HTTPException
-from policy_evaluator import opa_eval
-from wasm_engine import wasm_engine
+from fastapi.responses import Response
+from config import BATCH_MAX_ITEMS, BATCH_BACKEND, POLICY_ENTRYPOINT
+from async_evaluator import async_evaluator, EvaluatorSaturatedError
+from wasm_engine import wasm_engine, EvaluationTimeoutError
+from policy_registry import policy_registry, PolicyNotFoundError
+from instance_pool import PoolTimeoutError
+from decision_cache import decision_cache
+from process_pool import process_backend
+from opa_builtins import builtin_stats, UnsupportedBuiltinError
+from ndjson_stream import NDJSONStreamingResponse, evaluate_stream, iter_lines
+from input_template import InputTemplate
+from decision_log import decision_logger
+import metrics_exporter
+import tracing
 
 # TODO: Add rate limiting to all endpoints
 # FIXME: Need proper authentication middleware
 router = APIRouter()
 
+# Inputs of the demo endpoints; only the user varies between requests
+RESOURCE_INPUT = InputTemplate({"action": "read", "resource": "some_resource"}, holes=["user"])
+DEBUG_RESOURCE_INPUT = InputTemplate({"action": "read", "resource": "debug_resource"}, holes=["user"])
+
 @router.get("/")
 async def root():
     # TODO: Add API documentation link here
@@ -19,24 +38,22 @@ async def get_resource(request: Request):
     user = {"role": "admin"}  # Change to "user" to test deny
     
     # FIXME: Need to validate input structure before passing to OPA
-    opa_input = {
-        "user": user,
-        "action": "read",
-        "resource": "some_resource"
-    }
+    values = {"user": user}
     
     try:
-        allowed = opa_eval(opa_input)
+        allowed = await async_evaluator.evaluate_template(RESOURCE_INPUT, values)
         if not allowed:
             raise HTTPException(status_code=403, detail="Access denied by policy")
         return {
             "message": "Access granted!",
             "user": user,
-            "input": opa_input,
+            "input": RESOURCE_INPUT.render(values),
             "policy_result": allowed
         }
     except HTTPException:
         raise
+    except EvaluatorSaturatedError as e:
+        raise HTTPException(status_code=503, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Authorization failed: {str(e)}")
 
@@ -45,13 +62,23 @@ async def health_check():
     """Health check endpoint"""
     # TODO: Add more comprehensive health checks (memory, CPU, dependencies)
     wasm_status = "initialized" if wasm_engine.is_initialized() else "failed"
-    # FIXME: Timestamp should be dynamic, not hardcoded
     return {
         "status": "healthy",
         "wasm_module": wasm_status,
-        "timestamp": "2025-06-23"
+        "policy_version": wasm_engine.policy_version,
+        "instance_pool": wasm_engine.get_stats(),
+        "decision_cache": decision_cache.stats(),
+        "evaluator": async_evaluator.stats(),
+        "builtins": builtin_stats.snapshot(),
+        "decision_log": decision_logger.stats(),
+        "timestamp": datetime.now(timezone.utc).isoformat(),
     }
 
+@router.get("/metrics")
+async def metrics():
+    """Prometheus metrics: decision latency by stage, outcomes, pool, cache, evaluator and builtins"""
+    return Response(metrics_exporter.render(), media_type=metrics_exporter.CONTENT_TYPE)
+
 @router.get("/wasm-info")
 async def wasm_info():
     """Get WASM module information"""
@@ -59,8 +86,7 @@ async def wasm_info():
         return {"error": "WASM module not initialized"}
     
     try:
-        exports = wasm_engine.get_exports()
-        export_names = list(exports.keys())
+        export_names = wasm_engine.get_export_names()
         
         # Categorize exports
         opa_functions = [name for name in export_names if name.startswith('opa_')]
@@ -98,7 +124,7 @@ async def test_policy():
         }
         
         try:
-            allowed = opa_eval(opa_input)
+            allowed = await async_evaluator.evaluate(opa_input)
             results.append({
                 "test_id": i,
                 "description": test_case["description"],
@@ -138,14 +164,11 @@ async def debug_resource():
     
     for role in test_roles:
         user_data = {"role": role} if role else {}
-        opa_input = {
-            "user": user_data,
-            "action": "read", 
-            "resource": "debug_resource"
-        }
+        values = {"user": user_data}
+        opa_input = DEBUG_RESOURCE_INPUT.render(values)
         
         try:
-            allowed = opa_eval(opa_input)
+            allowed = await async_evaluator.evaluate_template(DEBUG_RESOURCE_INPUT, values)
             results[f"role_{role or 'none'}"] = {
                 "input": opa_input,
                 "allowed": allowed,
@@ -173,3 +196,151 @@ async def debug_resource():
         },
         "results": results
     }
+
+@router.get("/debug-traces")
+async def debug_traces(limit: int = 100):
+    """Most recent sampled decision traces as OTLP/JSON, with OPA_TRACE_EXPORTER=memory"""
+    if tracing.memory_exporter is None:
+        return {"error": "In-memory trace exporter not enabled (OPA_TRACE_EXPORTER=memory)"}
+    traces = tracing.memory_exporter.traces()[-limit:] if limit > 0 else []
+    return {"traces": [trace.to_otlp() for trace in traces], "exported": tracing.tracer.exported}
+
+def _eval_timeout(request: Request):
+    """Optional ?timeout=<seconds>, which can only shorten the policy's own deadline"""
+    raw = request.query_params.get("timeout")
+    if raw is None:
+        return None
+    try:
+        seconds = float(raw)
+    except ValueError:
+        seconds = 0.0
+    if seconds <= 0:
+        raise HTTPException(status_code=400, detail=f"Invalid timeout '{raw}'")
+    return seconds
+
+async def _json_object(request: Request):
+    """The request body as a JSON object ({} when empty); anything else is a 400"""
+    raw = await request.body()
+    if not raw:
+        return {}
+    try:
+        body = json.loads(raw)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Request body is not valid JSON")
+    if not isinstance(body, dict):
+        raise HTTPException(status_code=400, detail="Request body must be a JSON object")
+    return body
+
+@router.post("/v1/data/{path:path}")
+async def evaluate_data(path: str, request: Request):
+    """Evaluate the rule at /v1/data/{package}/{rule} against {"input": ...}
+
+    ?timeout=<seconds> shortens the policy's evaluation deadline for this request.
+    """
+    body = await _json_object(request)
+    eval_timeout = _eval_timeout(request)
+    
+    try:
+        result_set, request.state.policy_version = await async_evaluator.run(
+            policy_registry.evaluate_versioned, path, body.get("input"), eval_timeout=eval_timeout
+        )
+    except PolicyNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except (PoolTimeoutError, EvaluatorSaturatedError) as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except EvaluationTimeoutError as e:
+        raise HTTPException(status_code=504, detail=str(e))
+    except UnsupportedBuiltinError as e:
+        raise HTTPException(status_code=501, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Evaluation failed: {str(e)}")
+    
+    # Same shape as OPA's REST API: an undefined rule yields an empty document
+    if not result_set:
+        return {}
+    return {"result": result_set[0].get("result")}
+
+def _batch_backend(request: Request):
+    """The ?backend=thread|process the request picked; both offer evaluate_many(_versioned)"""
+    backend = request.query_params.get("backend", BATCH_BACKEND)
+    if backend == "process":
+        return process_backend
+    if backend == "thread":
+        return policy_registry
+    raise HTTPException(status_code=400, detail=f"Unknown backend '{backend}'")
+
+@router.post("/v1/batch")
+async def evaluate_batch(request: Request):
+    """Evaluate one rule for many inputs: {"path": "authz/allow", "inputs": [...]}
+
+    ?backend=process shards the batch across worker processes instead of
+    evaluating it on one instance in this process. ?timeout=<seconds> bounds
+    each decision in the batch.
+    """
+    body = await _json_object(request)
+    inputs = body.get("inputs")
+    if not isinstance(inputs, list):
+        raise HTTPException(status_code=400, detail="'inputs' must be a list")
+    if len(inputs) > BATCH_MAX_ITEMS:
+        raise HTTPException(
+            status_code=413, detail=f"Batch of {len(inputs)} exceeds {BATCH_MAX_ITEMS} inputs"
+        )
+    path = body.get("path") or POLICY_ENTRYPOINT
+    eval_timeout = _eval_timeout(request)
+    backend = _batch_backend(request)
+    
+    try:
+        result_sets, request.state.policy_version = await async_evaluator.run(
+            backend.evaluate_many_versioned, path, inputs, eval_timeout=eval_timeout
+        )
+    except PolicyNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except (PoolTimeoutError, EvaluatorSaturatedError) as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except EvaluationTimeoutError as e:
+        raise HTTPException(status_code=504, detail=str(e))
+    except UnsupportedBuiltinError as e:
+        raise HTTPException(status_code=501, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Evaluation failed: {str(e)}")
+    
+    # One entry per input, each shaped like a /v1/data response
+    return {
+        "results": [
+            {"result": result_set[0].get("result")} if result_set else {}
+            for result_set in result_sets
+        ]
+    }
+
+@router.post("/v1/stream")
+async def evaluate_ndjson_stream(request: Request):
+    """Evaluate one rule for every line of an NDJSON body, streaming NDJSON decisions back
+
+    ?path= picks the rule (default POLICY_ENTRYPOINT); ?backend= and ?timeout=
+    work as for /v1/batch. Each non-blank input line gets one output line, in
+    order: {"result": ...}, {} when undefined, or {"error": ...}.
+    """
+    path = request.query_params.get("path") or POLICY_ENTRYPOINT
+    eval_timeout = _eval_timeout(request)
+    evaluate_many = _batch_backend(request).evaluate_many
+    try:
+        policy, _ = policy_registry.resolve(path)
+    except PolicyNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    # Headers go out before any decision, so they carry the version serving when the stream began
+    request.state.policy_version = policy.engine.policy_version
+    
+    async def evaluate_chunk(inputs):
+        while True:
+            try:
+                return await async_evaluator.run(evaluate_many, path, inputs, eval_timeout=eval_timeout)
+            except EvaluatorSaturatedError:
+                # A bulk stream waits for capacity rather than failing its records
+                await asyncio.sleep(0.05)
+    
+    return NDJSONStreamingResponse(evaluate_stream(iter_lines(request.stream()), evaluate_chunk))
+
+@router.get("/v1/policies")
+async def list_policies():
+    """Per-policy load state, memory and latency statistics"""
+    return {"policies": policy_registry.stats()}
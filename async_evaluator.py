@@ -0,0 +1,91 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from logger import get_logger
+from config import EVAL_WORKERS, EVAL_QUEUE_DEPTH
+from metrics import Histogram
+from policy_evaluator import opa_eval, opa_eval_template
+
+logger = get_logger(__name__)
+
+
+class EvaluatorSaturatedError(RuntimeError):
+    """Raised instead of queueing when every worker is busy and the queue is full"""
+
+
+class AsyncEvaluator:
+    """Runs blocking evaluations on a bounded thread pool so the event loop never stalls
+
+    Workers match the instance pool size, so a running evaluation never waits
+    for an instance; anything beyond workers + queue depth is rejected at once.
+    """
+
+    def __init__(self, workers=EVAL_WORKERS, queue_depth=EVAL_QUEUE_DEPTH):
+        self.workers = workers
+        self.queue_depth = queue_depth
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="opa-eval")
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self.rejected = 0
+        # Time between submission and a worker picking the call up, and time spent running it
+        self.queue_wait = Histogram()
+        self.run_time = Histogram()
+
+    async def run(self, func, *args, **kwargs):
+        """Await func(*args, **kwargs) on a worker thread, or fail fast when saturated"""
+        with self._lock:
+            if self._in_flight >= self.workers + self.queue_depth:
+                self.rejected += 1
+                raise EvaluatorSaturatedError(
+                    f"Evaluator saturated: {self._in_flight} evaluations in flight"
+                )
+            self._in_flight += 1
+        submitted = time.perf_counter()
+
+        def timed():
+            started = time.perf_counter()
+            self.queue_wait.observe(started - submitted)
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self.run_time.observe(time.perf_counter() - started)
+
+        future = self._executor.submit(timed)
+        # Released when the work really ends, even if the awaiting request is cancelled first
+        future.add_done_callback(self._release)
+        return await asyncio.wrap_future(future)
+
+    def _release(self, _future):
+        with self._lock:
+            self._in_flight -= 1
+
+    async def evaluate(self, input_data):
+        """Async opa_eval against the default policy"""
+        return await self.run(opa_eval, input_data)
+
+    async def evaluate_template(self, template, values):
+        """Async opa_eval_template against the default policy"""
+        return await self.run(opa_eval_template, template, values)
+
+    def shutdown(self):
+        self._executor.shutdown(wait=True)
+        logger.info("Async evaluator stopped")
+
+    def stats(self):
+        with self._lock:
+            in_flight = self._in_flight
+            rejected = self.rejected
+        return {
+            "workers": self.workers,
+            "queue_depth": self.queue_depth,
+            "in_flight": in_flight,
+            "queued": max(0, in_flight - self.workers),
+            "rejected": rejected,
+            "queue_wait_seconds": self.queue_wait.snapshot(),
+            "run_seconds": self.run_time.snapshot(),
+        }
+
+
+# Create a singleton evaluator shared by every route
+async_evaluator = AsyncEvaluator()
@@ -0,0 +1 @@
+# Offline benchmarks for the policy evaluation pipeline; `python -m bench` runs the suite
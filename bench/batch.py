@@ -0,0 +1,67 @@
+"""
+Microbenchmark: per-decision cost of one evaluation per call versus
+evaluate_batch_on_instance over the same inputs.
+
+Usage:
+    python -m bench.batch --size 10000
+"""
+import argparse
+import json
+import sys
+import time
+from wasm_engine import wasm_engine
+from policy_evaluator import evaluate_result_set, evaluate_batch_on_instance
+
+
+def make_inputs(size):
+    roles = ("admin", "user", "guest")
+    return [
+        {"user": {"role": roles[i % len(roles)], "id": i}, "action": "read", "resource": f"doc-{i}"}
+        for i in range(size)
+    ]
+
+
+def per_decision_us(func, size, repeat=3):
+    best = min(_timed(func) for _ in range(repeat))
+    return best / size * 1e6
+
+
+def _timed(func):
+    start = time.perf_counter()
+    func()
+    return time.perf_counter() - start
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size", type=int, default=10_000)
+    args = parser.parse_args(argv)
+
+    if not wasm_engine.is_initialized():
+        print("OPA WASM module not initialized", file=sys.stderr)
+        return 2
+
+    inputs = make_inputs(args.size)
+    with wasm_engine.checkout() as instance:
+        single = [evaluate_result_set(instance, item) for item in inputs]
+        batch = evaluate_batch_on_instance(instance, inputs)
+        if single != batch:
+            print("Batch results differ from single evaluations", file=sys.stderr)
+            return 1
+        report = {
+            "size": args.size,
+            "abi_path": instance.abi.abi_path,
+            "single_us_per_decision": per_decision_us(
+                lambda: [evaluate_result_set(instance, item) for item in inputs], args.size
+            ),
+            "batch_us_per_decision": per_decision_us(
+                lambda: evaluate_batch_on_instance(instance, inputs), args.size
+            ),
+        }
+    report["speedup"] = report["single_us_per_decision"] / report["batch_us_per_decision"]
+    print(json.dumps(report, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
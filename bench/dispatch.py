@@ -0,0 +1,74 @@
+"""
+Microbenchmark: per-call overhead of resolving exports on every evaluation
+(the old opa_eval behaviour) versus reading the dispatch table built at load.
+
+Usage:
+    python -m bench.dispatch --iterations 100000
+"""
+import argparse
+import json
+import logging
+import sys
+import timeit
+from wasm_engine import wasm_engine
+from policy_evaluator import evaluate_on_instance
+
+# Stand-in for the application logger so the legacy path pays for log records
+# without flooding the terminal
+_legacy_logger = logging.getLogger("bench.dispatch.legacy")
+_legacy_logger.addHandler(logging.NullHandler())
+_legacy_logger.propagate = False
+_legacy_logger.setLevel(logging.INFO)
+
+
+def legacy_resolution(instance):
+    """What every call used to do before reaching the guest"""
+    exports = instance.instance.exports(instance.store)
+    available_eval_funcs = [name for name in exports.keys() if 'eval' in name.lower()]
+    _legacy_logger.info(f"Available evaluation functions: {available_eval_funcs}")
+    if "opa_eval_ctx_new" in exports and "opa_eval" in exports:
+        return (
+            exports["opa_malloc"], exports["opa_free"], exports["opa_eval_ctx_new"],
+            exports["opa_eval_ctx_set_input"], exports["opa_eval"],
+            exports["opa_eval_ctx_get_result"],
+        )
+    return None
+
+
+def table_resolution(instance):
+    """What every call does now"""
+    abi = instance.abi
+    return abi.abi_path, abi.eval_oneshot, abi.eval_ctx, abi.default_entrypoint
+
+
+def per_call_us(func, iterations):
+    return min(timeit.repeat(func, number=iterations, repeat=5)) / iterations * 1e6
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=100_000)
+    args = parser.parse_args(argv)
+
+    if not wasm_engine.is_initialized():
+        print("OPA WASM module not initialized", file=sys.stderr)
+        return 2
+
+    sample_input = {"user": {"role": "admin"}, "action": "read", "resource": "doc"}
+    with wasm_engine.checkout() as instance:
+        report = {
+            "iterations": args.iterations,
+            "abi_path": instance.abi.abi_path,
+            "legacy_resolution_us": per_call_us(lambda: legacy_resolution(instance), args.iterations),
+            "table_resolution_us": per_call_us(lambda: table_resolution(instance), args.iterations),
+            "full_evaluation_us": per_call_us(
+                lambda: evaluate_on_instance(instance, sample_input), max(1, args.iterations // 10)
+            ),
+        }
+    report["overhead_saved_us"] = report["legacy_resolution_us"] - report["table_resolution_us"]
+    print(json.dumps(report, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,77 @@
+"""
+Synthetic authorization inputs of configurable shape and size
+
+Every shape keeps the fields example.rego reads (user.role) so decisions stay
+meaningful, and pads with fields the policy ignores up to the requested size:
+
+  rbac    user, action and resource only, padded with a string attribute
+  nested  a context object nested deeper and deeper
+  wide    many sibling attributes at the top level
+  list    a long user.groups array
+"""
+import copy
+import json
+import random
+
+SHAPES = ("rbac", "nested", "wide", "list")
+ROLES = ("admin", "user", "guest")
+
+
+def _base(index, rng):
+    return {
+        "user": {"role": rng.choice(ROLES), "id": index},
+        "action": rng.choice(("read", "write", "delete")),
+        "resource": f"doc-{index}",
+    }
+
+
+def _grow(value, shape, step):
+    """Add roughly `step` bytes of padding to `value` in the style of `shape`"""
+    if shape == "rbac":
+        value["padding"] = value.get("padding", "") + "x" * step
+    elif shape == "nested":
+        node = value.setdefault("context", {})
+        while "child" in node:
+            node = node["child"]
+        node["child"] = {"attributes": {f"k{i}": f"v{i}" for i in range(max(1, step // 12))}}
+    elif shape == "wide":
+        start = sum(1 for key in value if key.startswith("attr"))
+        for i in range(start, start + max(1, step // 16)):
+            value[f"attr{i:06d}"] = i
+    elif shape == "list":
+        groups = value["user"].setdefault("groups", [])
+        groups.extend(f"group-{len(groups) + i}" for i in range(max(1, step // 14)))
+    else:
+        raise ValueError(f"Unknown input shape '{shape}'; expected one of {', '.join(SHAPES)}")
+
+
+def template(shape, size_bytes, rng):
+    """One input of `shape` whose JSON encoding is about `size_bytes` long (never much shorter)"""
+    value = _base(0, rng)
+    if shape not in SHAPES:
+        raise ValueError(f"Unknown input shape '{shape}'; expected one of {', '.join(SHAPES)}")
+    size = len(json.dumps(value))
+    while size < size_bytes:
+        # Grow by about half the remaining gap so large inputs take few re-encodings
+        _grow(value, shape, max(16, (size_bytes - size) // 2))
+        size = len(json.dumps(value))
+    return value
+
+
+def generate(count, shape="rbac", size_bytes=0, distinct=None, seed=0):
+    """`count` inputs cycling through `distinct` variants (all distinct by default)
+
+    Variants differ in user, action and resource, so fewer variants than inputs
+    turn into decision cache hits; the padding is shared between variants.
+    """
+    rng = random.Random(seed)
+    padded = template(shape, size_bytes, rng)
+    variants = []
+    for index in range(min(count, distinct or count)):
+        value = copy.copy(padded)
+        base = _base(index, rng)
+        value["user"] = {**padded["user"], **base["user"]}
+        value["action"] = base["action"]
+        value["resource"] = base["resource"]
+        variants.append(value)
+    return [variants[i % len(variants)] for i in range(count)] if variants else []
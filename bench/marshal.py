@@ -0,0 +1,97 @@
+"""
+Input marshalling cost at 1 KB, 64 KB and 1 MB: encoding the input to JSON
+bytes, copying those bytes into guest memory, and the whole guest round trip.
+
+  encode     json.dumps(...).encode() against orjson.dumps (when installed)
+  write      Memory.write, which copies through a bytearray, against
+             PolicyInstance.write_input's single copy into the reusable
+             buffer above the heap snapshot
+  evaluate   evaluate_with_oneshot_api / evaluate_with_context_api on one
+             instance with the input already encoded
+
+Usage:
+    python -m bench.marshal --sizes 1024 65536 1048576 --shape nested --iterations 200
+"""
+import argparse
+import json
+import sys
+import time
+from wasm_engine import wasm_engine
+from policy_evaluator import evaluate_with_oneshot_api, evaluate_with_context_api, _entrypoint_id
+from json_codec import orjson
+from bench.generators import SHAPES, generate
+from bench.stats import latency_summary
+
+SIZES = (1024, 65536, 1 << 20)
+
+
+def _time(call, iterations, warmup=5):
+    """latency_summary of `iterations` calls to call() after `warmup` untimed ones"""
+    for _ in range(warmup):
+        call()
+    clock = time.perf_counter_ns
+    latencies = []
+    for _ in range(iterations):
+        start = clock()
+        call()
+        latencies.append(clock() - start)
+    return latency_summary(latencies)
+
+
+def run_size(size, args):
+    value = generate(1, args.shape, size, seed=args.seed)[0]
+    raw = json.dumps(value, separators=(",", ":")).encode("utf-8")
+    report = {"input_bytes": len(raw)}
+
+    encoders = {"json": lambda: json.dumps(value, separators=(",", ":")).encode("utf-8")}
+    if orjson is not None:
+        encoders["orjson"] = lambda: orjson.dumps(value)
+    report["encode"] = {name: _time(encode, args.iterations) for name, encode in encoders.items()}
+
+    with wasm_engine.checkout() as instance:
+        store, addr = instance.store, instance.base_heap_ptr
+        instance.view(addr + len(raw))
+        report["write"] = {
+            "memory_write": _time(lambda: instance.memory.write(store, raw, addr), args.iterations),
+            "write_input": _time(lambda: instance.write_input(raw, addr), args.iterations),
+        }
+
+        entrypoint_id = _entrypoint_id(instance.abi, None)
+        paths = {"context": evaluate_with_context_api}
+        if instance.abi.eval_oneshot is not None:
+            paths["oneshot"] = evaluate_with_oneshot_api
+
+        def timed(evaluate):
+            # These bypass evaluate_result_set, so each call starts its evaluation here
+            instance.begin_evaluation()
+            return evaluate(instance, raw, entrypoint_id)
+
+        report["evaluate"] = {
+            name: _time(lambda: timed(evaluate), args.iterations) for name, evaluate in paths.items()
+        }
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=list(SIZES), help="input sizes in bytes")
+    parser.add_argument("--shape", choices=SHAPES, default="nested")
+    parser.add_argument("--iterations", type=int, default=200, help="timed calls per measurement")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    if not wasm_engine.is_initialized():
+        print("OPA WASM module not initialized", file=sys.stderr)
+        return 2
+
+    report = {
+        "config": vars(args),
+        "orjson": orjson is not None,
+        "sizes": {str(size): run_size(size, args) for size in args.sizes},
+    }
+    print(json.dumps(report, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
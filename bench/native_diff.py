@@ -0,0 +1,123 @@
+"""
+Differential check and microbenchmark for compiled native plans: every input
+is decided both natively and in WASM, any disagreement or disabled plan is reported (exit 1),
+and the per-decision cost of each path is compared.
+
+Inputs are the plan's own probes, the bench.batch workload, and random
+mixtures of both with noise fields and type changes.
+
+Usage:
+    python -m bench.native_diff --size 20000 --seed 1
+"""
+import argparse
+import copy
+import json
+import random
+import sys
+import time
+from wasm_engine import wasm_engine
+from policy_evaluator import evaluate_result_set
+from native_plan import NativeFallback, DISABLED, same_result
+from bench.batch import make_inputs
+
+_NOISE = ("admin", "", "ADMIN", " admin", 0, 1, 1.0, True, False, None, [], {}, ["admin"], {"role": "admin"})
+
+
+def _merge(a, b):
+    if isinstance(a, dict) and isinstance(b, dict):
+        merged = dict(a)
+        for key, value in b.items():
+            merged[key] = _merge(merged[key], value) if key in merged else value
+        return merged
+    return b
+
+
+def _mutate(value, rng):
+    """Replace one random leaf (or add a field) somewhere in `value`"""
+    if not isinstance(value, dict) or not value or rng.random() < 0.3:
+        return rng.choice(_NOISE) if rng.random() < 0.5 else {f"extra{rng.randrange(3)}": rng.choice(_NOISE)}
+    key = rng.choice(list(value))
+    value[key] = _mutate(value[key], rng)
+    return value
+
+
+def random_inputs(seeds, size, rng):
+    inputs = []
+    for _ in range(size):
+        item = copy.deepcopy(rng.choice(seeds))
+        if rng.random() < 0.5:
+            item = _merge(item, copy.deepcopy(rng.choice(seeds)))
+        for _ in range(rng.randrange(3)):
+            item = _mutate(item, rng)
+        inputs.append(item)
+    return inputs
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size", type=int, default=20_000)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args(argv)
+
+    policy = wasm_engine.current
+    if policy is None:
+        print("OPA WASM module not initialized", file=sys.stderr)
+        return 2
+    if not policy.native_plans:
+        print(f"No native plan compiled from {wasm_engine.native_plan_path}", file=sys.stderr)
+        return 2
+
+    rng = random.Random(args.seed)
+    report = {"size": args.size, "seed": args.seed, "plans": {}}
+    failed = False
+    for name, plan in sorted(policy.native_plans.items()):
+        seeds = [p for p in plan.probes if p is not None] + make_inputs(16)
+        inputs = plan.probes + random_inputs(seeds, args.size, rng)
+        mismatches, errors, fallbacks = [], [], 0
+        with wasm_engine.checkout() as instance:
+            expected = [evaluate_result_set(instance, item, name) for item in inputs]
+            start = time.perf_counter()
+            for item in inputs:
+                evaluate_result_set(instance, item, name)
+            wasm_seconds = time.perf_counter() - start
+
+        native_seconds = 0.0
+        for item, want in zip(inputs, expected):
+            start = time.perf_counter()
+            declined = plan.fallbacks
+            try:
+                got = plan.evaluate(item)
+            except NativeFallback as e:
+                # evaluate() counts the inputs it declines; anything else was a failure that disabled the plan
+                if plan.fallbacks > declined:
+                    fallbacks += 1
+                else:
+                    errors.append({"input": item, "error": str(e)})
+                continue
+            finally:
+                native_seconds += time.perf_counter() - start
+            # Rego equality on the decoded values: true and 1 stay distinct, 1 and 1.0 do not
+            if not same_result(got, want):
+                mismatches.append({"input": item, "native": got, "wasm": want})
+
+        # A plan disabled along the way disagreed with WASM or failed, however few inputs it declined
+        failed = failed or bool(mismatches) or bool(errors) or plan.state == DISABLED
+        report["plans"][name] = {
+            "inputs": len(inputs),
+            "state": plan.state,
+            "mismatches": len(mismatches),
+            "errors": len(errors),
+            "fallbacks": fallbacks,
+            "first_mismatches": mismatches[:5],
+            "first_errors": errors[:5],
+            "wasm_us_per_decision": wasm_seconds / len(inputs) * 1e6,
+            "native_us_per_decision": native_seconds / len(inputs) * 1e6,
+            "speedup": wasm_seconds / native_seconds if native_seconds else None,
+        }
+
+    print(json.dumps(report, indent=2, default=str))
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
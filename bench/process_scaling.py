@@ -0,0 +1,76 @@
+"""
+Benchmark: batch throughput of the in-process backend versus the process pool
+backend at increasing worker counts.
+
+Usage:
+    python -m bench.process_scaling --size 50000 --workers 1 2 4 8
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from policy_registry import policy_registry
+from process_pool import ProcessPoolBackend
+from config import POLICY_ENTRYPOINT, PROCESS_POOL_CHUNK_SIZE
+from bench.batch import make_inputs
+
+
+def throughput(evaluate_many, path, inputs, repeat=3):
+    """Best decisions per second over `repeat` runs"""
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        results = evaluate_many(path, inputs)
+        elapsed = time.perf_counter() - start
+        if len(results) != len(inputs):
+            raise RuntimeError(f"Expected {len(inputs)} results, got {len(results)}")
+        best = elapsed if best is None else min(best, elapsed)
+    return len(inputs) / best
+
+
+def default_worker_counts():
+    counts, n = [], 1
+    while n < (os.cpu_count() or 1):
+        counts.append(n)
+        n *= 2
+    return counts + [os.cpu_count() or 1]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size", type=int, default=50_000)
+    parser.add_argument("--path", default=POLICY_ENTRYPOINT)
+    parser.add_argument("--workers", type=int, nargs="+", default=default_worker_counts())
+    parser.add_argument("--chunk-size", type=int, default=PROCESS_POOL_CHUNK_SIZE)
+    args = parser.parse_args(argv)
+
+    inputs = make_inputs(args.size)
+    policy_registry.evaluate_many(args.path, inputs[:100])
+    report = {
+        "size": args.size,
+        "cpu_count": os.cpu_count(),
+        "thread_decisions_per_second": throughput(policy_registry.evaluate_many, args.path, inputs),
+        "process": [],
+    }
+
+    for workers in args.workers:
+        backend = ProcessPoolBackend(workers, args.chunk_size)
+        try:
+            # Warm-up starts every worker and loads the policy from the module cache
+            backend.evaluate_many(args.path, inputs[:args.chunk_size * workers])
+            rate = throughput(backend.evaluate_many, args.path, inputs)
+        finally:
+            backend.shutdown()
+        report["process"].append({
+            "workers": workers,
+            "decisions_per_second": rate,
+            "speedup_vs_thread": rate / report["thread_decisions_per_second"],
+        })
+
+    print(json.dumps(report, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
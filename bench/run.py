@@ -0,0 +1,229 @@
+"""
+Benchmark suite: every layer of the evaluation pipeline, from the raw guest
+call up to HTTP through an in-process ASGI client, over synthetic inputs.
+
+Scenarios:
+  oneshot    evaluate_with_oneshot_api on one instance, input pre-encoded (ABI 1.2+)
+  context    evaluate_with_context_api on one instance, input pre-encoded
+  engine     evaluate_result_set_on_engine: checkout, native plan or WASM, no cache
+  cache_hit  opa_eval over inputs already in the decision cache
+  template   opa_eval_template: the padding is a pre-parsed skeleton, only user is patched, no cache
+  batch      evaluate_batch_on_instance over --batch-size inputs per call
+  http       POST /v1/data/<path> through the FastAPI router, --concurrency clients
+
+Each scenario reports throughput, p50/p95/p99/p999 latency per call and the
+growth of process RSS and guest memory while it ran, as JSON.
+
+Usage:
+    python -m bench --scenarios oneshot engine http --iterations 20000 --shape nested --input-bytes 4096
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import sys
+import time
+from wasm_engine import wasm_engine
+from policy_evaluator import (
+    opa_eval, opa_eval_template, evaluate_with_oneshot_api, evaluate_with_context_api, evaluate_result_set_on_engine,
+    evaluate_batch_on_instance, _entrypoint_id,
+)
+from decision_cache import decision_cache
+from input_template import InputTemplate
+from json_codec import canonical_dumps, dumps
+from bench.generators import SHAPES, generate
+from bench.stats import latency_summary, rss_bytes
+
+SCENARIOS = ("oneshot", "context", "engine", "cache_hit", "template", "batch", "http")
+
+
+class Skipped(Exception):
+    """The scenario does not apply to the loaded policy or configuration"""
+
+
+def _timed_calls(call, items, warmup):
+    """Per-call latencies in ns of call(item) over `items` after `warmup` untimed calls, and the wall time"""
+    for item in items[:warmup]:
+        call(item)
+    latencies = []
+    clock = time.perf_counter_ns
+    began = clock()
+    for item in items:
+        start = clock()
+        call(item)
+        latencies.append(clock() - start)
+    return latencies, (clock() - began) / 1e9
+
+
+def _instance_scenario(args, inputs, evaluate):
+    encoded = [canonical_dumps(item) for item in inputs]
+    with wasm_engine.checkout() as instance:
+        entrypoint_id = _entrypoint_id(instance.abi, None)
+
+        def call(raw):
+            # These bypass evaluate_result_set, so each call starts its evaluation here
+            instance.begin_evaluation()
+            return evaluate(instance, raw, entrypoint_id)
+
+        return *_timed_calls(call, encoded, args.warmup), 1
+
+
+def run_oneshot(args, inputs):
+    with wasm_engine.checkout() as instance:
+        if instance.abi.eval_oneshot is None:
+            raise Skipped(f"policy uses the {instance.abi.abi_path} ABI path")
+    return _instance_scenario(args, inputs, evaluate_with_oneshot_api)
+
+
+def run_context(args, inputs):
+    return _instance_scenario(args, inputs, evaluate_with_context_api)
+
+
+def run_engine(args, inputs):
+    return *_timed_calls(lambda item: evaluate_result_set_on_engine(wasm_engine, item), inputs, args.warmup), 1
+
+
+def run_cache_hit(args, inputs):
+    if not decision_cache.enabled:
+        raise Skipped("decision cache disabled")
+    hot = inputs[:args.distinct or 100]
+    for item in hot:
+        opa_eval(item)
+    return *_timed_calls(opa_eval, [hot[i % len(hot)] for i in range(len(inputs))], args.warmup), 1
+
+
+def run_template(args, inputs):
+    if decision_cache.enabled:
+        raise Skipped("decision cache enabled; set OPA_DECISION_CACHE_SIZE=0")
+    skeleton = {key: value for key, value in inputs[0].items() if key != "user"}
+    template = InputTemplate(skeleton, holes=["user"])
+    return *_timed_calls(lambda item: opa_eval_template(template, {"user": item["user"]}), inputs, args.warmup), 1
+
+
+def run_batch(args, inputs):
+    size = args.batch_size
+    batches = [inputs[i:i + size] for i in range(0, len(inputs), size)]
+    with wasm_engine.checkout() as instance:
+        latencies, wall = _timed_calls(
+            lambda batch: evaluate_batch_on_instance(instance, batch), batches, max(1, args.warmup // size)
+        )
+    return latencies, wall, size
+
+
+def run_http(args, inputs):
+    # Imported here so the other scenarios run without the web stack installed
+    import httpx
+    from fastapi import FastAPI
+    from api.routes import router
+
+    app = FastAPI()
+    app.include_router(router)
+    path = f"/v1/data/{args.path}"
+    bodies = [dumps({"input": item}) for item in inputs]
+    headers = {"content-type": "application/json"}
+
+    async def drive():
+        latencies = []
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            for body in bodies[:args.warmup]:
+                await client.post(path, content=body, headers=headers)
+            pending = iter(bodies)
+            began = time.perf_counter()
+
+            async def worker():
+                clock = time.perf_counter_ns
+                for body in pending:
+                    start = clock()
+                    response = await client.post(path, content=body, headers=headers)
+                    latencies.append(clock() - start)
+                    if response.status_code != 200:
+                        raise RuntimeError(f"{path} returned {response.status_code}: {response.text}")
+
+            await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+        return latencies, time.perf_counter() - began
+
+    return *asyncio.run(drive()), 1
+
+
+RUNNERS = {
+    "oneshot": run_oneshot,
+    "context": run_context,
+    "engine": run_engine,
+    "cache_hit": run_cache_hit,
+    "template": run_template,
+    "batch": run_batch,
+    "http": run_http,
+}
+
+
+def run_scenario(name, args, inputs):
+    """Run one scenario and summarize it, or explain why it was skipped"""
+    rss_before = rss_bytes()
+    guest_before = wasm_engine.memory_bytes()
+    try:
+        latencies, wall, decisions_per_call = RUNNERS[name](args, inputs)
+    except Skipped as e:
+        return {"skipped": str(e)}
+    decisions = len(latencies) * decisions_per_call
+    return {
+        "calls": len(latencies),
+        "decisions": decisions,
+        # Timed calls only, so warm-up and setup do not dilute throughput
+        "seconds": wall,
+        "decisions_per_second": decisions / wall if wall else None,
+        "latency_us": latency_summary(latencies),
+        "memory": {
+            "rss_growth_bytes": rss_bytes() - rss_before,
+            "guest_growth_bytes": wasm_engine.memory_bytes() - guest_before,
+        },
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=list(SCENARIOS))
+    parser.add_argument("--iterations", type=int, default=10_000, help="decisions per scenario")
+    parser.add_argument("--warmup", type=int, default=500)
+    parser.add_argument("--shape", choices=SHAPES, default="rbac")
+    parser.add_argument("--input-bytes", type=int, default=0, help="minimum encoded size of each input")
+    parser.add_argument("--distinct", type=int, default=None, help="distinct inputs (default: all)")
+    parser.add_argument("--batch-size", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=1, help="concurrent HTTP clients")
+    parser.add_argument("--path", default=wasm_engine.entrypoint, help="rule evaluated over HTTP")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write the JSON report here instead of stdout")
+    args = parser.parse_args(argv)
+
+    if not wasm_engine.is_initialized():
+        print("OPA WASM module not initialized", file=sys.stderr)
+        return 2
+
+    inputs = generate(args.iterations, args.shape, args.input_bytes, args.distinct, args.seed)
+    report = {
+        "config": vars(args),
+        "environment": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "policy_version": wasm_engine.policy_version,
+            "input_bytes_mean": sum(len(dumps(item)) for item in inputs[:100]) / min(100, len(inputs) or 1),
+        },
+        "scenarios": {},
+    }
+    for name in args.scenarios:
+        report["scenarios"][name] = run_scenario(name, args, inputs)
+        print(f"{name}: done", file=sys.stderr)
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
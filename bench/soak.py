@@ -0,0 +1,84 @@
+"""
+Soak benchmark: evaluate millions of decisions on one instance and show that
+guest memory stays flat because the heap is reset after every evaluation.
+
+Usage:
+    python -m bench.soak --iterations 1000000 --sample-every 10000
+"""
+import argparse
+import json
+import resource
+import sys
+import time
+from wasm_engine import wasm_engine
+from policy_evaluator import evaluate_on_instance
+
+
+def soak_inputs():
+    """A small rotation of inputs with different shapes and sizes"""
+    return [
+        {"user": {"role": "admin"}, "action": "read", "resource": "doc"},
+        {"user": {"role": "user"}, "action": "write", "resource": "doc" * 50},
+        {"user": {}, "action": "read", "resource": "r"},
+        {"user": {"role": "guest", "groups": [f"g{i}" for i in range(100)]}, "action": "delete"},
+    ]
+
+
+def run_soak(iterations, sample_every):
+    """Run the soak loop and return a report with periodic memory samples"""
+    inputs = soak_inputs()
+    samples = []
+
+    with wasm_engine.checkout() as instance:
+        heap_ptr_get = instance.abi.heap_ptr_get
+
+        def sample(iteration):
+            samples.append({
+                "iteration": iteration,
+                "heap_ptr": heap_ptr_get(instance.store),
+                "memory_bytes": instance.memory.data_len(instance.store),
+                "max_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+            })
+
+        start = time.perf_counter()
+        for i in range(iterations):
+            if i % sample_every == 0:
+                sample(i)
+            evaluate_on_instance(instance, inputs[i % len(inputs)])
+        elapsed = time.perf_counter() - start
+        sample(iterations)
+        base_heap_ptr = instance.base_heap_ptr
+
+    # The first sample precedes any evaluation; memory may grow once while warming up
+    steady = samples[1:] or samples
+    flat = (
+        all(s["heap_ptr"] == base_heap_ptr for s in samples)
+        and len({s["memory_bytes"] for s in steady}) == 1
+    )
+    return {
+        "iterations": iterations,
+        "elapsed_seconds": elapsed,
+        "evaluations_per_second": iterations / elapsed if elapsed else None,
+        "base_heap_ptr": base_heap_ptr,
+        "memory_flat": flat,
+        "samples": samples,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=1_000_000)
+    parser.add_argument("--sample-every", type=int, default=10_000)
+    args = parser.parse_args(argv)
+
+    if not wasm_engine.is_initialized():
+        print("OPA WASM module not initialized", file=sys.stderr)
+        return 2
+
+    report = run_soak(args.iterations, args.sample_every)
+    print(json.dumps(report, indent=2))
+    return 0 if report["memory_flat"] else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,39 @@
+"""
+Latency percentiles, throughput and process memory for benchmark reports
+"""
+import os
+import resource
+
+PERCENTILES = (("p50", 0.50), ("p95", 0.95), ("p99", 0.99), ("p999", 0.999))
+
+
+def percentile(ordered, q):
+    """Nearest-rank percentile of an already sorted list"""
+    if not ordered:
+        return None
+    return ordered[min(len(ordered) - 1, max(0, int(q * len(ordered) + 0.5) - 1))]
+
+
+def latency_summary(latencies_ns):
+    """min/mean/max and PERCENTILES of per-call latencies, in microseconds"""
+    ordered = sorted(latencies_ns)
+    if not ordered:
+        return {}
+    summary = {
+        "min": ordered[0] / 1e3,
+        "mean": sum(ordered) / len(ordered) / 1e3,
+        "max": ordered[-1] / 1e3,
+    }
+    for name, q in PERCENTILES:
+        summary[name] = percentile(ordered, q) / 1e3
+    return summary
+
+
+def rss_bytes():
+    """Current resident set size; peak RSS where /proc is unavailable"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        # ru_maxrss is in kilobytes on Linux and bytes on macOS; close enough for growth
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
@@ -5,7 +5,7 @@ OUTPUT_DIR="."
 ENTRYPOINT="authz/allow"
 
 echo "🧹 Removing old artifacts..."
-rm -rf $OUTPUT_DIR/bundle.tar.gz $OUTPUT_DIR/bundle $OUTPUT_DIR/policy.wasm $OUTPUT_DIR/data.json
+rm -rf $OUTPUT_DIR/bundle.tar.gz $OUTPUT_DIR/bundle $OUTPUT_DIR/policy.wasm $OUTPUT_DIR/data.json $OUTPUT_DIR/input_paths.json $OUTPUT_DIR/native_plan.json $OUTPUT_DIR/plan_bundle.tar.gz
 
 echo "🔨 Building OPA policy bundle..."
 opa build -t wasm -e $ENTRYPOINT $POLICY_PATH
@@ -14,8 +14,27 @@ if [ -f bundle.tar.gz ]; then
     echo "📦 Extracting WASM file..."
     mkdir -p $OUTPUT_DIR/bundle
     tar -xzf bundle.tar.gz -C $OUTPUT_DIR/bundle
+    # Written before policy.wasm so the watcher never loads the wasm without its analysis
+    echo "🔍 Recording the input paths the policy reads..."
+    python3 scripts/extract_input_paths.py $OUTPUT_DIR/bundle/policy.wasm $POLICY_PATH \
+        -e $ENTRYPOINT -o $OUTPUT_DIR/input_paths.json
+    # The IR plan lets the service compile simple rules to Python; optional, WASM still serves without it
+    echo "🧬 Building the IR plan for the native fast path..."
+    if opa build -t plan -e $ENTRYPOINT $POLICY_PATH -o $OUTPUT_DIR/plan_bundle.tar.gz; then
+        python3 scripts/bind_plan.py $OUTPUT_DIR/bundle/policy.wasm $OUTPUT_DIR/plan_bundle.tar.gz \
+            -o $OUTPUT_DIR/native_plan.json
+        rm -f $OUTPUT_DIR/plan_bundle.tar.gz
+    else
+        echo "⚠️  opa build -t plan failed; every decision will run in WASM"
+    fi
+    # The service loads data.json into every WASM instance once at startup
+    if [ -f $OUTPUT_DIR/bundle/data.json ]; then
+        mv $OUTPUT_DIR/bundle/data.json $OUTPUT_DIR/data.json
+    else
+        echo "{}" > $OUTPUT_DIR/data.json
+    fi
+    # Last, so a watching service reloads once, with everything above already in place
     mv $OUTPUT_DIR/bundle/policy.wasm $OUTPUT_DIR/policy.wasm
-    echo "{}" > $OUTPUT_DIR/data.json
 else
     echo "❌ bundle.tar.gz not found. Build failed."
     exit 1
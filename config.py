@@ -1,7 +1,171 @@
 # Configuration settings for the OPA WASM application
+import os
 
 # TODO: Load configuration from environment variables
 # FIXME: Add validation for configuration values
 # HACK: Using relative path, should use absolute or configurable path
 # WASM policy file path
 POLICY_WASM_PATH = "policy.wasm"
+
+# Base data document loaded into every instance once; written by build_policy.sh
+POLICY_DATA_PATH = os.getenv("OPA_POLICY_DATA_PATH", "data.json")
+
+# input.* paths each entrypoint reads, written by build_policy.sh; narrows decision cache keys
+POLICY_INPUT_PATHS_PATH = os.getenv("OPA_POLICY_INPUT_PATHS_PATH", "input_paths.json")
+
+# OPA IR plan bound to policy.wasm, written by build_policy.sh; compiled to Python when it fits
+POLICY_NATIVE_PLAN_PATH = os.getenv("OPA_POLICY_NATIVE_PLAN_PATH", "native_plan.json")
+
+# Serve decisions from compiled plans once verified; 0 keeps every evaluation in WASM
+NATIVE_FAST_PATH = os.getenv("OPA_NATIVE_FAST_PATH", "1") != "0"
+
+# Live inputs (plus the load-time probes) a compiled plan must agree with WASM on before it serves
+NATIVE_VERIFY_SAMPLES = int(os.getenv("OPA_NATIVE_VERIFY_SAMPLES", "1000"))
+
+# Largest data.json the compiled plans may load host-side; plans reading bigger documents stay on WASM
+NATIVE_MAX_DATA_BYTES = int(os.getenv("OPA_NATIVE_MAX_DATA_BYTES", str(1024 * 1024)))
+
+# JSON encoder for inputs sent to the guest: "orjson" (bytes straight from C, when installed) or "json"
+JSON_ENCODER = os.getenv("OPA_JSON_ENCODER", "orjson")
+
+# Entrypoint evaluated by default; must match the -e flag in build_policy.sh
+POLICY_ENTRYPOINT = os.getenv("OPA_POLICY_ENTRYPOINT", "authz/allow")
+
+# Number of independent Store+Instance pairs evaluating in parallel
+INSTANCE_POOL_SIZE = int(os.getenv("OPA_INSTANCE_POOL_SIZE", os.cpu_count() or 4))
+
+# Seconds a request waits for a free instance before failing with 503
+INSTANCE_POOL_TIMEOUT = float(os.getenv("OPA_INSTANCE_POOL_TIMEOUT", "2.0"))
+
+# Directory for precompiled modules keyed by policy hash; empty string disables the cache
+MODULE_CACHE_DIR = os.getenv(
+    "OPA_MODULE_CACHE_DIR",
+    os.path.join(os.path.dirname(POLICY_WASM_PATH) or ".", ".wasm-cache"),
+)
+
+# Policy bundle produced by build_policy.sh; watched alongside POLICY_WASM_PATH
+POLICY_BUNDLE_PATH = os.getenv("OPA_POLICY_BUNDLE_PATH", "bundle.tar.gz")
+
+# Seconds between checks for a new policy on disk; 0 disables hot reload
+POLICY_WATCH_INTERVAL = float(os.getenv("OPA_POLICY_WATCH_INTERVAL", "2.0"))
+
+# Seconds to let in-flight evaluations finish on the old policy after a swap
+POLICY_DRAIN_TIMEOUT = float(os.getenv("OPA_POLICY_DRAIN_TIMEOUT", "30.0"))
+
+# Directory of additional policies served by the registry; authz/rbac.wasm serves package authz/rbac
+POLICY_DIR = os.getenv("OPA_POLICY_DIR", "policies")
+
+# Instances per registry policy; kept small since most policies see little traffic
+POLICY_POOL_SIZE = int(os.getenv("OPA_POLICY_POOL_SIZE", "2"))
+
+# Linear memory budget in bytes across registry policies before cold ones are evicted
+POLICY_MEMORY_BUDGET = int(os.getenv("OPA_POLICY_MEMORY_BUDGET", str(512 * 1024 * 1024)))
+
+# Decisions kept in the in-process cache; 0 disables caching
+DECISION_CACHE_SIZE = int(os.getenv("OPA_DECISION_CACHE_SIZE", "10000"))
+
+# Seconds a cached decision stays valid even without a policy reload
+DECISION_CACHE_TTL = float(os.getenv("OPA_DECISION_CACHE_TTL", "300"))
+
+# Largest number of inputs accepted by one POST /v1/batch request
+BATCH_MAX_ITEMS = int(os.getenv("OPA_BATCH_MAX_ITEMS", "100000"))
+
+# Backend for /v1/batch when the request does not pick one: "thread" or "process"
+BATCH_BACKEND = os.getenv("OPA_BATCH_BACKEND", "thread")
+
+# NDJSON lines per chunk handed to the batch evaluator by POST /v1/stream
+STREAM_CHUNK_SIZE = int(os.getenv("OPA_STREAM_CHUNK_SIZE", "1000"))
+
+# Longest single NDJSON input line accepted by POST /v1/stream, in bytes
+STREAM_MAX_LINE_BYTES = int(os.getenv("OPA_STREAM_MAX_LINE_BYTES", str(1024 * 1024)))
+
+# Worker processes for the process backend, each with its own engines
+PROCESS_POOL_WORKERS = int(os.getenv("OPA_PROCESS_POOL_WORKERS", os.cpu_count() or 4))
+
+# Inputs shipped to a worker per task
+PROCESS_POOL_CHUNK_SIZE = int(os.getenv("OPA_PROCESS_POOL_CHUNK_SIZE", "1000"))
+
+# Set by the process backend for its workers, which load their own engines; the default
+# engine singleton then skips loading the policy at import
+PROCESS_POOL_WORKER = os.getenv("OPA_PROCESS_POOL_WORKER", "") == "1"
+
+# Threads running evaluations off the event loop; matches the instance pool by default
+EVAL_WORKERS = int(os.getenv("OPA_EVAL_WORKERS", str(INSTANCE_POOL_SIZE)))
+
+# Evaluations allowed to wait for a worker before requests fail fast with 503
+EVAL_QUEUE_DEPTH = int(os.getenv("OPA_EVAL_QUEUE_DEPTH", "64"))
+
+# Seconds a single decision may run inside the guest before it is interrupted; 0 disables
+EVALUATION_TIMEOUT = float(os.getenv("OPA_EVALUATION_TIMEOUT", "1.0"))
+
+# Per-policy overrides of EVALUATION_TIMEOUT, e.g. "authz/rbac=0.2,reports=5"
+POLICY_TIMEOUTS = {
+    package.strip(): float(seconds)
+    for package, seconds in (
+        item.split("=", 1) for item in os.getenv("OPA_POLICY_TIMEOUTS", "").split(",") if "=" in item
+    )
+}
+
+# Resolution of evaluation deadlines: one engine epoch tick every this many seconds
+EPOCH_TICK_SECONDS = float(os.getenv("OPA_EPOCH_TICK_SECONDS", "0.01"))
+
+# Bytes of linear memory one instance may grow by once its data is loaded; growth past it
+# fails in the guest. 0 disables
+INSTANCE_MEMORY_LIMIT = int(os.getenv("OPA_INSTANCE_MEMORY_LIMIT", str(512 * 1024 * 1024)))
+
+# Instances whose memory grew by more than this many bytes since their data was loaded are
+# replaced in the background. 0 disables
+INSTANCE_MEMORY_HIGH_WATERMARK = int(os.getenv("OPA_INSTANCE_MEMORY_HIGH_WATERMARK", str(128 * 1024 * 1024)))
+
+# Instances are replaced in the background after this many evaluations. 0 disables
+INSTANCE_MAX_EVALUATIONS = int(os.getenv("OPA_INSTANCE_MAX_EVALUATIONS", "1000000"))
+
+# Fraction of decisions traced stage by stage; 0 disables sampling
+TRACE_SAMPLE_RATE = float(os.getenv("OPA_TRACE_SAMPLE_RATE", "0"))
+
+# When > 0, trace every decision and also export those taking at least this many seconds
+TRACE_SLOW_SECONDS = float(os.getenv("OPA_TRACE_SLOW_SECONDS", "0"))
+
+# Where finished traces go: "memory" (GET /debug-traces), "file" (OTLP/JSON lines) or "" for nowhere
+TRACE_EXPORTER = os.getenv("OPA_TRACE_EXPORTER", "")
+
+# File written by the "file" trace exporter
+TRACE_FILE = os.getenv("OPA_TRACE_FILE", "traces.ndjson")
+
+# Traces kept by the "memory" trace exporter
+TRACE_MEMORY_SIZE = int(os.getenv("OPA_TRACE_MEMORY_SIZE", "1000"))
+
+# NDJSON decision log, rotated by size; empty disables decision logging
+DECISION_LOG_PATH = os.getenv("OPA_DECISION_LOG_PATH", "")
+
+# Fraction of decisions written to the decision log
+DECISION_LOG_SAMPLE_RATE = float(os.getenv("OPA_DECISION_LOG_SAMPLE_RATE", "1.0"))
+
+# Records buffered for the background writer; decisions past this are dropped and counted
+DECISION_LOG_BUFFER_SIZE = int(os.getenv("OPA_DECISION_LOG_BUFFER_SIZE", "10000"))
+
+# Records per write, and the longest a record waits in the buffer (seconds)
+DECISION_LOG_BATCH_SIZE = int(os.getenv("OPA_DECISION_LOG_BATCH_SIZE", "500"))
+DECISION_LOG_FLUSH_SECONDS = float(os.getenv("OPA_DECISION_LOG_FLUSH_SECONDS", "1.0"))
+
+# Size at which the decision log rotates, and how many rotated files are kept
+DECISION_LOG_MAX_BYTES = int(os.getenv("OPA_DECISION_LOG_MAX_BYTES", str(64 * 1024 * 1024)))
+DECISION_LOG_BACKUPS = int(os.getenv("OPA_DECISION_LOG_BACKUPS", "5"))
+
+# Include each decision's input in its record
+DECISION_LOG_INPUTS = os.getenv("OPA_DECISION_LOG_INPUTS", "1") != "0"
+
+# Log level of every module, and per-module overrides as "module=LEVEL,module=LEVEL"
+LOG_LEVEL = os.getenv("OPA_LOG_LEVEL", "INFO")
+LOG_LEVELS = {
+    name.strip(): level.strip()
+    for name, level in (
+        item.split("=", 1) for item in os.getenv("OPA_LOG_LEVELS", "").split(",") if "=" in item
+    )
+}
+
+# "json" for one JSON object per line, "text" for plain lines
+LOG_FORMAT = os.getenv("OPA_LOG_FORMAT", "json")
+
+# Log records waiting for the background writer; records past this are dropped
+LOG_QUEUE_SIZE = int(os.getenv("OPA_LOG_QUEUE_SIZE", "10000"))
@@ -0,0 +1,92 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from config import DECISION_CACHE_SIZE, DECISION_CACHE_TTL
+
+# Returned by get() on a miss, since None/False are valid cached decisions
+MISS = object()
+
+
+class DecisionCache:
+    """Bounded LRU + TTL cache of decisions keyed by policy version and input digest"""
+
+    def __init__(self, max_entries=DECISION_CACHE_SIZE, ttl=DECISION_CACHE_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    @property
+    def enabled(self):
+        return self.max_entries > 0
+
+    @staticmethod
+    def key(version, entrypoint, input_bytes):
+        """Fixed-size key over the canonical input bytes, the policy/data version and entrypoint"""
+        digest = hashlib.blake2b(input_bytes, digest_size=16).digest()
+        return (version, entrypoint, digest)
+
+    def get(self, key):
+        """Cached decision for `key`, or MISS"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return MISS
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                self.expirations += 1
+                self.misses += 1
+                return MISS
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        """Store a decision, evicting the least recently used entries beyond the bound"""
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, version):
+        """Drop the entries of one policy version; called when a reload replaces it"""
+        with self._lock:
+            stale = [key for key in self._entries if key[0] == version]
+            for key in stale:
+                del self._entries[key]
+            self.invalidations += len(stale)
+
+    def clear(self):
+        """Drop every entry"""
+        with self._lock:
+            self.invalidations += len(self._entries)
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / lookups if lookups else None,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "invalidations": self.invalidations,
+            }
+
+
+# Create a singleton cache shared by every policy; keys carry the policy version
+decision_cache = DecisionCache()
@@ -0,0 +1,200 @@
+"""
+Decision log: one compact record per decision, written off the hot path
+
+log() appends a tuple to a bounded in-memory buffer and returns; it never
+waits on I/O or on a lock. A background thread drains the buffer in batches,
+turns them into NDJSON lines and hands each batch to a sink. When the buffer
+is full the new record is dropped and counted rather than blocking the
+decision, and OPA_DECISION_LOG_SAMPLE_RATE keeps only a fraction of them.
+
+Records carry the input as the JSON bytes the evaluator already encoded, so
+logging an input costs nothing on the request path; they are spliced into the
+line verbatim by the flusher. Inputs that were never encoded (batches,
+templates) are kept as values and encoded by the flusher.
+
+The default sink appends to OPA_DECISION_LOG_PATH and rotates it like
+logging.handlers.RotatingFileHandler (path.1 ... path.N). Anything with a
+`write(lines)` method taking a list of bytes lines can be used instead.
+"""
+import os
+import random
+import threading
+import time
+from collections import deque
+from logger import get_logger
+from json_codec import dumps
+from metrics import Counter
+from config import (
+    DECISION_LOG_PATH, DECISION_LOG_SAMPLE_RATE, DECISION_LOG_BUFFER_SIZE, DECISION_LOG_BATCH_SIZE,
+    DECISION_LOG_FLUSH_SECONDS, DECISION_LOG_MAX_BYTES, DECISION_LOG_BACKUPS, DECISION_LOG_INPUTS,
+)
+
+logger = get_logger(__name__)
+
+
+class RotatingFileSink:
+    """Appends NDJSON batches to a file, rotating it once it passes max_bytes"""
+
+    def __init__(self, path, max_bytes=DECISION_LOG_MAX_BYTES, backups=DECISION_LOG_BACKUPS):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self._file = open(path, "ab")
+        self._size = self._file.tell()
+
+    def write(self, lines):
+        data = b"".join(lines)
+        if self.max_bytes > 0 and self._size and self._size + len(data) > self.max_bytes:
+            self._rotate()
+        self._file.write(data)
+        self._file.flush()
+        self._size += len(data)
+
+    def _rotate(self):
+        self._file.close()
+        if self.backups > 0:
+            for index in range(self.backups - 1, 0, -1):
+                source = f"{self.path}.{index}"
+                if os.path.exists(source):
+                    os.replace(source, f"{self.path}.{index + 1}")
+            os.replace(self.path, f"{self.path}.1")
+        self._file = open(self.path, "wb")
+        self._size = 0
+
+    def close(self):
+        self._file.close()
+
+
+def _line(record):
+    """One NDJSON line from a buffered record tuple"""
+    timestamp, path, outcome, result, seconds, version, input_data = record
+    line = dumps({
+        "timestamp": round(timestamp, 6),
+        "path": path,
+        "outcome": outcome,
+        "result": result,
+        "duration_us": round(seconds * 1e6, 1),
+        "policy_version": version,
+    })
+    if input_data is None:
+        return line + b"\n"
+    if not isinstance(input_data, (bytes, bytearray, memoryview)):
+        input_data = dumps(input_data)
+    # Splice the already encoded input in rather than decoding and re-encoding it
+    return line[:-1] + b',"input":' + bytes(input_data) + b"}\n"
+
+
+class DecisionLogger:
+    """Bounded buffer of decision records drained in batches by a background thread"""
+
+    def __init__(self, sink=None, buffer_size=DECISION_LOG_BUFFER_SIZE, batch_size=DECISION_LOG_BATCH_SIZE,
+                 flush_seconds=DECISION_LOG_FLUSH_SECONDS, sample_rate=DECISION_LOG_SAMPLE_RATE,
+                 include_inputs=DECISION_LOG_INPUTS):
+        self.buffer_size = buffer_size
+        self.batch_size = batch_size
+        self.flush_seconds = flush_seconds
+        self.sample_rate = sample_rate
+        self.include_inputs = include_inputs
+        self.sink = None
+        self.enabled = False
+        self._buffer = deque()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        # Counted from every request thread
+        self.logged = Counter()
+        self.dropped = Counter()
+        self.sampled_out = Counter()
+        # Only the background thread updates these
+        self.written = 0
+        self.batches = 0
+        self.sink_errors = 0
+        if sink is not None:
+            self.start(sink)
+
+    def start(self, sink):
+        """Begin draining to `sink` on a background thread"""
+        self.sink = sink
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="decision-log", daemon=True)
+        self._thread.start()
+        self.enabled = True
+
+    def log(self, path, outcome, result, seconds, version=None, input_data=None):
+        """Queue one decision; never blocks, drops the record when the buffer is full
+
+        `input_data` is the input as JSON bytes, or as a value the flusher
+        encodes; values are not copied, so they must not change afterwards.
+        """
+        if not self.enabled:
+            return
+        if self.sample_rate < 1 and random.random() >= self.sample_rate:
+            self.sampled_out.inc()
+            return
+        buffer = self._buffer
+        if len(buffer) >= self.buffer_size:
+            self.dropped.inc()
+            return
+        buffer.append((time.time(), path, outcome, result, seconds, version,
+                       input_data if self.include_inputs else None))
+        self.logged.inc()
+        if len(buffer) == self.batch_size:
+            self._wake.set()
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._wake.wait(self.flush_seconds)
+            self._wake.clear()
+            self._drain()
+        self._drain()
+
+    def _drain(self):
+        buffer = self._buffer
+        while buffer:
+            batch = []
+            try:
+                for _ in range(self.batch_size):
+                    batch.append(buffer.popleft())
+            except IndexError:
+                pass
+            try:
+                self.sink.write([_line(record) for record in batch])
+                self.written += len(batch)
+                self.batches += 1
+            except Exception as e:
+                self.sink_errors += 1
+                self.dropped.inc(len(batch))
+                logger.error(f"Decision log sink failed, dropped {len(batch)} records: {e}")
+
+    def shutdown(self):
+        """Flush what is buffered and stop the background thread"""
+        if self._thread is None:
+            return
+        self.enabled = False
+        self._stop.set()
+        self._wake.set()
+        self._thread.join()
+        self._thread = None
+        close = getattr(self.sink, "close", None)
+        if close is not None:
+            close()
+
+    def stats(self):
+        return {
+            "enabled": self.enabled,
+            "sample_rate": self.sample_rate,
+            "buffered": len(self._buffer),
+            "buffer_size": self.buffer_size,
+            "logged": self.logged.value(),
+            "dropped": self.dropped.value(),
+            "sampled_out": self.sampled_out.value(),
+            "written": self.written,
+            "batches": self.batches,
+            "sink_errors": self.sink_errors,
+        }
+
+
+# Create a singleton decision logger; disabled unless OPA_DECISION_LOG_PATH is set
+decision_logger = DecisionLogger()
+if DECISION_LOG_PATH:
+    decision_logger.start(RotatingFileSink(DECISION_LOG_PATH))
@@ -0,0 +1,146 @@
+"""
+Evaluation on one checked-out PolicyInstance, through whichever ABI path the
+module was resolved to at load
+
+Kept apart from policy_evaluator, which serves decisions from the engines,
+so the engine itself can evaluate on its instances (native plan probes at
+load) without importing the module that imports it.
+"""
+import json
+import time
+from logger import get_logger
+from guest_memory import read_json, cstring_at
+from opa_abi import ABI_ONESHOT, FORMAT_JSON
+from json_codec import dumps
+from metrics import stage_seconds
+import tracing
+
+logger = get_logger(__name__)
+
+
+class EntrypointNotFoundError(KeyError):
+    """Raised when the policy has no entrypoint by the requested name (or no default)"""
+
+
+def _entrypoint_id(abi, entrypoint):
+    if entrypoint is None:
+        entrypoint_id = abi.default_entrypoint
+        if entrypoint_id is None:
+            raise EntrypointNotFoundError("No entrypoint given and the policy has no default")
+        return entrypoint_id
+    try:
+        return abi.entrypoints[entrypoint]
+    except KeyError:
+        raise EntrypointNotFoundError(entrypoint) from None
+
+def evaluate_result_set(instance, input_data, entrypoint=None, input_bytes=None):
+    """Full OPA result set from a checked-out instance, via the ABI path chosen at load"""
+    if input_bytes is None:
+        start = time.perf_counter()
+        input_bytes = dumps(input_data)
+        encoded = time.perf_counter()
+        stage_seconds["encode"].observe(encoded - start)
+        tracing.record("encode", start, encoded, bytes=len(input_bytes))
+    abi = instance.abi
+    entrypoint_id = _entrypoint_id(abi, entrypoint)
+    # The deadline covers this evaluation, however long the instance has been checked out
+    instance.begin_evaluation()
+    if abi.abi_path == ABI_ONESHOT:
+        return evaluate_with_oneshot_api(instance, input_bytes, entrypoint_id)
+    return evaluate_with_context_api(instance, input_bytes, entrypoint_id)
+
+def evaluate_with_oneshot_api(instance, input_bytes, entrypoint_id):
+    """Evaluate with the single-call opa_eval export (ABI 1.2+)"""
+    try:
+        store = instance.store
+        abi = instance.abi
+        
+        try:
+            # The input goes straight above the heap snapshot and opa_eval
+            # allocates after it, so nothing needs malloc or free
+            started = time.perf_counter()
+            input_addr = instance.base_heap_ptr
+            heap_ptr = instance.write_input(input_bytes, input_addr)
+            written = time.perf_counter()
+            
+            result_addr = abi.eval_oneshot(
+                store, 0, entrypoint_id, instance.data_addr,
+                input_addr, len(input_bytes), heap_ptr, FORMAT_JSON,
+            )
+            evaluated = time.perf_counter()
+            result_set = json.loads(cstring_at(instance.view(), result_addr))
+            _record_stages(started, written, evaluated)
+            return result_set
+        
+        finally:
+            instance.reset_heap()
+    
+    except Exception as e:
+        logger.error(f"Error in one-shot API evaluation: {e}")
+        raise
+
+def evaluate_with_context_api(instance, input_bytes, entrypoint_id):
+    """Evaluate using the full OPA context API"""
+    try:
+        store = instance.store
+        abi = instance.abi
+        
+        # The input buffer, parsed input, context and result all live above the
+        # heap snapshot and are released together by the reset in `finally`
+        try:
+            # The input goes first, at the snapshot, so nothing allocated yet can be overwritten;
+            # parse_input moves the heap past it before the context is allocated
+            started = time.perf_counter()
+            input_addr = instance.base_heap_ptr
+            trace = tracing.current()
+            if trace is None:
+                input_value = instance.parse_input(input_bytes, input_addr)
+            else:
+                input_value = _parse_input_traced(instance, input_bytes, input_addr, trace)
+            written = time.perf_counter()
+            
+            # Create evaluation context
+            ctx = abi.eval_ctx_new(store)
+            if not ctx:
+                raise RuntimeError("Failed to create evaluation context")
+            
+            # Set input, data and entrypoint, then evaluate
+            abi.eval_ctx_set_input(store, ctx, input_value)
+            abi.eval_ctx_set_data(store, ctx, instance.data_addr)
+            abi.eval_ctx_set_entrypoint(store, ctx, entrypoint_id)
+            abi.eval_ctx(store, ctx)
+            evaluated = time.perf_counter()
+            
+            # Get result
+            result_addr = abi.eval_ctx_get_result(store, ctx)
+            
+            # Dump the result set to JSON in the guest and read exactly that string
+            result_set = read_json(instance, result_addr) if result_addr else []
+            _record_stages(started, written, evaluated)
+            return result_set
+        
+        finally:
+            instance.reset_heap()
+    
+    except Exception as e:
+        logger.error(f"Error in context API evaluation: {e}")
+        raise
+
+def _record_stages(started, written, evaluated):
+    """Observe the write, eval and decode stages of one guest round trip ending now"""
+    decoded = time.perf_counter()
+    stage_seconds["write"].observe(written - started)
+    stage_seconds["eval"].observe(evaluated - written)
+    stage_seconds["decode"].observe(decoded - evaluated)
+    trace = tracing.current()
+    if trace is not None:
+        trace.add("write", started, written)
+        trace.add("eval", written, evaluated)
+        trace.add("decode", evaluated, decoded)
+
+def _parse_input_traced(instance, raw, addr, trace):
+    """PolicyInstance.parse_input recorded as a span"""
+    start = time.perf_counter()
+    value_addr = instance.parse_input(raw, addr)
+    trace.add("parse_input", start, time.perf_counter(), {"bytes": len(raw)})
+    return value_addr
@@ -0,0 +1,86 @@
+import json
+import os
+
+# Bytes copied per read when streaming files into guest memory
+_FILE_CHUNK = 1 << 20
+
+# First read window when scanning for a string terminator; doubles until found
+_CSTRING_CHUNK = 128
+
+
+def memory_view(memory, store):
+    """Zero-copy writable memoryview over the instance's whole linear memory"""
+    # Must be re-taken after anything that can grow memory, since the buffer may move
+    return memoryview(memory.get_buffer_ptr(store)).cast("B")
+
+
+def read_cstring(memory, store, addr):
+    """Return the exact bytes of the NUL-terminated string at `addr`"""
+    return cstring_at(memory_view(memory, store), addr)
+
+
+def cstring_at(view, addr):
+    """read_cstring over an already taken memory view"""
+    size = len(view)
+    if not 0 < addr < size:
+        raise ValueError(f"String address {addr} outside linear memory of {size} bytes")
+
+    start = addr
+    chunk = _CSTRING_CHUNK
+    parts = []
+    while start < size:
+        end = min(start + chunk, size)
+        block = view[start:end].tobytes()
+        nul = block.find(b"\0")
+        if nul >= 0:
+            parts.append(block[:nul])
+            return parts[0] if len(parts) == 1 else b"".join(parts)
+        parts.append(block)
+        start = end
+        chunk *= 2
+    raise ValueError(f"Unterminated string at address {addr}")
+
+
+def read_json(instance, value_addr):
+    """Serialize an OPA value with opa_json_dump and decode it on the host"""
+    store = instance.store
+    json_addr = instance.abi.json_dump(store, value_addr)
+    if not json_addr:
+        raise RuntimeError("opa_json_dump failed")
+    return json.loads(read_cstring(instance.memory, store, json_addr))
+
+
+WASM_PAGE_SIZE = 65536
+
+
+def ensure_capacity(memory, store, end):
+    """Grow linear memory so that addresses below `end` are valid"""
+    size = memory.data_len(store)
+    if end > size:
+        memory.grow(store, (end - size + WASM_PAGE_SIZE - 1) // WASM_PAGE_SIZE)
+
+
+def write_at(view, addr, data):
+    """Copy bytes-like `data` into a memory view at `addr` with a single memmove"""
+    end = addr + len(data)
+    if end > len(view):
+        raise ValueError(f"{len(data)} bytes at address {addr} overrun linear memory of {len(view)} bytes")
+    view[addr:end] = data
+    return end
+
+
+def stream_file(memory, store, addr, path):
+    """Read a file straight into guest memory at `addr` without a host-side copy of it"""
+    size = os.path.getsize(path)
+    view = memory_view(memory, store)
+    if addr + size > len(view):
+        raise ValueError(f"{path} ({size} bytes) does not fit at address {addr}")
+    with open(path, "rb") as f:
+        offset = 0
+        while offset < size:
+            end = min(size, offset + _FILE_CHUNK)
+            read = f.readinto(view[addr + offset:addr + end])
+            if not read:
+                raise IOError(f"{path} shrank while being loaded")
+            offset += read
+    return size
@@ -0,0 +1,59 @@
+import json
+import os
+from logger import get_logger
+
+logger = get_logger(__name__)
+
+# Trie node marking "keep the whole subtree from here"
+_WHOLE = None
+
+
+def build_trie(paths):
+    """Merge input paths such as [["user", "role"]] into a nested dict of keys to keep"""
+    trie = {}
+    for path in paths:
+        node = trie
+        for i, segment in enumerate(path):
+            if i == len(path) - 1:
+                # A shorter path already keeps everything below it
+                node[segment] = _WHOLE
+                break
+            child = node.get(segment, {})
+            if child is _WHOLE:
+                break
+            node = node.setdefault(segment, child)
+    return trie
+
+
+def project(value, trie):
+    """Copy of `value` holding only the subtrees the policy can read"""
+    if trie is _WHOLE or not isinstance(value, dict):
+        # Non-objects (arrays, scalars) on a referenced path are kept whole
+        return value
+    return {key: project(value[key], sub) for key, sub in trie.items() if key in value}
+
+
+def load_input_paths(path, wasm_sha256):
+    """Per-entrypoint projection tries from the file written by extract_input_paths.py
+
+    Returns {} (no projection) when the file is missing, unreadable or was
+    generated for a different policy.wasm, so a stale analysis can never make
+    two different decisions share a cache entry.
+    """
+    if not path or not os.path.exists(path):
+        return {}
+    try:
+        with open(path) as f:
+            doc = json.load(f)
+    except (OSError, ValueError) as e:
+        logger.warning(f"Ignoring unreadable input paths file {path}: {e}")
+        return {}
+    if doc.get("wasm_sha256") != wasm_sha256:
+        logger.warning(f"Ignoring {path}: generated for a different policy.wasm")
+        return {}
+    # A null entry means the entrypoint reads the input as a whole
+    return {
+        entrypoint: build_trie(paths)
+        for entrypoint, paths in doc.get("entrypoints", {}).items()
+        if paths is not None
+    }
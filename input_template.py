@@ -0,0 +1,106 @@
+"""
+Input templates: a constant skeleton parsed into each instance's guest heap
+once, with only the leaves that vary per decision (holes) patched in
+
+Each instance parses the skeleton the first time it evaluates the template
+and raises its heap snapshot above it, so the skeleton survives every reset.
+Every hole is present in that copy (with its default from the skeleton, or
+null), and the path arrays are parsed there too. A decision then parses only
+the hole values, swaps them in with opa_value_add_path and swaps the defaults
+back afterwards. Replacing the value of an existing key allocates nothing in
+the guest, so the skeleton never points at memory the reset releases.
+
+Holes are paths of object keys, given as tuples or dotted strings:
+
+    RESOURCE_INPUT = InputTemplate({"action": "read", "resource": "doc"}, holes=["user"])
+    opa_eval_template(RESOURCE_INPUT, {"user": {"role": "admin"}})
+"""
+import copy
+import hashlib
+from json_codec import canonical_dumps, dumps
+
+# Holes without a default in the skeleton hold this until patched
+_REQUIRED = object()
+
+
+def _path(hole):
+    path = tuple(hole.split(".")) if isinstance(hole, str) else tuple(hole)
+    if not path or not all(isinstance(key, str) and key for key in path):
+        raise ValueError(f"Template hole {hole!r} must be a non-empty path of object keys")
+    return path
+
+
+class InputTemplate:
+    """A constant input skeleton and the object paths that vary per decision"""
+
+    def __init__(self, skeleton, holes):
+        if not isinstance(skeleton, dict):
+            raise ValueError("Template skeleton must be a JSON object")
+        self.holes = tuple(_path(hole) for hole in holes)
+        for path in self.holes:
+            for other in self.holes:
+                if path != other and other[:len(path)] == path:
+                    raise ValueError(f"Template hole {'.'.join(other)} is inside hole {'.'.join(path)}")
+        self._index = {path: index for index, path in enumerate(self.holes)}
+        if len(self._index) != len(self.holes):
+            raise ValueError("Template holes must be distinct")
+
+        self.skeleton = copy.deepcopy(skeleton)
+        self.defaults = []
+        # The skeleton without its holes, with every parent object along a hole's path
+        base = copy.deepcopy(skeleton)
+        for path in self.holes:
+            parent = base
+            for key in path[:-1]:
+                parent = parent.setdefault(key, {})
+                if not isinstance(parent, dict):
+                    raise ValueError(f"Template hole {'.'.join(path)} crosses a non-object at '{key}'")
+            self.defaults.append(parent.pop(path[-1], _REQUIRED))
+        self.base_bytes = canonical_dumps(base)
+        # Encoded once; placed in the guest next to the skeleton
+        self.path_bytes = [dumps(list(path)) for path in self.holes]
+        self.default_bytes = [b"null" if value is _REQUIRED else dumps(value) for value in self.defaults]
+        # Identifies the template in decision cache keys and in each instance's slots
+        self.fingerprint = hashlib.blake2b(canonical_dumps([skeleton, self.holes]), digest_size=16).digest()
+
+    def patches(self, values):
+        """(hole index, value) for every hole set in `values`, keyed like the holes
+
+        Raises ValueError for keys that are not holes and for holes that have
+        no default in the skeleton and are missing from `values`.
+        """
+        patches = []
+        for hole, value in values.items():
+            index = self._index.get(_path(hole))
+            if index is None:
+                raise ValueError(f"'{hole}' is not a hole of this template")
+            patches.append((index, value))
+        if len(patches) < len(self.holes):
+            given = {index for index, _ in patches}
+            missing = [
+                ".".join(path) for index, path in enumerate(self.holes)
+                if index not in given and self.defaults[index] is _REQUIRED
+            ]
+            if missing:
+                raise ValueError(f"Template holes without a default need a value: {', '.join(missing)}")
+        return sorted(patches, key=lambda patch: patch[0])
+
+    def render(self, values):
+        """The complete input document on the host, for paths that cannot patch in place
+
+        Only the objects along each hole's path are copied; everything else is
+        shared with the skeleton, so treat the result as read-only.
+        """
+        document = dict(self.skeleton)
+        for index, value in self.patches(values):
+            parent = document
+            for key in self.holes[index][:-1]:
+                child = parent.get(key)
+                parent[key] = child = dict(child) if isinstance(child, dict) else {}
+                parent = child
+            parent[self.holes[index][-1]] = value
+        return document
+
+    def cache_input(self, patches):
+        """Bytes that identify the rendered input, for the decision cache key"""
+        return self.fingerprint + canonical_dumps(patches)
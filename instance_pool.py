@@ -0,0 +1,224 @@
+import queue
+import threading
+import time
+from contextlib import contextmanager
+from logger import get_logger
+
+logger = get_logger(__name__)
+
+
+# Queued after a drain completes to wake checkouts still blocked on the old pool
+_CLOSED = object()
+
+
+class PoolTimeoutError(RuntimeError):
+    """Raised when no instance becomes available within the pool wait bound"""
+
+
+class PoolClosedError(RuntimeError):
+    """Raised when checking out from a pool that is draining after a policy swap"""
+
+
+class InstancePool:
+    """Fixed-size pool of pre-instantiated WASM instances with checkout/return semantics"""
+
+    def __init__(self, factory, size, timeout):
+        if size < 1:
+            raise ValueError(f"Instance pool size must be at least 1, got {size}")
+        self.factory = factory
+        self.size = size
+        self.timeout = timeout
+        # LIFO so the most recently used (cache-warm) instance is handed out first
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._closed = False
+        self._checkouts = 0
+        self._waits = 0
+        self._timeouts = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+        # Replacements by reason ("trap", "memory", "evaluations")
+        self._recycled = {}
+        # Worn instances whose replacement is being built; they keep serving meanwhile
+        self._replacing = set()
+        # Replaced instances, dropped instead of handed out when they next surface
+        self._retired = set()
+
+        # Every instance the pool owns, idle or checked out
+        self._instances = [factory() for _ in range(size)]
+        for item in self._instances:
+            self._idle.put(item)
+
+    def acquire(self, timeout=None):
+        """Check out an idle instance, waiting at most `timeout` seconds"""
+        if self._closed:
+            raise PoolClosedError("Instance pool is closed")
+        try:
+            item = self._get(block=False)
+            self._check_open(item)
+            with self._lock:
+                self._checkouts += 1
+            return item
+        except queue.Empty:
+            pass
+
+        wait = self.timeout if timeout is None else timeout
+        start = time.perf_counter()
+        try:
+            item = self._get(timeout=wait)
+        except queue.Empty:
+            with self._lock:
+                self._timeouts += 1
+            logger.warning(f"Instance pool exhausted: no instance free after {wait}s")
+            raise PoolTimeoutError(f"No WASM instance available within {wait}s")
+        self._check_open(item)
+
+        waited = time.perf_counter() - start
+        with self._lock:
+            self._checkouts += 1
+            self._waits += 1
+            self._wait_total += waited
+            if waited > self._wait_max:
+                self._wait_max = waited
+        return item
+
+    def _get(self, block=True, timeout=None):
+        """Next idle item, skipping retired instances"""
+        while True:
+            item = self._idle.get(block, timeout)
+            if not self._retired:
+                return item
+            with self._lock:
+                if item not in self._retired:
+                    return item
+                self._retired.discard(item)
+
+    def _check_open(self, item):
+        # A pool closed while we waited hands the item back for the drain or the next waiter
+        if self._closed or item is _CLOSED:
+            self._idle.put(item)
+            raise PoolClosedError("Instance pool is closed")
+
+    def release(self, item):
+        """Return a checked-out instance to the pool"""
+        if self._retired:
+            with self._lock:
+                if item in self._retired:
+                    self._retired.discard(item)
+                    return
+        self._idle.put(item)
+
+    def discard(self, item, reason="trap"):
+        """Drop a checked-out instance that must not be reused and build its replacement
+
+        The replacement is created on a background thread so the caller's request
+        does not pay for instantiation; until then the pool runs one short.
+        """
+        with self._lock:
+            if item in self._retired:
+                # Already replaced by a recycle; just make sure it is never handed out
+                self._retired.discard(item)
+                return
+            self._instances.remove(item)
+            self._replacing.discard(item)
+            self._count_recycle(reason)
+        self._start_replacement(None, reason)
+
+    def recycle(self, item, reason):
+        """Replace a worn but healthy instance in the background without losing capacity
+
+        The old instance keeps serving until its replacement is idle in the pool,
+        then it is dropped the next time it is released or handed out.
+        """
+        with self._lock:
+            if self._closed or item in self._replacing or item not in self._instances:
+                return
+            self._replacing.add(item)
+        self._start_replacement(item, reason)
+
+    def _start_replacement(self, old, reason):
+        threading.Thread(
+            target=self._replace, args=(old, reason), name="pool-replace", daemon=True
+        ).start()
+
+    def _replace(self, old, reason):
+        try:
+            item = self.factory()
+        except Exception as e:
+            with self._lock:
+                self._replacing.discard(old)
+            if old is None:
+                logger.error(f"❌ Failed to replace a discarded instance; pool is one short: {e}")
+            else:
+                logger.error(f"❌ Failed to recycle an instance ({reason}); keeping it: {e}")
+            return
+        with self._lock:
+            if old is not None:
+                if old not in self._instances:
+                    # Discarded after a trap while its replacement was being built
+                    self._replacing.discard(old)
+                    return
+                self._replacing.discard(old)
+                self._instances.remove(old)
+                self._retired.add(old)
+                self._count_recycle(reason)
+            self._instances.append(item)
+        self._idle.put(item)
+        logger.info(f"♻️ Recycled a pool instance ({reason})")
+
+    def _count_recycle(self, reason):
+        self._recycled[reason] = self._recycled.get(reason, 0) + 1
+
+    @contextmanager
+    def checkout(self, timeout=None):
+        """Context manager that acquires an instance and always returns it"""
+        item = self.acquire(timeout)
+        try:
+            yield item
+        finally:
+            self.release(item)
+
+    def drain(self, timeout):
+        """Close the pool and wait up to `timeout` seconds for in-flight checkouts to return
+
+        Returns the number of instances still checked out when the wait ended.
+        """
+        self._closed = True
+        deadline = time.monotonic() + timeout
+        collected = 0
+        while collected < self.size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                self._get(timeout=remaining)
+                collected += 1
+            except queue.Empty:
+                break
+        self._idle.put(_CLOSED)
+        outstanding = self.size - collected
+        if outstanding:
+            logger.warning(f"Instance pool drain timed out with {outstanding} instances in use")
+        return outstanding
+
+    def instances(self):
+        """Snapshot of every instance owned by the pool"""
+        return list(self._instances)
+
+    def stats(self):
+        """Pool occupancy and wait metrics"""
+        with self._lock:
+            # Retired instances may sit in the idle queue until they are skipped
+            idle = min(self._idle.qsize(), self.size)
+            return {
+                "size": self.size,
+                "idle": idle,
+                "in_use": self.size - idle,
+                "checkouts": self._checkouts,
+                "waits": self._waits,
+                "timeouts": self._timeouts,
+                "wait_seconds_total": self._wait_total,
+                "wait_seconds_max": self._wait_max,
+                "recycled": sum(self._recycled.values()),
+                "recycled_by_reason": dict(self._recycled),
+            }
@@ -0,0 +1,32 @@
+import json
+from config import JSON_ENCODER
+
+# Optional: orjson encodes straight to bytes several times faster than json
+orjson = None
+if JSON_ENCODER == "orjson":
+    try:
+        import orjson
+    except ImportError:
+        pass
+
+
+def canonical_dumps(value):
+    """Compact UTF-8 JSON with sorted keys, so equal documents give equal bytes"""
+    if orjson is not None:
+        try:
+            return orjson.dumps(value, option=orjson.OPT_SORT_KEYS)
+        except TypeError:
+            # Non-string keys or out-of-range integers; the stdlib handles both
+            pass
+    return json.dumps(value, sort_keys=True, separators=(",", ":")).encode("utf-8")
+
+
+def dumps(value):
+    """Compact UTF-8 JSON without key sorting, for inputs that are not used as cache keys"""
+    if orjson is not None:
+        try:
+            return orjson.dumps(value)
+        except TypeError:
+            pass
+    return json.dumps(value, separators=(",", ":")).encode("utf-8")
+
@@ -1,12 +1,101 @@
+"""
+Application logging: records are queued by the calling thread and formatted
+and written by a background listener, so a request never waits on stderr
+
+Levels come from OPA_LOG_LEVEL, with per-module overrides in OPA_LOG_LEVELS
+("policy_evaluator=DEBUG,wasm_engine=WARNING"); modules log through
+get_logger(__name__). OPA_LOG_FORMAT=json (the default) writes one JSON
+object per line, "text" the usual human-readable lines.
+
+Only the message is resolved on the calling thread (so mutable arguments are
+captured as they were); timestamps, JSON encoding and I/O happen on the
+listener. Records arriving while the queue is full are dropped and counted.
+Debug logging on hot paths is guarded with logger.isEnabledFor(DEBUG), so a
+disabled level costs no formatting at all.
+"""
+import atexit
 import logging
+import queue
+import sys
+from logging.handlers import QueueHandler, QueueListener
+from config import LOG_LEVEL, LOG_LEVELS, LOG_FORMAT, LOG_QUEUE_SIZE
+from json_codec import dumps
+
+_TEXT_FORMAT = "%(asctime)s %(levelname)s %(name)s: %(message)s"
+
+
+class JsonFormatter(logging.Formatter):
+    """One compact JSON object per record"""
+
+    def format(self, record):
+        entry = {
+            "ts": round(record.created, 6),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry["exc"] = record.exc_text
+        return dumps(entry).decode("utf-8")
+
+
+class _DroppingQueueHandler(QueueHandler):
+    """QueueHandler that defers formatting to the listener and drops records when the queue is full"""
+
+    dropped = 0
+
+    def prepare(self, record):
+        # Freeze the message now; everything else is formatted by the listener
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            # Under the GIL a lost update only undercounts
+            _DroppingQueueHandler.dropped += 1
+
+
+def _level(name):
+    level = logging.getLevelName(name.strip().upper())
+    if not isinstance(level, int):
+        raise ValueError(f"Unknown log level '{name}'")
+    return level
+
 
-# TODO: Add structured logging with JSON format
-# FIXME: Log level should be configurable via environment variable
 def setup_logger():
-    """Configure and return the application logger"""
-    # HACK: Basic logging setup, needs proper formatter and handlers
-    logging.basicConfig(level=logging.INFO)
-    logger = logging.getLogger(__name__)
-    return logger
+    """Route the root logger through a queue to a background stderr writer; returns the listener"""
+    stream = logging.StreamHandler(sys.stderr)
+    stream.setFormatter(JsonFormatter() if LOG_FORMAT == "json" else logging.Formatter(_TEXT_FORMAT))
+    log_queue = queue.Queue(LOG_QUEUE_SIZE)
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(_DroppingQueueHandler(log_queue))
+    root.setLevel(_level(LOG_LEVEL))
+    for name, level in LOG_LEVELS.items():
+        logging.getLogger(name).setLevel(_level(level))
+    listener = QueueListener(log_queue, stream, respect_handler_level=True)
+    listener.start()
+    # Flushes whatever is still queued when the interpreter exits
+    atexit.register(listener.stop)
+    return listener
+
+
+def get_logger(name):
+    """Logger for a module, honouring its OPA_LOG_LEVELS override"""
+    return logging.getLogger(name)
+
+
+def dropped_records():
+    """Log records discarded because the queue was full"""
+    return _DroppingQueueHandler.dropped
+
 
-logger = setup_logger()
+listener = setup_logger()
+# Shared application logger, for code that has no module of its own
+logger = get_logger("opa")
@@ -1,7 +1,14 @@
 from fastapi import FastAPI
 from api.routes import router
-from logger import logger
+from logger import get_logger
 from wasm_engine import wasm_engine
+from policy_watcher import PolicyWatcher
+from process_pool import process_backend
+from async_evaluator import async_evaluator
+from tracing import tracer
+from decision_log import decision_logger
+
+logger = get_logger(__name__)
 
 # TODO: Add API versioning support
 # FIXME: Need to add proper CORS configuration for production
@@ -11,6 +18,24 @@ app = FastAPI()
 # Include API routes
 app.include_router(router)
 
+# Reloads policy.wasm / bundle.tar.gz in the background when they change
+policy_watcher = PolicyWatcher(wasm_engine)
+
+@app.middleware("http")
+async def add_policy_version(request, call_next):
+    """Tag every response with the policy version serving it, to verify rollouts
+
+    Decision routes record the version that actually decided in
+    request.state.policy_version; other responses carry the default policy's
+    version as of when the request arrived.
+    """
+    default_version = wasm_engine.policy_version
+    response = await call_next(request)
+    version = getattr(request.state, "policy_version", default_version)
+    if version:
+        response.headers["X-Policy-Version"] = version
+    return response
+
 # Startup event
 @app.on_event("startup")
 async def startup_event():
@@ -22,10 +47,17 @@ async def startup_event():
         # FIXME: Should raise exception or exit if WASM engine fails
         logger.warning("OPA WASM engine failed to initialize")
 
+    policy_watcher.start()
+
 # Shutdown event
 @app.on_event("shutdown")
 async def shutdown_event():
     logger.info("Shutting down OPA WASM API application")
+    policy_watcher.stop()
+    process_backend.shutdown()
+    async_evaluator.shutdown()
+    tracer.shutdown()
+    decision_logger.shutdown()
 
 if __name__ == "__main__":
     import uvicorn
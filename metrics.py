@@ -0,0 +1,111 @@
+import bisect
+import threading
+
+# Upper bounds in seconds, from cache hits up to pathological evaluations
+LATENCY_BUCKETS = (
+    0.00001, 0.000025, 0.00005,
+    0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01,
+    0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0,
+)
+
+
+class _Sharded:
+    """Per-thread slots so the hot path never takes a lock
+
+    Each thread writes only its own list; readers sum every shard. A read may
+    miss an update in flight, which is fine for monitoring.
+    """
+
+    def __init__(self, width):
+        self._width = width
+        self._local = threading.local()
+        self._shards = []
+        # Only taken the first time a thread records something
+        self._lock = threading.Lock()
+
+    def _shard(self):
+        try:
+            return self._local.shard
+        except AttributeError:
+            shard = [0] * self._width
+            with self._lock:
+                self._shards.append(shard)
+            self._local.shard = shard
+            return shard
+
+    def _merged(self):
+        with self._lock:
+            shards = list(self._shards)
+        totals = [0] * self._width
+        for shard in shards:
+            for i, value in enumerate(shard):
+                totals[i] += value
+        return totals
+
+
+class Counter(_Sharded):
+    """Monotonic counter"""
+
+    def __init__(self):
+        super().__init__(1)
+
+    def inc(self, amount=1):
+        self._shard()[0] += amount
+
+    def value(self):
+        return self._merged()[0]
+
+
+class Histogram(_Sharded):
+    """Fixed-bucket histogram of durations, cheap enough for every request"""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        # One slot per bucket, the overflow (+Inf) slot, then the sum
+        super().__init__(len(self.buckets) + 2)
+
+    def observe(self, value):
+        shard = self._shard()
+        shard[bisect.bisect_left(self.buckets, value)] += 1
+        shard[-1] += value
+
+    def quantile(self, q, counts=None):
+        """Upper bound of the bucket holding the q-th observation, or None when empty"""
+        if counts is None:
+            counts = self._merged()[:-1]
+        total = sum(counts)
+        if not total:
+            return None
+        rank = q * total
+        seen = 0
+        for bound, count in zip(self.buckets + (float("inf"),), counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return float("inf")
+
+    def snapshot(self):
+        """Cumulative bucket counts keyed by upper bound, plus count, sum and estimates"""
+        merged = self._merged()
+        counts, total_sum = merged[:-1], merged[-1]
+        cumulative = {}
+        running = 0
+        for bound, count in zip(self.buckets + (float("inf"),), counts):
+            running += count
+            cumulative["+Inf" if bound == float("inf") else str(bound)] = running
+        snapshot = {"buckets": cumulative, "count": running, "sum": total_sum}
+        for name, q in (("p50", 0.50), ("p99", 0.99)):
+            bound = self.quantile(q, counts)
+            # JSON has no infinity
+            snapshot[name] = "+Inf" if bound == float("inf") else bound
+        return snapshot
+
+
+# Decision pipeline metrics, exported by GET /metrics
+decision_seconds = Histogram()
+# Single-decision stages inside the guest round trip; batches and the native path skip them
+STAGES = ("encode", "write", "eval", "decode")
+stage_seconds = {stage: Histogram() for stage in STAGES}
+pool_wait_seconds = Histogram()
+OUTCOMES = ("allow", "deny", "error", "fallback")
+decisions = {outcome: Counter() for outcome in OUTCOMES}
@@ -0,0 +1,131 @@
+"""
+Prometheus text exposition of the decision pipeline, served by GET /metrics
+
+Everything is read at scrape time from the sharded counters and histograms in
+metrics.py and the stats the pool, cache, evaluator and builtins already keep;
+nothing here runs on the request path. Process-backend workers keep their own
+metrics and are not included.
+"""
+from metrics import decision_seconds, stage_seconds, pool_wait_seconds, decisions
+from decision_cache import decision_cache
+from async_evaluator import async_evaluator
+from policy_registry import policy_registry
+from opa_builtins import builtin_stats
+from decision_log import decision_logger
+from logger import dropped_records
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in labels.items()) + "}"
+
+
+class _Exposition:
+    """Samples grouped by metric family, since a family's lines must be contiguous"""
+
+    def __init__(self):
+        self._families = {}
+
+    def _family(self, name, kind, help_text):
+        family = self._families.get(name)
+        if family is None:
+            family = self._families[name] = [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}"]
+        return family
+
+    def metric(self, name, kind, help_text, value, labels=None):
+        if value is not None:
+            self._family(name, kind, help_text).append(f"{name}{_labels(labels)} {float(value)!r}")
+
+    def histogram(self, name, help_text, histogram, labels=None):
+        family = self._family(name, "histogram", help_text)
+        snapshot = histogram.snapshot()
+        labels = labels or {}
+        for bound, count in snapshot["buckets"].items():
+            family.append(f"{name}_bucket{_labels({**labels, 'le': bound})} {float(count)!r}")
+        family.append(f"{name}_sum{_labels(labels)} {float(snapshot['sum'])!r}")
+        family.append(f"{name}_count{_labels(labels)} {float(snapshot['count'])!r}")
+
+    def render(self):
+        return "\n".join(line for family in self._families.values() for line in family) + "\n"
+
+
+def render():
+    """Current metrics in the Prometheus text format"""
+    out = _Exposition()
+
+    out.histogram("opa_decision_duration_seconds", "Time to produce one decision, cache hits included",
+                  decision_seconds)
+    for stage, histogram in stage_seconds.items():
+        out.histogram("opa_decision_stage_duration_seconds",
+                      "Time per stage of a single guest evaluation", histogram, {"stage": stage})
+    for outcome, counter in decisions.items():
+        out.metric("opa_decisions_total", "counter", "Decisions by outcome; fallback is the hard-coded policy",
+                   counter.value(), {"outcome": outcome})
+    out.histogram("opa_pool_wait_seconds", "Time spent waiting for a free instance", pool_wait_seconds)
+
+    cache = decision_cache.stats()
+    out.metric("opa_decision_cache_hits_total", "counter", "Decision cache hits", cache["hits"])
+    out.metric("opa_decision_cache_misses_total", "counter", "Decision cache misses", cache["misses"])
+    out.metric("opa_decision_cache_hit_ratio", "gauge", "Hits over lookups since start", cache["hit_ratio"])
+    out.metric("opa_decision_cache_entries", "gauge", "Decisions currently cached", cache["entries"])
+    out.metric("opa_decision_cache_evictions_total", "counter", "Entries evicted by the size bound",
+               cache["evictions"])
+
+    evaluator = async_evaluator.stats()
+    out.metric("opa_evaluator_in_flight", "gauge", "Evaluations running or queued off the event loop",
+               evaluator["in_flight"])
+    out.metric("opa_evaluator_rejected_total", "counter", "Evaluations rejected as saturated",
+               evaluator["rejected"])
+    out.histogram("opa_evaluator_queue_wait_seconds", "Time from submission to a worker picking it up",
+                  async_evaluator.queue_wait)
+
+    for package, policy in policy_registry.stats().items():
+        labels = {"policy": package}
+        out.metric("opa_policy_loaded", "gauge", "1 when the policy is compiled and pooled",
+                   int(policy["loaded"]), labels)
+        out.metric("opa_policy_memory_bytes", "gauge", "Linear memory of every instance of the policy",
+                   policy["memory_bytes"], labels)
+        pool = policy["pool"]
+        if not pool:
+            continue
+        out.metric("opa_pool_instances", "gauge", "Pooled instances by state", pool["idle"],
+                   {**labels, "state": "idle"})
+        out.metric("opa_pool_instances", "gauge", "Pooled instances by state", pool["in_use"],
+                   {**labels, "state": "in_use"})
+        out.metric("opa_pool_timeouts_total", "counter", "Checkouts that found no free instance in time",
+                   pool["timeouts"], labels)
+        for reason, count in pool["recycled_by_reason"].items():
+            out.metric("opa_instance_recycled_total", "counter", "Instances replaced, by reason", count,
+                       {**labels, "reason": reason})
+        for index, instance in enumerate(pool["instances"]):
+            out.metric("opa_instance_memory_bytes", "gauge", "Linear memory of one pooled instance",
+                       instance["memory_bytes"], {**labels, "instance": index})
+        for plan, native in pool.get("native", {}).items():
+            out.metric("opa_native_plan_trusted", "gauge", "1 when the compiled plan serves decisions",
+                       int(native["state"] == "trusted"), {**labels, "plan": plan})
+
+    log = decision_logger.stats()
+    if log["enabled"]:
+        out.metric("opa_decision_log_written_total", "counter", "Decision log records written", log["written"])
+        out.metric("opa_decision_log_dropped_total", "counter",
+                   "Decision log records dropped on a full buffer or a failed write", log["dropped"])
+        out.metric("opa_decision_log_sampled_out_total", "counter", "Decisions skipped by log sampling",
+                   log["sampled_out"])
+        out.metric("opa_decision_log_buffered", "gauge", "Records waiting for the background writer",
+                   log["buffered"])
+
+    out.metric("opa_log_records_dropped_total", "counter", "Log records dropped on a full logging queue",
+               dropped_records())
+
+    for name, builtin in builtin_stats.snapshot().items():
+        out.metric("opa_builtin_calls_total", "counter", "Host builtin calls", builtin["calls"], {"builtin": name})
+        out.metric("opa_builtin_seconds_total", "counter", "Time spent in host builtins",
+                   builtin["seconds_total"], {"builtin": name})
+    return out.render()
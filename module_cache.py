@@ -0,0 +1,82 @@
+import hashlib
+import os
+import platform
+import tempfile
+from importlib import metadata
+import wasmtime
+from logger import get_logger
+
+logger = get_logger(__name__)
+
+# Bump when the cache layout or key derivation changes
+CACHE_FORMAT = "1"
+
+
+def _wasmtime_version():
+    try:
+        return metadata.version("wasmtime")
+    except metadata.PackageNotFoundError:
+        return "unknown"
+
+
+def cache_key(wasm_sha256, engine_settings):
+    """Cache key over the policy hash, wasmtime build, host and engine config"""
+    h = hashlib.sha256()
+    h.update(f"format={CACHE_FORMAT}\n".encode())
+    h.update(f"wasm={wasm_sha256}\n".encode())
+    h.update(f"wasmtime={_wasmtime_version()}\n".encode())
+    h.update(f"machine={platform.machine()}\n".encode())
+    for name, value in sorted(engine_settings.items()):
+        h.update(f"{name}={value!r}\n".encode())
+    return h.hexdigest()
+
+
+def _write_atomic(path, data):
+    """Write via a temp file + rename so concurrent workers never see a partial artifact"""
+    directory = os.path.dirname(path)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+
+
+def load_module(engine, wasm_path, cache_dir, engine_settings):
+    """Load a compiled module from the on-disk cache, compiling and storing it on a miss
+
+    Returns (module, wasm_sha256). Deserialized artifacts are trusted native code,
+    so `cache_dir` must only be writable by the service itself.
+    """
+    with open(wasm_path, "rb") as f:
+        wasm_bytes = f.read()
+    wasm_sha256 = hashlib.sha256(wasm_bytes).hexdigest()
+
+    if not cache_dir:
+        return wasmtime.Module(engine, wasm_bytes), wasm_sha256
+
+    artifact_path = os.path.join(cache_dir, f"{cache_key(wasm_sha256, engine_settings)}.cwasm")
+    if os.path.exists(artifact_path):
+        try:
+            module = wasmtime.Module.deserialize_file(engine, artifact_path)
+            logger.info(f"Loaded precompiled module from {artifact_path}")
+            return module, wasm_sha256
+        except Exception as e:
+            # Stale or corrupt artifact: drop it and fall through to a fresh compile
+            logger.warning(f"Discarding unusable module cache entry {artifact_path}: {e}")
+            try:
+                os.unlink(artifact_path)
+            except OSError:
+                pass
+
+    module = wasmtime.Module(engine, wasm_bytes)
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        _write_atomic(artifact_path, module.serialize())
+        logger.info(f"Stored compiled module in {artifact_path}")
+    except OSError as e:
+        logger.warning(f"Could not write module cache entry {artifact_path}: {e}")
+    return module, wasm_sha256
@@ -0,0 +1,657 @@
+import json
+import os
+import threading
+import wasmtime
+from logger import get_logger
+from opa_builtins import UnsupportedBuiltinError
+from opa_abi import PolicyAbortError
+
+logger = get_logger(__name__)
+
+# Locals holding the input and data documents in every plan
+_INPUT, _DATA = 0, 1
+
+# Value of a local that has not been assigned, distinct from JSON null
+_UNDEF = object()
+
+# Returned by a ReturnLocalStmt; unwinds every enclosing block of the function
+_RETURN = object()
+
+# Candidate values tried at each input path when probing a plan, besides its string constants
+_PROBE_VALUES = (True, False, 0, 1, None, {}, [])
+_MAX_PROBES = 512
+
+
+class UnsupportedPlan(Exception):
+    """The plan uses IR outside the subset the native compiler handles"""
+
+
+class NativeFallback(Exception):
+    """This input needs semantics the native code does not reproduce; evaluate in WASM"""
+
+
+def _equal(a, b):
+    """Rego equality: bools are not numbers, and 1 == 1.0"""
+    if isinstance(a, bool) or isinstance(b, bool):
+        return a is b
+    if isinstance(a, (int, float)) and isinstance(b, (int, float)):
+        return a == b
+    if type(a) is not type(b):
+        return False
+    if isinstance(a, list):
+        return len(a) == len(b) and all(_equal(x, y) for x, y in zip(a, b))
+    if isinstance(a, dict):
+        return a.keys() == b.keys() and all(_equal(a[k], b[k]) for k in a)
+    return a == b
+
+
+def same_result(a, b):
+    """Whether two decoded result sets agree under Rego equality (1 == 1.0, true != 1)"""
+    return _equal(a, b)
+
+
+def _comparable(a, b):
+    # Rego orders values of different types too; only the common cases are native
+    if isinstance(a, bool) or isinstance(b, bool):
+        raise NativeFallback("comparison of booleans")
+    if isinstance(a, (int, float)) and isinstance(b, (int, float)):
+        return a, b
+    if isinstance(a, str) and isinstance(b, str):
+        return a, b
+    raise NativeFallback(f"comparison of {type(a).__name__} and {type(b).__name__}")
+
+
+def _member(x, collection):
+    if isinstance(collection, list):
+        return any(_equal(x, item) for item in collection)
+    if isinstance(collection, dict):
+        return any(_equal(x, item) for item in collection.values())
+    raise NativeFallback(f"membership in {type(collection).__name__}")
+
+
+# Builtins the compiler can call directly; anything else makes the plan unsupported
+_BUILTINS = {
+    "equal": _equal,
+    "neq": lambda a, b: not _equal(a, b),
+    "internal.member_2": _member,
+    "lt": lambda a, b: (lambda x, y: x < y)(*_comparable(a, b)),
+    "lte": lambda a, b: (lambda x, y: x <= y)(*_comparable(a, b)),
+    "gt": lambda a, b: (lambda x, y: x > y)(*_comparable(a, b)),
+    "gte": lambda a, b: (lambda x, y: x >= y)(*_comparable(a, b)),
+}
+
+
+def _max_local(node):
+    """Highest local index referenced anywhere below `node`"""
+    highest = 1
+    if isinstance(node, dict):
+        if node.get("type") == "local" and isinstance(node.get("value"), int):
+            highest = node["value"]
+        for key, value in node.items():
+            if key in ("target", "result", "object", "array", "source", "return") and isinstance(value, int):
+                highest = max(highest, value)
+            elif key == "params":
+                highest = max([highest, *value])
+            else:
+                highest = max(highest, _max_local(value))
+    elif isinstance(node, list):
+        for item in node:
+            highest = max(highest, _max_local(item))
+    return highest
+
+
+class _Func:
+    """A compiled plan function: fresh locals per call, result in its return local"""
+
+    def __init__(self, name, params, ret, size):
+        self.name = name
+        self.params = params
+        self.ret = ret
+        self.size = size
+        self.blocks = ()
+
+    def __call__(self, *args):
+        frame = [_UNDEF] * self.size
+        for local, value in zip(self.params, args):
+            frame[local] = value
+        for block in self.blocks:
+            if block(frame) is _RETURN:
+                break
+        return frame[self.ret]
+
+
+class PlanCompiler:
+    """Turns an OPA IR plan (opa build -t plan) into nested Python closures"""
+
+    def __init__(self, doc):
+        self.strings = [s["value"] for s in (doc.get("static") or {}).get("strings") or []]
+        self.func_docs = {f["name"]: f for f in (doc.get("funcs") or {}).get("funcs") or []}
+        self.funcs = {}
+        self.plans = {p["name"]: p for p in (doc.get("plans") or {}).get("plans") or []}
+
+    def compile_plan(self, name):
+        """Callable (input, data) -> result set for one plan"""
+        plan = self.plans[name]
+        size = _max_local(plan) + 2
+        # The extra slot carries the result set through ResultSetAddStmt
+        results_slot = size - 1
+        blocks = [self.block(block, results_slot) for block in plan["blocks"]]
+
+        def run(input_data, data):
+            frame = [_UNDEF] * size
+            frame[_INPUT] = input_data
+            frame[_DATA] = data
+            frame[results_slot] = results = []
+            for block in blocks:
+                if block(frame) is _RETURN:
+                    break
+            return results
+
+        return run
+
+    def func(self, name):
+        func = self.funcs.get(name)
+        if func is None:
+            doc = self.func_docs[name]
+            # Registered before compiling the body so recursive calls resolve
+            func = self.funcs[name] = _Func(name, doc["params"], doc["return"], _max_local(doc) + 1)
+            func.blocks = [self.block(block, None, doc["return"]) for block in doc["blocks"]]
+        return func
+
+    def operand(self, operand):
+        kind, value = operand["type"], operand["value"]
+        if kind == "local":
+            return lambda frame: frame[value]
+        if kind == "bool":
+            return lambda frame: value
+        if kind == "string_index":
+            string = self.strings[value]
+            return lambda frame: string
+        raise UnsupportedPlan(f"operand type {kind}")
+
+    def block(self, block, results_slot, return_local=None):
+        """Closure running a block: None if it ran to the end, else a break depth or _RETURN"""
+        stmts = [self.stmt(stmt, results_slot, return_local) for stmt in block["stmts"]]
+
+        def run(frame):
+            for stmt in stmts:
+                outcome = stmt(frame)
+                if outcome is not None:
+                    return outcome
+            return None
+
+        return run
+
+    def stmt(self, stmt, results_slot, return_local):
+        """Closure for one statement: None to continue, 0 to leave the block, n to break n levels"""
+        kind, s = stmt["type"], stmt["stmt"]
+        compile_stmt = getattr(self, f"_{kind}", None)
+        if compile_stmt is None:
+            raise UnsupportedPlan(f"statement {kind}")
+        return compile_stmt(s, results_slot, return_local)
+
+    # --- control flow -------------------------------------------------------------
+
+    def _BlockStmt(self, s, results_slot, return_local):
+        blocks = [self.block(b, results_slot, return_local) for b in s.get("blocks") or []]
+
+        def run(frame):
+            for block in blocks:
+                outcome = block(frame)
+                if outcome is _RETURN:
+                    return _RETURN
+                if outcome:
+                    return outcome - 1
+            return None
+
+        return run
+
+    def _BreakStmt(self, s, results_slot, return_local):
+        index = s["index"]
+        return lambda frame: index
+
+    def _NotStmt(self, s, results_slot, return_local):
+        block = self.block(s["block"], results_slot, return_local)
+
+        def run(frame):
+            outcome = block(frame)
+            if outcome is None:
+                # The negated block was defined, so `not` fails
+                return 0
+            if outcome is _RETURN:
+                return _RETURN
+            return outcome - 1 if outcome else None
+
+        return run
+
+    def _ReturnLocalStmt(self, s, results_slot, return_local):
+        source = s["source"]
+
+        def run(frame):
+            frame[return_local] = frame[source]
+            return _RETURN
+
+        return run
+
+    def _CallStmt(self, s, results_slot, return_local):
+        name, target = s["func"], s["result"]
+        args = [self.operand(arg) for arg in s.get("args") or []]
+        if name in self.func_docs:
+            func = self.func(name)
+        elif name in _BUILTINS:
+            func = _BUILTINS[name]
+        else:
+            raise UnsupportedPlan(f"call to {name}")
+
+        def run(frame):
+            values = [arg(frame) for arg in args]
+            if _UNDEF in values:
+                return 0
+            result = func(*values)
+            if result is _UNDEF:
+                return 0
+            frame[target] = result
+            return None
+
+        return run
+
+    # --- locals -------------------------------------------------------------------
+
+    def _AssignVarStmt(self, s, results_slot, return_local):
+        source, target = self.operand(s["source"]), s["target"]
+
+        def run(frame):
+            value = source(frame)
+            if value is _UNDEF:
+                return 0
+            frame[target] = value
+            return None
+
+        return run
+
+    def _AssignVarOnceStmt(self, s, results_slot, return_local):
+        source, target = self.operand(s["source"]), s["target"]
+
+        def run(frame):
+            value = source(frame)
+            current = frame[target]
+            if current is _UNDEF:
+                frame[target] = value
+            elif not _equal(current, value):
+                # Conflicting rule values are an evaluation error in OPA
+                raise NativeFallback("conflicting values")
+            return None
+
+        return run
+
+    def _ResetLocalStmt(self, s, results_slot, return_local):
+        target = s["target"]
+
+        def run(frame):
+            frame[target] = _UNDEF
+            return None
+
+        return run
+
+    def _IsDefinedStmt(self, s, results_slot, return_local):
+        source = s["source"]
+        return lambda frame: 0 if frame[source] is _UNDEF else None
+
+    def _IsUndefinedStmt(self, s, results_slot, return_local):
+        source = s["source"]
+        return lambda frame: None if frame[source] is _UNDEF else 0
+
+    # --- comparisons and lookups ----------------------------------------------------
+
+    def _EqualStmt(self, s, results_slot, return_local):
+        a, b = self.operand(s["a"]), self.operand(s["b"])
+        return lambda frame: None if _equal(a(frame), b(frame)) else 0
+
+    def _NotEqualStmt(self, s, results_slot, return_local):
+        a, b = self.operand(s["a"]), self.operand(s["b"])
+
+        def run(frame):
+            x, y = a(frame), b(frame)
+            if x is _UNDEF or y is _UNDEF or _equal(x, y):
+                return 0
+            return None
+
+        return run
+
+    def _DotStmt(self, s, results_slot, return_local):
+        source, key, target = self.operand(s["source"]), self.operand(s["key"]), s["target"]
+
+        def run(frame):
+            value, k = source(frame), key(frame)
+            if isinstance(value, dict):
+                if isinstance(k, str) and k in value:
+                    frame[target] = value[k]
+                    return None
+            elif isinstance(value, list):
+                if isinstance(k, int) and not isinstance(k, bool) and 0 <= k < len(value):
+                    frame[target] = value[k]
+                    return None
+            return 0
+
+        return run
+
+    def _LenStmt(self, s, results_slot, return_local):
+        source, target = self.operand(s["source"]), s["target"]
+
+        def run(frame):
+            value = source(frame)
+            if not isinstance(value, (str, list, dict)):
+                return 0
+            frame[target] = len(value)
+            return None
+
+        return run
+
+    def _IsObjectStmt(self, s, results_slot, return_local):
+        source = self.operand(s["source"])
+        return lambda frame: None if isinstance(source(frame), dict) else 0
+
+    def _IsArrayStmt(self, s, results_slot, return_local):
+        source = self.operand(s["source"])
+        return lambda frame: None if isinstance(source(frame), list) else 0
+
+    # --- constructing values --------------------------------------------------------
+
+    def _MakeNullStmt(self, s, results_slot, return_local):
+        return self._make(s["target"], lambda: None)
+
+    def _MakeNumberIntStmt(self, s, results_slot, return_local):
+        number = s["value"]
+        return self._make(s["target"], lambda: number)
+
+    def _MakeNumberRefStmt(self, s, results_slot, return_local):
+        # OPA serializes this field as "Index"
+        raw = self.strings[s.get("Index", s.get("index"))]
+        number = json.loads(raw)
+        return self._make(s["target"], lambda: number)
+
+    def _MakeObjectStmt(self, s, results_slot, return_local):
+        return self._make(s["target"], dict)
+
+    def _MakeArrayStmt(self, s, results_slot, return_local):
+        return self._make(s["target"], list)
+
+    def _make(self, target, factory):
+        def run(frame):
+            frame[target] = factory()
+            return None
+        return run
+
+    def _ObjectInsertStmt(self, s, results_slot, return_local):
+        key, value, obj = self.operand(s["key"]), self.operand(s["value"]), s["object"]
+
+        def run(frame):
+            k = key(frame)
+            if not isinstance(k, str):
+                raise NativeFallback("non-string object key")
+            frame[obj][k] = value(frame)
+            return None
+
+        return run
+
+    def _ObjectInsertOnceStmt(self, s, results_slot, return_local):
+        key, value, obj = self.operand(s["key"]), self.operand(s["value"]), s["object"]
+
+        def run(frame):
+            k, v = key(frame), value(frame)
+            if not isinstance(k, str):
+                raise NativeFallback("non-string object key")
+            target = frame[obj]
+            if k in target and not _equal(target[k], v):
+                raise NativeFallback("conflicting object values")
+            target[k] = v
+            return None
+
+        return run
+
+    def _ArrayAppendStmt(self, s, results_slot, return_local):
+        value, array = self.operand(s["value"]), s["array"]
+
+        def run(frame):
+            frame[array].append(value(frame))
+            return None
+
+        return run
+
+    def _ResultSetAddStmt(self, s, results_slot, return_local):
+        value = s["value"]
+
+        def run(frame):
+            frame[results_slot].append(frame[value])
+            return None
+
+        return run
+
+    # --- probing ----------------------------------------------------------------------
+
+    def input_paths(self, name):
+        """input.* paths the plan's functions look up with constant keys"""
+        paths = set()
+        seen = set()
+
+        def walk(node, origins):
+            if isinstance(node, list):
+                for item in node:
+                    walk(item, origins)
+                return
+            if not isinstance(node, dict):
+                return
+            kind, s = node.get("type"), node.get("stmt")
+            if kind == "DotStmt" and s["source"]["type"] == "local" and s["key"]["type"] == "string_index":
+                base = origins.get(s["source"]["value"])
+                if base is not None:
+                    path = base + (self.strings[s["key"]["value"]],)
+                    origins[s["target"]] = path
+                    paths.add(path)
+            elif kind in ("AssignVarStmt", "AssignVarOnceStmt") and s["source"]["type"] == "local":
+                if s["source"]["value"] in origins:
+                    origins[s["target"]] = origins[s["source"]["value"]]
+            elif kind == "CallStmt" and s["func"] in self.func_docs and s["func"] not in seen:
+                seen.add(s["func"])
+                doc = self.func_docs[s["func"]]
+                # Functions receive the input as whichever argument carries it
+                inner = {
+                    param: origins[arg["value"]]
+                    for param, arg in zip(doc["params"], s.get("args") or [])
+                    if arg["type"] == "local" and arg["value"] in origins
+                }
+                walk(doc["blocks"], inner)
+            for value in node.values():
+                if isinstance(value, (list, dict)):
+                    walk(value, origins)
+
+        walk(self.plans[name]["blocks"], {_INPUT: ()})
+        return paths
+
+    def reads_data(self, name):
+        """Whether the plan, or any function it hands the data document to, looks at data"""
+        checked = {}
+
+        def func_reads(func, param):
+            key = (func, param)
+            if key not in checked:
+                # Assumed not to while its own body is walked, so recursion terminates
+                checked[key] = False
+                checked[key] = uses(self.func_docs[func]["blocks"], {param})
+            return checked[key]
+
+        def uses(node, data_locals):
+            if isinstance(node, list):
+                return any(uses(item, data_locals) for item in node)
+            if not isinstance(node, dict):
+                return False
+            if node.get("type") == "CallStmt" and node["stmt"]["func"] in self.func_docs:
+                s = node["stmt"]
+                params = self.func_docs[s["func"]]["params"]
+                return any(
+                    arg["type"] == "local" and arg["value"] in data_locals and func_reads(s["func"], param)
+                    for param, arg in zip(params, s.get("args") or [])
+                )
+            if node.get("type") == "local" and node.get("value") in data_locals:
+                return True
+            for key, value in node.items():
+                if key == "source" and isinstance(value, int) and value in data_locals:
+                    return True
+                if isinstance(value, (list, dict)) and uses(value, data_locals):
+                    return True
+            return False
+
+        return uses(self.plans[name]["blocks"], {_DATA})
+
+    def probes(self, name):
+        """Inputs exercising every input path the plan reads with its constants and edge values"""
+        candidates = list(dict.fromkeys(self.strings)) + list(_PROBE_VALUES)
+        probes = [{}, None]
+        # The root counts too: rules may compare or iterate over input itself
+        for path in sorted(self.input_paths(name) | {()}):
+            for value in candidates:
+                probe = value
+                for key in reversed(path):
+                    probe = {key: probe}
+                probes.append(probe)
+                if len(probes) >= _MAX_PROBES:
+                    return probes
+        return probes
+
+
+# Native plan lifecycle: shadowed by WASM until trusted; disabled for good on a mismatch
+VERIFYING, TRUSTED, DISABLED = "verifying", "trusted", "disabled"
+
+
+class NativePlan:
+    """One entrypoint compiled to Python, verified against WASM before it serves"""
+
+    def __init__(self, name, run, probes, data, verify_samples):
+        self.name = name
+        self._run = run
+        self.probes = probes
+        self.data = data
+        self.verify_samples = verify_samples
+        self.state = VERIFYING
+        self.agreed = 0
+        self.fallbacks = 0
+        self._lock = threading.Lock()
+
+    @property
+    def trusted(self):
+        return self.state == TRUSTED
+
+    @property
+    def verifying(self):
+        return self.state == VERIFYING
+
+    def evaluate(self, input_data):
+        """Result set computed natively; raises NativeFallback for inputs it cannot decide"""
+        try:
+            return self._run(input_data, self.data)
+        except NativeFallback:
+            self.fallbacks += 1
+            raise
+        except Exception as e:
+            # A compiler bug must never surface as a decision
+            self._disable(f"failed on {input_data!r}: {e}")
+            raise NativeFallback(str(e)) from e
+
+    def verify_probes(self, wasm_eval):
+        """Compare against WASM on the load-time probes, before the policy serves a request
+
+        Traps, aborts and missing builtins leave the instance that evaluated the probe
+        unusable; the plan is disabled and the error re-raised so the caller
+        discards that instance.
+        """
+        cases = []
+        for probe in self.probes:
+            try:
+                cases.append((probe, wasm_eval(probe)))
+            except (wasmtime.Trap, UnsupportedBuiltinError, PolicyAbortError) as e:
+                self._disable(f"could not be verified, WASM failed on probe {probe!r}: {e}")
+                raise
+            except Exception as e:
+                logger.debug(f"Skipping probe {probe!r} for {self.name}: {e}")
+        self._compare(cases)
+
+    def shadow(self, input_data, expected):
+        """Compare against the result set WASM returned for a live input"""
+        if self.state == VERIFYING:
+            self._compare([(input_data, expected)])
+
+    def _compare(self, cases):
+        for case_input, case_expected in cases:
+            if self.state != VERIFYING:
+                return
+            try:
+                actual = self._run(case_input, self.data)
+            except NativeFallback:
+                continue
+            except Exception as e:
+                self._disable(f"failed on {case_input!r}: {e}")
+                return
+            if not _equal(actual, case_expected):
+                self._disable(f"disagrees with WASM on {case_input!r}: {actual!r} != {case_expected!r}")
+                return
+        with self._lock:
+            self.agreed += len(cases)
+            if self.state == VERIFYING and self.agreed >= self.verify_samples:
+                self.state = TRUSTED
+                logger.info(f"⚡ Native plan for {self.name} verified on {self.agreed} inputs; serving natively")
+
+    def _disable(self, reason):
+        with self._lock:
+            self.state = DISABLED
+        logger.error(f"❌ Native plan for {self.name} {reason}; back to WASM")
+
+    def stats(self):
+        return {"state": self.state, "agreed": self.agreed, "fallbacks": self.fallbacks}
+
+
+def load_native_plans(path, wasm_sha256, data_path, verify_samples, max_data_bytes):
+    """Compile every supported plan in the file written by build_policy.sh
+
+    Like input_paths.json, the file records the policy.wasm it was built with
+    and is ignored for any other module. Plans that read data need their own
+    copy of the document on the host, so they stay on WASM when data.json is
+    larger than max_data_bytes; it is not read at all when no plan needs it.
+    """
+    if not path or not os.path.exists(path):
+        return {}
+    try:
+        with open(path) as f:
+            doc = json.load(f)
+    except (OSError, ValueError) as e:
+        logger.warning(f"Ignoring unreadable native plan file {path}: {e}")
+        return {}
+    if doc.get("wasm_sha256") != wasm_sha256:
+        logger.warning(f"Ignoring {path}: generated for a different policy.wasm")
+        return {}
+
+    data_size = os.path.getsize(data_path) if data_path and os.path.exists(data_path) else 0
+    compiler = PlanCompiler(doc.get("plan") or {})
+    plans = {}
+    for name in compiler.plans:
+        try:
+            reads_data = compiler.reads_data(name)
+            if reads_data and data_size > max_data_bytes:
+                logger.info(f"Plan {name} stays on WASM: it reads data and data.json is {data_size} bytes")
+                continue
+            run = compiler.compile_plan(name)
+        except (UnsupportedPlan, KeyError) as e:
+            logger.info(f"Plan {name} stays on WASM: {e}")
+            continue
+        plans[name] = (run, compiler.probes(name), reads_data)
+    if not plans:
+        return {}
+
+    # The native code reads data directly, so plans that use it need their own copy
+    data = {}
+    if data_size and any(reads_data for _, _, reads_data in plans.values()):
+        with open(data_path) as f:
+            data = json.load(f)
+    return {
+        name: NativePlan(name, run, probes, data if reads_data else {}, verify_samples)
+        for name, (run, probes, reads_data) in plans.items()
+    }
@@ -0,0 +1,212 @@
+"""
+NDJSON evaluation pipeline shared by POST /v1/stream and the command line
+
+Input lines are grouped into chunks for the batch evaluator and decisions come
+back as NDJSON, one line per non-blank input line and in the same order. At
+most two chunks are held at once, one evaluating while the next is read, so
+memory stays constant however long the stream is and a slow reader stalls
+the whole pipeline instead of buffering behind it.
+
+Usage:
+    python -m ndjson_stream records.ndjson -o decisions.ndjson --path authz/allow
+"""
+import argparse
+import asyncio
+import json
+import sys
+from starlette.requests import ClientDisconnect
+from starlette.responses import StreamingResponse
+from logger import get_logger
+from config import STREAM_CHUNK_SIZE, STREAM_MAX_LINE_BYTES, POLICY_ENTRYPOINT
+from json_codec import dumps
+from wasm_engine import EvaluationTimeoutError
+from policy_registry import policy_registry
+from process_pool import process_backend
+
+logger = get_logger(__name__)
+
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+
+
+class LineTooLongError(ValueError):
+    """Raised when an input line exceeds STREAM_MAX_LINE_BYTES without a newline"""
+
+
+async def iter_lines(chunks, max_line_bytes=STREAM_MAX_LINE_BYTES):
+    """Lines of an async stream of byte chunks, without their newlines"""
+    buffer = bytearray()
+    async for chunk in chunks:
+        buffer += chunk
+        start = 0
+        while True:
+            end = buffer.find(b"\n", start)
+            if end < 0:
+                break
+            yield bytes(buffer[start:end])
+            start = end + 1
+        del buffer[:start]
+        if len(buffer) > max_line_bytes:
+            raise LineTooLongError(f"Input line longer than {max_line_bytes} bytes")
+    if buffer:
+        yield bytes(buffer)
+
+
+def _reject_constant(name):
+    # NaN and Infinity parse in Python but are not JSON, and OPA would reject them
+    raise ValueError(f"Invalid JSON constant {name}")
+
+
+def _error_line(message):
+    return dumps({"error": message}) + b"\n"
+
+
+def _decision_line(result_set):
+    # Same shape as a /v1/data response: undefined is an empty document
+    return dumps({"result": result_set[0].get("result")} if result_set else {}) + b"\n"
+
+
+async def _evaluate_or_error(inputs, evaluate_chunk):
+    """Result sets for `inputs`, with the exception in place of each one that failed"""
+    try:
+        return await evaluate_chunk(inputs)
+    except Exception as e:
+        if isinstance(e, EvaluationTimeoutError) and len(inputs) > 1:
+            # One slow record must not cost its neighbours their decisions
+            results = []
+            for item in inputs:
+                results += await _evaluate_or_error([item], evaluate_chunk)
+            return results
+        logger.error(f"Stream chunk of {len(inputs)} inputs failed: {e}")
+        return [e] * len(inputs)
+
+
+async def _evaluate_chunk(lines, evaluate_chunk):
+    """NDJSON output for one chunk of (line number, line) pairs"""
+    decoded, output = [], []
+    for number, line in lines:
+        try:
+            decoded.append(json.loads(line, parse_constant=_reject_constant))
+            output.append(None)
+        except ValueError as e:
+            output.append(_error_line(f"Line {number}: invalid JSON: {e}"))
+
+    results = iter(await _evaluate_or_error(decoded, evaluate_chunk) if decoded else ())
+    for index, line in enumerate(output):
+        if line is None:
+            result = next(results)
+            output[index] = _error_line(str(result)) if isinstance(result, Exception) else _decision_line(result)
+    return b"".join(output)
+
+
+async def evaluate_stream(lines, evaluate_chunk, chunk_size=STREAM_CHUNK_SIZE):
+    """NDJSON decision chunks for an async iterator of NDJSON input lines
+
+    `evaluate_chunk(inputs)` is awaited with up to `chunk_size` decoded inputs
+    and returns their result sets in order.
+    """
+    chunk, in_flight = [], []
+    number = 0
+    error = None
+    try:
+        try:
+            async for line in lines:
+                number += 1
+                if not line.strip():
+                    continue
+                chunk.append((number, line))
+                if len(chunk) >= chunk_size:
+                    in_flight.append(asyncio.ensure_future(_evaluate_chunk(chunk, evaluate_chunk)))
+                    chunk = []
+                    if len(in_flight) > 1:
+                        output = await in_flight[0]
+                        in_flight.pop(0)
+                        yield output
+        except LineTooLongError as e:
+            # Everything before the bad line is still answered; the stream ends there
+            error = _error_line(f"Line {number + 1}: {e}")
+
+        if chunk:
+            in_flight.append(asyncio.ensure_future(_evaluate_chunk(chunk, evaluate_chunk)))
+        while in_flight:
+            output = await in_flight[0]
+            in_flight.pop(0)
+            yield output
+        if error is not None:
+            yield error
+    finally:
+        # A client that went away leaves nobody to read these chunks
+        for task in in_flight:
+            task.cancel()
+
+
+class NDJSONStreamingResponse(StreamingResponse):
+    """StreamingResponse whose body generator also reads the request body
+
+    Starlette normally listens for a disconnect on `receive` while streaming,
+    which would swallow request body messages; here the body reader sees the
+    disconnect itself, and a reader that stops reading stalls `send`.
+    """
+
+    media_type = NDJSON_MEDIA_TYPE
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await self.stream_response(send)
+        except OSError:
+            # As StreamingResponse does for ASGI >= 2.4: a send that fails means the client
+            # went away, which servers expect as ClientDisconnect rather than an error
+            raise ClientDisconnect()
+        if self.background is not None:
+            await self.background()
+
+
+async def _read_file(f, size=1 << 20):
+    while True:
+        chunk = f.read(size)
+        if not chunk:
+            return
+        yield chunk
+
+
+async def _run(args, source, sink):
+    evaluate_many = process_backend.evaluate_many if args.backend == "process" else policy_registry.evaluate_many
+    policy_registry.resolve(args.path)
+
+    async def evaluate_chunk(inputs):
+        return await asyncio.to_thread(evaluate_many, args.path, inputs, eval_timeout=args.timeout)
+
+    count = 0
+    try:
+        async for output in evaluate_stream(iter_lines(_read_file(source)), evaluate_chunk, args.chunk_size):
+            sink.write(output)
+            count += output.count(b"\n")
+    finally:
+        process_backend.shutdown()
+    return count
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("input", nargs="?", default="-", help="NDJSON inputs, - for stdin")
+    parser.add_argument("-o", "--output", default="-", help="NDJSON decisions, - for stdout")
+    parser.add_argument("--path", default=POLICY_ENTRYPOINT)
+    parser.add_argument("--backend", choices=("thread", "process"), default="thread")
+    parser.add_argument("--chunk-size", type=int, default=STREAM_CHUNK_SIZE)
+    parser.add_argument("--timeout", type=float, default=None, help="seconds per decision")
+    args = parser.parse_args(argv)
+
+    source = sys.stdin.buffer if args.input == "-" else open(args.input, "rb")
+    sink = sys.stdout.buffer if args.output == "-" else open(args.output, "wb")
+    try:
+        count = asyncio.run(_run(args, source, sink))
+    finally:
+        if source is not sys.stdin.buffer:
+            source.close()
+        if sink is not sys.stdout.buffer:
+            sink.close()
+    print(f"✅ Wrote {count} decisions", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,118 @@
+import json
+from types import MappingProxyType
+from typing import Any, Mapping, NamedTuple, Optional
+from guest_memory import read_cstring
+from wasm_call import fast_func
+
+# One call per decision: opa_eval(reserved, entrypoint, data, input, input_len, heap_ptr, format)
+ABI_ONESHOT = "oneshot"
+# opa_eval_ctx_new / set_input / set_data / set_entrypoint / eval / get_result
+ABI_CONTEXT = "context"
+
+# opa_eval returns the result set as JSON rather than a value address
+FORMAT_JSON = 0
+
+
+class PolicyAbortError(RuntimeError):
+    """Raised from the env.opa_abort import; the guest gave up mid-evaluation"""
+
+
+class OpaExports(NamedTuple):
+    """Immutable dispatch table for one instance, resolved once at load time"""
+    abi_path: str
+    abi_version: tuple
+    memory: Any
+    malloc: Any
+    free: Any
+    json_parse: Any
+    json_dump: Any
+    heap_ptr_get: Any
+    heap_ptr_set: Any
+    eval_ctx_new: Any
+    eval_ctx_set_input: Any
+    eval_ctx_set_data: Any
+    eval_ctx_set_entrypoint: Any
+    eval_ctx_get_result: Any
+    eval_ctx: Any
+    eval_oneshot: Optional[Any]
+    # opa_value_add_path, for patching pre-parsed input templates; absent in some modules
+    value_add_path: Optional[Any]
+    entrypoints: Mapping[str, int]
+    default_entrypoint: Optional[int]
+    builtins: Mapping[str, int]
+
+
+def _abi_version(exports, store):
+    """(major, minor) from the opa_wasm_abi_* globals; modules predating them are 1.0"""
+    major = exports.get("opa_wasm_abi_version")
+    minor = exports.get("opa_wasm_abi_minor_version")
+    return (
+        major.value(store) if major is not None else 1,
+        minor.value(store) if minor is not None else 0,
+    )
+
+
+def _read_value(store, memory, json_dump, value_addr):
+    return json.loads(read_cstring(memory, store, json_dump(store, value_addr)))
+
+
+def resolve_exports(exports, store, memory, entrypoint_name):
+    """Look up every export the evaluator needs and pick the ABI path"""
+    missing = [name for name in (
+        "opa_malloc", "opa_free", "opa_json_parse", "opa_json_dump",
+        "opa_heap_ptr_get", "opa_heap_ptr_set", "opa_eval_ctx_new",
+        "opa_eval_ctx_set_input", "opa_eval_ctx_set_data",
+        "opa_eval_ctx_set_entrypoint", "opa_eval_ctx_get_result",
+        "eval", "entrypoints",
+    ) if name not in exports]
+    if missing:
+        raise RuntimeError(f"Policy module is missing OPA exports: {', '.join(missing)}")
+
+    abi_version = _abi_version(exports, store)
+    eval_oneshot = exports.get("opa_eval") if abi_version >= (1, 2) else None
+    abi_path = ABI_ONESHOT if eval_oneshot is not None else ABI_CONTEXT
+    value_add_path = exports.get("opa_value_add_path")
+
+    json_dump = exports["opa_json_dump"]
+    entrypoints = _read_value(store, memory, json_dump, exports["entrypoints"](store))
+    # Builtin name -> id the guest passes to opa_builtinN; absent in modules that use none
+    builtins_export = exports.get("builtins")
+    builtins = _read_value(store, memory, json_dump, builtins_export(store)) if builtins_export else {}
+    if entrypoint_name in entrypoints:
+        default_entrypoint = entrypoints[entrypoint_name]
+    elif len(entrypoints) == 1:
+        default_entrypoint = next(iter(entrypoints.values()))
+    elif entrypoint_name is None:
+        # Callers must name an entrypoint on every evaluation
+        default_entrypoint = None
+    else:
+        raise RuntimeError(
+            f"Entrypoint '{entrypoint_name}' not found; module has {sorted(entrypoints)}"
+        )
+
+    # Every export is i32-only, so each gets a preallocated raw caller bound to this store
+    def call(func):
+        return fast_func(store, func)
+
+    return OpaExports(
+        abi_path=abi_path,
+        abi_version=abi_version,
+        memory=memory,
+        malloc=call(exports["opa_malloc"]),
+        free=call(exports["opa_free"]),
+        json_parse=call(exports["opa_json_parse"]),
+        json_dump=call(json_dump),
+        heap_ptr_get=call(exports["opa_heap_ptr_get"]),
+        heap_ptr_set=call(exports["opa_heap_ptr_set"]),
+        eval_ctx_new=call(exports["opa_eval_ctx_new"]),
+        eval_ctx_set_input=call(exports["opa_eval_ctx_set_input"]),
+        eval_ctx_set_data=call(exports["opa_eval_ctx_set_data"]),
+        eval_ctx_set_entrypoint=call(exports["opa_eval_ctx_set_entrypoint"]),
+        eval_ctx_get_result=call(exports["opa_eval_ctx_get_result"]),
+        eval_ctx=call(exports["eval"]),
+        eval_oneshot=call(eval_oneshot) if eval_oneshot is not None else None,
+        value_add_path=call(value_add_path) if value_add_path is not None else None,
+        entrypoints=MappingProxyType(dict(entrypoints)),
+        default_entrypoint=default_entrypoint,
+        builtins=MappingProxyType(dict(builtins)),
+    )
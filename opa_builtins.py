@@ -0,0 +1,330 @@
+import base64
+import calendar
+import functools
+import hashlib
+import hmac
+import ipaddress
+import logging
+import re
+import threading
+import time
+import urllib.parse
+from datetime import datetime, timezone
+from logger import get_logger
+from json_codec import dumps
+from guest_memory import read_json
+import tracing
+
+logger = get_logger(__name__)
+
+# Compiled regexes and parsed networks kept across evaluations; policies reuse a handful
+MEMO_SIZE = 1024
+
+# Returned by an implementation when the builtin is undefined for its arguments
+UNDEFINED = object()
+
+# Builtin name -> Python implementation taking and returning plain JSON values
+BUILTINS = {}
+
+# Builtins whose implementation also takes the dispatcher, for state fixed per evaluation
+_PER_EVALUATION = set()
+
+
+class UnsupportedBuiltinError(RuntimeError):
+    """Raised when a policy calls an OPA builtin that has no host implementation"""
+
+
+def builtin(name, per_evaluation=False):
+    """Register a Python implementation for the OPA builtin `name`"""
+    def register(func):
+        BUILTINS[name] = func
+        if per_evaluation:
+            _PER_EVALUATION.add(name)
+        return func
+    return register
+
+
+class BuiltinStats:
+    """Calls and time per builtin name, kept across instances and recycles"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats = {}
+
+    def record(self, name, seconds):
+        with self._lock:
+            entry = self._stats.get(name)
+            if entry is None:
+                entry = self._stats[name] = [0, 0.0]
+            entry[0] += 1
+            entry[1] += seconds
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                name: {"calls": calls, "seconds_total": seconds}
+                for name, (calls, seconds) in self._stats.items()
+            }
+
+
+builtin_stats = BuiltinStats()
+
+
+class BuiltinDispatcher:
+    """Host side of env.opa_builtin0..4 for one instance
+
+    The module's builtins() export maps names to ids; bind() turns that into a
+    list indexed by id, so a call is a single index instead of a name lookup.
+    """
+
+    def __init__(self):
+        self.instance = None
+        self.table = []
+        # Stamped when each evaluation starts; OPA fixes time.now_ns for a whole query
+        self.now_ns = None
+
+    def bind(self, instance):
+        """Resolve every builtin the module uses against BUILTINS, once per instance"""
+        ids = instance.abi.builtins
+        # Ids the module never names stay empty slots, reported like missing builtins
+        table = [(None, None)] * (max(ids.values()) + 1 if ids else 0)
+        missing = []
+        for name, builtin_id in ids.items():
+            impl = BUILTINS.get(name)
+            if impl is None:
+                missing.append(name)
+            elif name in _PER_EVALUATION:
+                impl = functools.partial(impl, self)
+            table[builtin_id] = (name, impl)
+        if missing:
+            logger.warning(f"Policy uses builtins with no host implementation: {', '.join(sorted(missing))}")
+        self.instance = instance
+        self.table = table
+        instance.builtins = self
+
+    def __call__(self, builtin_id, ctx, *arg_addrs):
+        name, impl = self.table[builtin_id]
+        if impl is None:
+            raise UnsupportedBuiltinError(f"OPA builtin '{name or builtin_id}' is not implemented")
+        start = time.perf_counter()
+        instance = self.instance
+        try:
+            result = impl(*[read_json(instance, addr) for addr in arg_addrs])
+        except (ValueError, TypeError, KeyError, IndexError, AttributeError, re.error) as e:
+            # As in OPA without strict builtin errors: a failing builtin is undefined
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug(f"OPA builtin '{name}' failed: {e}")
+            result = UNDEFINED
+        # A null address tells the guest the call was undefined
+        addr = 0 if result is UNDEFINED else instance.parse_json(dumps(result))
+        end = time.perf_counter()
+        builtin_stats.record(name, end - start)
+        tracing.record(f"builtin {name}", start, end)
+        return addr
+
+
+# --- time ---------------------------------------------------------------------
+
+@builtin("time.now_ns", per_evaluation=True)
+def time_now_ns(dispatcher):
+    return dispatcher.now_ns
+
+
+def _parse_rfc3339(value):
+    # fromisoformat only takes up to microseconds, so split off the fraction
+    match = re.fullmatch(r"(\d{4}-\d\d-\d\dT\d\d:\d\d:\d\d)(?:\.(\d+))?(Z|[+-]\d\d:\d\d)", value)
+    if match is None:
+        raise ValueError(f"Invalid RFC3339 time '{value}'")
+    base, fraction, zone = match.groups()
+    parsed = datetime.fromisoformat(base + ("+00:00" if zone == "Z" else zone))
+    nanos = int((fraction or "0").ljust(9, "0")[:9])
+    return calendar.timegm(parsed.utctimetuple()) * 1_000_000_000 + nanos
+
+
+@builtin("time.parse_rfc3339_ns")
+def time_parse_rfc3339_ns(value):
+    return _parse_rfc3339(value)
+
+
+def _datetime(ns):
+    # [ns, tz] pairs are accepted by OPA; only UTC is supported here
+    if isinstance(ns, list):
+        ns = ns[0]
+    return datetime.fromtimestamp(ns // 1_000_000_000, tz=timezone.utc)
+
+
+@builtin("time.date")
+def time_date(ns):
+    d = _datetime(ns)
+    return [d.year, d.month, d.day]
+
+
+@builtin("time.clock")
+def time_clock(ns):
+    d = _datetime(ns)
+    return [d.hour, d.minute, d.second]
+
+
+@builtin("time.weekday")
+def time_weekday(ns):
+    return _datetime(ns).strftime("%A")
+
+
+# --- regex --------------------------------------------------------------------
+
+@functools.lru_cache(maxsize=MEMO_SIZE)
+def _compile(pattern):
+    # Python's re is close to RE2 for the patterns policies use; RE2-only syntax fails to compile
+    return re.compile(pattern)
+
+
+@builtin("regex.is_valid")
+def regex_is_valid(pattern):
+    try:
+        _compile(pattern)
+        return True
+    except (re.error, TypeError):
+        return False
+
+
+@builtin("regex.match")
+def regex_match(pattern, value):
+    return _compile(pattern).search(value) is not None
+
+
+@builtin("regex.find_n")
+def regex_find_n(pattern, value, n):
+    found = [m.group(0) for m in _compile(pattern).finditer(value)]
+    return found if n < 0 else found[:n]
+
+
+@builtin("regex.split")
+def regex_split(pattern, value):
+    # Go's regexp.Split: capture groups are not returned, unlike re.split, and an
+    # empty match right after the previous match is skipped
+    if pattern and not value:
+        return [""]
+    parts = []
+    beg = end = 0
+    previous = None
+    for match in _compile(pattern).finditer(value):
+        start, stop = match.span()
+        if start == stop == previous:
+            continue
+        previous = stop
+        end = start
+        if stop != 0:
+            parts.append(value[beg:end])
+        beg = stop
+    if end != len(value):
+        parts.append(value[beg:])
+    return parts
+
+
+@builtin("regex.replace")
+def regex_replace(value, pattern, replacement):
+    # Go's $1 group references become Python's \g<1>
+    return _compile(pattern).sub(re.sub(r"\$(\d+)", r"\\g<\1>", replacement), value)
+
+
+# --- crypto -------------------------------------------------------------------
+
+for _name in ("md5", "sha1", "sha256"):
+    builtin(f"crypto.{_name}")(
+        lambda value, _algorithm=_name: hashlib.new(_algorithm, value.encode()).hexdigest()
+    )
+
+for _name in ("md5", "sha1", "sha256", "sha512"):
+    builtin(f"crypto.hmac.{_name}")(
+        lambda value, key, _algorithm=_name: hmac.new(key.encode(), value.encode(), _algorithm).hexdigest()
+    )
+
+
+@builtin("crypto.hmac.equal")
+def crypto_hmac_equal(mac1, mac2):
+    return hmac.compare_digest(mac1, mac2)
+
+
+# --- net ----------------------------------------------------------------------
+
+@functools.lru_cache(maxsize=MEMO_SIZE)
+def _network(cidr):
+    # Bare addresses are /32 (or /128) networks
+    return ipaddress.ip_network(cidr, strict=False)
+
+
+@builtin("net.cidr_contains")
+def net_cidr_contains(cidr, cidr_or_ip):
+    outer, inner = _network(cidr), _network(cidr_or_ip)
+    return inner.version == outer.version and inner.subnet_of(outer)
+
+
+@builtin("net.cidr_intersects")
+def net_cidr_intersects(cidr1, cidr2):
+    return _network(cidr1).overlaps(_network(cidr2))
+
+
+@builtin("net.cidr_is_valid")
+def net_cidr_is_valid(cidr):
+    try:
+        ipaddress.ip_network(cidr, strict=False)
+        return "/" in cidr
+    except ValueError:
+        return False
+
+
+# --- encoding -----------------------------------------------------------------
+
+@builtin("base64.encode")
+def base64_encode(value):
+    return base64.b64encode(value.encode()).decode()
+
+
+@builtin("base64.decode")
+def base64_decode(value):
+    return base64.b64decode(value, validate=True).decode()
+
+
+@builtin("base64url.encode")
+def base64url_encode(value):
+    return base64.urlsafe_b64encode(value.encode()).decode()
+
+
+@builtin("base64url.decode")
+def base64url_decode(value):
+    # OPA accepts unpadded input
+    return base64.urlsafe_b64decode(value + "=" * (-len(value) % 4)).decode()
+
+
+@builtin("hex.encode")
+def hex_encode(value):
+    return value.encode().hex()
+
+
+@builtin("hex.decode")
+def hex_decode(value):
+    return bytes.fromhex(value).decode()
+
+
+@builtin("urlquery.encode")
+def urlquery_encode(value):
+    return urllib.parse.quote_plus(value)
+
+
+@builtin("urlquery.decode")
+def urlquery_decode(value):
+    return urllib.parse.unquote_plus(value)
+
+
+# --- runtime ------------------------------------------------------------------
+
+@builtin("opa.runtime")
+def opa_runtime():
+    return {}
+
+
+@builtin("trace")
+def trace(note):
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug(f"Rego trace: {note}")
+    return True
@@ -1,137 +1,367 @@
 import json
+import logging
+import time
 from fastapi import HTTPException
-from logger import logger
-from wasm_engine import wasm_engine
+from logger import get_logger
+from wasm_engine import wasm_engine, EvaluationTimeoutError
+from instance_pool import PoolTimeoutError
+from guest_memory import read_json, cstring_at
+from guest_eval import (
+    evaluate_result_set, evaluate_with_oneshot_api, evaluate_with_context_api, _entrypoint_id, _record_stages,
+)
+from opa_abi import ABI_ONESHOT, FORMAT_JSON
+from decision_cache import decision_cache, MISS
+from json_codec import dumps
+from native_plan import NativeFallback
+from metrics import decision_seconds, stage_seconds, decisions
+import tracing
+from tracing import tracer
+from decision_log import decision_logger
+
+logger = get_logger(__name__)
+
+# Cached decisions are keyed by version; drop the outgoing version's promptly on reload
+wasm_engine.add_reload_listener(decision_cache.invalidate)
 
-# TODO: Add caching mechanism for policy evaluation results
-# FIXME: Need to handle race conditions in concurrent evaluations
 def opa_eval(input_data):
     """Evaluate OPA policy using the OPA WASM evaluation API"""
     if not wasm_engine.is_initialized():
         raise HTTPException(status_code=500, detail="OPA WASM module not initialized")
     
+    start = time.perf_counter()
+    outcome = "error"
+    input_bytes = None
+    trace = tracer.start("opa.decision", entrypoint=wasm_engine.entrypoint)
     try:
-        exports = wasm_engine.get_exports()
+        key = None
+        if decision_cache.enabled:
+            # Keyed on the input paths the policy reads, when the build recorded them;
+            # the whole input is encoded here only when it is the key itself
+            key, input_bytes = wasm_engine.cache_key(None, input_data)
+            encoded = time.perf_counter()
+            stage_seconds["encode"].observe(encoded - start)
+            if trace is not None:
+                attributes = {"bytes": len(input_bytes)} if input_bytes is not None else None
+                trace.add("encode", start, encoded, attributes)
+            cached = decision_cache.get(key) if key is not None else MISS
+            if cached is not MISS:
+                outcome = "allow" if cached else "deny"
+                if trace is not None:
+                    trace.root.attributes["cache_hit"] = True
+                return cached
         
-        # Check what evaluation functions are available
-        available_eval_funcs = [name for name in exports.keys() if 'eval' in name.lower()]
-        logger.info(f"Available evaluation functions: {available_eval_funcs}")
+        # Natively when the compiled plan is trusted, else on one pooled Store+instance
+        allowed = decision_from_result_set(
+            evaluate_result_set_on_engine(wasm_engine, input_data, input_bytes=input_bytes)
+        )
         
-        # Try different evaluation approaches
-        if "opa_eval_ctx_new" in exports and "opa_eval" in exports:
-            return evaluate_with_context_api(exports, input_data)
-        elif "eval" in exports:
-            return evaluate_with_simple_api(exports, input_data)
-        else:
-            logger.warning("No suitable evaluation function found, using fallback")
-            return evaluate_simple_policy(input_data)
+        if key is not None:
+            decision_cache.put(key, allowed)
+        outcome = "allow" if allowed else "deny"
+        return allowed
     
+    except PoolTimeoutError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except EvaluationTimeoutError as e:
+        # Fail closed; never cached, so the next request evaluates again
+        logger.warning(f"Denying after evaluation timeout: {e}")
+        return False
     except Exception as e:
         logger.error(f"Error during OPA evaluation: {e}")
+        outcome = "fallback"
         return evaluate_simple_policy(input_data)
+    finally:
+        elapsed = time.perf_counter() - start
+        decision_seconds.observe(elapsed)
+        decisions[outcome].inc()
+        if decision_logger.enabled:
+            decision_logger.log(
+                wasm_engine.entrypoint, outcome, _OUTCOME_RESULTS.get(outcome), elapsed,
+                wasm_engine.policy_version, input_bytes if input_bytes is not None else input_data,
+            )
+        if trace is not None:
+            tracer.finish(trace, outcome=outcome, policy_version=wasm_engine.policy_version or "")
 
-def evaluate_with_context_api(exports, input_data):
-    """Evaluate using the full OPA context API"""
+def opa_eval_template(template, values):
+    """opa_eval of an InputTemplate with `values` patched into its holes"""
+    if not wasm_engine.is_initialized():
+        raise HTTPException(status_code=500, detail="OPA WASM module not initialized")
+    # Bad hole names are the caller's bug (ValueError), not a reason to fall back
+    patches = template.patches(values)
+    
+    start = time.perf_counter()
+    outcome = "error"
+    trace = tracer.start("opa.decision", entrypoint=wasm_engine.entrypoint, template=True)
     try:
-        store = wasm_engine.store
-        opa_malloc = exports["opa_malloc"]
-        opa_free = exports["opa_free"]
-        opa_eval_ctx_new = exports["opa_eval_ctx_new"]
-        opa_eval_ctx_set_input = exports["opa_eval_ctx_set_input"]
-        opa_eval_func = exports["opa_eval"]
-        opa_eval_ctx_get_result = exports["opa_eval_ctx_get_result"]
-        memory_export = exports["memory"]
+        key = None
+        if decision_cache.enabled and wasm_engine.policy_version is not None:
+            # Skeleton fingerprint plus the patched values identify the input without rendering it
+            key = decision_cache.key(wasm_engine.policy_version, None, template.cache_input(patches))
+            cached = decision_cache.get(key)
+            if cached is not MISS:
+                outcome = "allow" if cached else "deny"
+                if trace is not None:
+                    trace.root.attributes["cache_hit"] = True
+                return cached
         
-        # Create evaluation context
-        ctx = opa_eval_ctx_new(store)
-        if not ctx:
-            raise RuntimeError("Failed to create evaluation context")
-        
-        # Prepare input JSON
-        input_json = json.dumps(input_data)
-        input_bytes = input_json.encode('utf-8')
-        
-        # Allocate memory for input
-        input_addr = opa_malloc(store, len(input_bytes))
-        if not input_addr:
-            raise RuntimeError("Failed to allocate memory")
+        allowed = decision_from_result_set(evaluate_template_on_engine(wasm_engine, template, patches))
         
-        try:
-            # Write input to memory
-            memory_data = memory_export.data_ptr(store)
-            memory_data[input_addr:input_addr + len(input_bytes)] = input_bytes
-            
-            # Set input and evaluate
-            opa_eval_ctx_set_input(store, ctx, input_addr)
-            opa_eval_func(store, ctx)
-            
-            # Get result
-            result_addr = opa_eval_ctx_get_result(store, ctx)
-            
-            if result_addr:
-                # Try to read and parse result
-                result_data = memory_data[result_addr:result_addr + 1000]
-                result_str = result_data.decode('utf-8', errors='ignore').rstrip('\x00')
-                logger.info(f"Raw result: {result_str[:200]}")  # Debug output
-                
-                # Parse JSON result
-                try:
-                    result_json = json.loads(result_str)
-                    # Look for the allow decision in the result
-                    if isinstance(result_json, dict):
-                        return bool(result_json.get('result', False))
-                    return bool(result_json)
-                except json.JSONDecodeError:
-                    # Fallback: look for "true" in the result string
-                    return "true" in result_str.lower()
-            
-            return False
-        
-        finally:
-            opa_free(store, input_addr)
+        if key is not None:
+            decision_cache.put(key, allowed)
+        outcome = "allow" if allowed else "deny"
+        return allowed
     
+    except PoolTimeoutError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except EvaluationTimeoutError as e:
+        logger.warning(f"Denying after evaluation timeout: {e}")
+        return False
     except Exception as e:
-        logger.error(f"Error in context API evaluation: {e}")
-        raise
+        logger.error(f"Error during OPA template evaluation: {e}")
+        outcome = "fallback"
+        return evaluate_simple_policy(template.render(values))
+    finally:
+        elapsed = time.perf_counter() - start
+        decision_seconds.observe(elapsed)
+        decisions[outcome].inc()
+        if decision_logger.enabled:
+            decision_logger.log(
+                wasm_engine.entrypoint, outcome, _OUTCOME_RESULTS.get(outcome), elapsed,
+                wasm_engine.policy_version, template.render(values) if decision_logger.include_inputs else None,
+            )
+        if trace is not None:
+            tracer.finish(trace, outcome=outcome, policy_version=wasm_engine.policy_version or "")
+
+def evaluate_on_instance(instance, input_data, entrypoint=None, input_bytes=None):
+    """Boolean decision from a checked-out instance"""
+    return decision_from_result_set(
+        evaluate_result_set(instance, input_data, entrypoint, input_bytes)
+    )
 
-def evaluate_with_simple_api(exports, input_data):
-    """Evaluate using simple eval function"""
+def evaluate_many(inputs):
+    """Boolean decisions for many inputs, in order, on one pooled instance"""
+    if not wasm_engine.is_initialized():
+        raise HTTPException(status_code=500, detail="OPA WASM module not initialized")
+    
     try:
-        store = wasm_engine.store
-        eval_func = exports["eval"]
-        opa_malloc = exports.get("opa_malloc")
-        opa_free = exports.get("opa_free")
-        memory_export = exports["memory"]
-        
-        if not opa_malloc or not opa_free:
-            logger.warning("malloc/free not available, using fallback")
-            return evaluate_simple_policy(input_data)
-        
-        # Prepare input
-        input_json = json.dumps(input_data)
-        input_bytes = input_json.encode('utf-8')
-        
-        # Allocate and write input
-        input_addr = opa_malloc(store, len(input_bytes))
-        if not input_addr:
-            return evaluate_simple_policy(input_data)
-        
+        start = time.perf_counter()
+        result_sets = evaluate_batch_on_engine(wasm_engine, inputs)
+        allowed = [decision_from_result_set(result_set) for result_set in result_sets]
+        count_decisions(result_sets)
+        if decision_logger.enabled:
+            log_decisions(wasm_engine.entrypoint, inputs, result_sets, time.perf_counter() - start,
+                          wasm_engine.policy_version)
+        return allowed
+    
+    except PoolTimeoutError as e:
+        decisions["error"].inc(len(inputs))
+        raise HTTPException(status_code=503, detail=str(e))
+    except EvaluationTimeoutError as e:
+        logger.warning(f"Denying batch after evaluation timeout: {e}")
+        decisions["error"].inc(len(inputs))
+        return [False] * len(inputs)
+    except Exception as e:
+        logger.error(f"Error during OPA batch evaluation: {e}")
+        decisions["fallback"].inc(len(inputs))
+        return [evaluate_simple_policy(input_data) for input_data in inputs]
+
+def evaluate_result_set_on_engine(engine, input_data, entrypoint=None, input_bytes=None, eval_timeout=None):
+    """OPA result set from the native plan once it is trusted, otherwise from a pooled instance"""
+    return evaluate_versioned_on_engine(engine, input_data, entrypoint, input_bytes, eval_timeout)[0]
+
+def evaluate_versioned_on_engine(engine, input_data, entrypoint=None, input_bytes=None, eval_timeout=None):
+    """(result set, version of the policy that decided it), like evaluate_result_set_on_engine"""
+    # The native plan and its version come from one snapshot, so a concurrent swap cannot mix them
+    policy = engine.current
+    native = policy.native_plans.get(entrypoint or engine.entrypoint) if policy is not None else None
+    if native is not None and native.trusted:
+        start = time.perf_counter()
         try:
-            memory_data = memory_export.data_ptr(store)
-            memory_data[input_addr:input_addr + len(input_bytes)] = input_bytes
-            
-            # Call eval function
-            result = eval_func(store, input_addr)
-            logger.info(f"Simple eval result: {result}")
-            
-            return bool(result)
+            result_set = native.evaluate(input_data)
+            tracing.record("native_eval", start, time.perf_counter())
+            return result_set, policy.version
+        except NativeFallback as e:
+            tracing.record("native_eval", start, time.perf_counter(), fallback=str(e))
+    with engine.checkout(eval_timeout=eval_timeout) as instance:
+        result_set = evaluate_result_set(instance, input_data, entrypoint, input_bytes)
+        if native is not None and native.verifying:
+            # WASM stays authoritative until the native plan has agreed with it long enough
+            native.shadow(input_data, result_set)
+    return result_set, instance.policy_version
+
+def evaluate_template_on_engine(engine, template, patches, entrypoint=None, eval_timeout=None):
+    """OPA result set for an InputTemplate and its patches from InputTemplate.patches()
+
+    Natively and on modules without opa_value_add_path the input is rendered
+    on the host; otherwise only the patched values reach the guest.
+    """
+    native = engine.native_plan(entrypoint)
+    values = {template.holes[index]: value for index, value in patches}
+    if native is not None and native.trusted:
+        return evaluate_result_set_on_engine(engine, template.render(values), entrypoint, eval_timeout=eval_timeout)
+    with engine.checkout(eval_timeout=eval_timeout) as instance:
+        if instance.abi.value_add_path is None:
+            return evaluate_result_set(instance, template.render(values), entrypoint)
+        instance.begin_evaluation()
+        result_set = evaluate_with_template_api(instance, template, patches, _entrypoint_id(instance.abi, entrypoint))
+        if native is not None and native.verifying:
+            native.shadow(template.render(values), result_set)
+    return result_set
+
+def evaluate_batch_on_engine(engine, inputs, entrypoint=None, encoded=False, eval_timeout=None):
+    """OPA result sets for many inputs, natively where possible and on one pooled instance for the rest"""
+    return evaluate_batch_versioned_on_engine(engine, inputs, entrypoint, encoded, eval_timeout)[0]
+
+def evaluate_batch_versioned_on_engine(engine, inputs, entrypoint=None, encoded=False, eval_timeout=None):
+    """(result sets, version of the policy that decided them), like evaluate_batch_on_engine"""
+    policy = engine.current
+    native = policy.native_plans.get(entrypoint or engine.entrypoint) if policy is not None else None
+    results = []
+    pending = []
+    if native is not None and native.trusted:
+        for index, item in enumerate(inputs):
+            try:
+                results.append(native.evaluate(json.loads(item) if encoded else item))
+            except NativeFallback:
+                results.append(None)
+                pending.append(index)
+        if not pending:
+            return results, policy.version
+    else:
+        results = [None] * len(inputs)
+        pending = range(len(inputs))
+    
+    with engine.checkout(eval_timeout=eval_timeout) as instance:
+        wasm_inputs = inputs if len(pending) == len(inputs) else [inputs[index] for index in pending]
+        result_sets = evaluate_batch_on_instance(instance, wasm_inputs, entrypoint, encoded)
+        if native is not None and native.verifying:
+            for item, result_set in zip(wasm_inputs, result_sets):
+                if not native.verifying:
+                    break
+                native.shadow(json.loads(item) if encoded else item, result_set)
+    for index, result_set in zip(pending, result_sets):
+        results[index] = result_set
+    return results, instance.policy_version
+
+def evaluate_with_template_api(instance, template, patches, entrypoint_id):
+    """Evaluate the instance's copy of a template with its holes patched, via the context API"""
+    store = instance.store
+    abi = instance.abi
+    value_addr, holes = instance.template_slots(template)
+    patched = []
+    try:
+        started = time.perf_counter()
+        for index, value in patches:
+            path_addr, _ = holes[index]
+            if abi.value_add_path(store, value_addr, path_addr, instance.parse_json(dumps(value))):
+                raise RuntimeError(f"opa_value_add_path failed for template hole {'.'.join(template.holes[index])}")
+            patched.append(index)
+        written = time.perf_counter()
+        
+        ctx = abi.eval_ctx_new(store)
+        if not ctx:
+            raise RuntimeError("Failed to create evaluation context")
+        abi.eval_ctx_set_input(store, ctx, value_addr)
+        abi.eval_ctx_set_data(store, ctx, instance.data_addr)
+        abi.eval_ctx_set_entrypoint(store, ctx, entrypoint_id)
+        abi.eval_ctx(store, ctx)
+        evaluated = time.perf_counter()
         
-        finally:
-            opa_free(store, input_addr)
+        result_addr = abi.eval_ctx_get_result(store, ctx)
+        result_set = read_json(instance, result_addr) if result_addr else []
+        _record_stages(started, written, evaluated)
+        return result_set
     
-    except Exception as e:
-        logger.error(f"Error in simple API evaluation: {e}")
-        return evaluate_simple_policy(input_data)
+    finally:
+        # Point the holes back at their defaults before the reset releases the patched values
+        for index in patched:
+            path_addr, default_addr = holes[index]
+            abi.value_add_path(store, value_addr, path_addr, default_addr)
+        instance.reset_heap()
+
+def evaluate_batch_on_instance(instance, inputs, entrypoint=None, encoded=False):
+    """OPA result sets for many inputs on one checked-out instance, in input order
+
+    With `encoded=True` the inputs are already JSON bytes and go to the guest as is.
+    """
+    entrypoint_id = _entrypoint_id(instance.abi, entrypoint)
+    encoded_inputs = inputs if encoded else map(dumps, inputs)
+    if instance.abi.abi_path == ABI_ONESHOT:
+        return evaluate_batch_with_oneshot_api(instance, encoded_inputs, entrypoint_id)
+    return evaluate_batch_with_context_api(instance, encoded_inputs, entrypoint_id)
+
+def evaluate_batch_with_oneshot_api(instance, encoded_inputs, entrypoint_id):
+    """Evaluate every input through opa_eval, reusing one input buffer above the heap snapshot"""
+    store = instance.store
+    abi = instance.abi
+    input_addr = instance.base_heap_ptr
+    results = []
+    try:
+        for input_bytes in encoded_inputs:
+            # Each item gets the full deadline, not what is left of the batch's
+            instance.begin_evaluation()
+            heap_ptr = instance.write_input(input_bytes, input_addr)
+            # opa_eval restarts its heap at heap_ptr, which discards the previous item's allocations
+            result_addr = abi.eval_oneshot(
+                store, 0, entrypoint_id, instance.data_addr,
+                input_addr, len(input_bytes), heap_ptr, FORMAT_JSON,
+            )
+            results.append(json.loads(cstring_at(instance.view(), result_addr)))
+        return results
+    finally:
+        instance.reset_heap()
+
+def evaluate_batch_with_context_api(instance, encoded_inputs, entrypoint_id):
+    """Evaluate every input through one eval context whose data and entrypoint are set once"""
+    store = instance.store
+    abi = instance.abi
+    results = []
+    try:
+        ctx = abi.eval_ctx_new(store)
+        if not ctx:
+            raise RuntimeError("Failed to create evaluation context")
+        abi.eval_ctx_set_data(store, ctx, instance.data_addr)
+        abi.eval_ctx_set_entrypoint(store, ctx, entrypoint_id)
+        # The context lives below this mark; each item's input and result live above it
+        batch_heap_ptr = abi.heap_ptr_get(store)
+        
+        for input_bytes in encoded_inputs:
+            # Each item gets the full deadline, not what is left of the batch's
+            instance.begin_evaluation()
+            abi.eval_ctx_set_input(store, ctx, instance.parse_input(input_bytes, batch_heap_ptr))
+            abi.eval_ctx(store, ctx)
+            result_addr = abi.eval_ctx_get_result(store, ctx)
+            results.append(read_json(instance, result_addr) if result_addr else [])
+            abi.heap_ptr_set(store, batch_heap_ptr)
+        return results
+    finally:
+        instance.reset_heap()
+
+def count_decisions(result_sets):
+    """Add result sets to the allow/deny decision counters"""
+    allowed = sum(1 for result_set in result_sets if decision_from_result_set(result_set))
+    decisions["allow"].inc(allowed)
+    decisions["deny"].inc(len(result_sets) - allowed)
+
+# Decision log result for each outcome of a boolean decision; the fallback's answer is not logged
+_OUTCOME_RESULTS = {"allow": True, "deny": False}
+
+def log_decisions(path, inputs, result_sets, seconds, version):
+    """Queue decision log records for a batch, splitting its time evenly between items"""
+    per_item = seconds / len(inputs) if inputs else 0.0
+    for input_data, result_set in zip(inputs, result_sets):
+        allowed = decision_from_result_set(result_set)
+        decision_logger.log(
+            path, "allow" if allowed else "deny", result_set[0].get("result") if result_set else None,
+            per_item, version, input_data,
+        )
+
+def decision_from_result_set(result_set):
+    """Boolean decision from an OPA result set such as [{"result": true}]"""
+    # An empty result set means the entrypoint is undefined for this input
+    if not result_set:
+        return False
+    return result_set[0].get("result") is True
 
 def evaluate_simple_policy(input_data):
     """Fallback policy evaluation implementing the Rego rule directly"""
@@ -141,7 +371,9 @@ def evaluate_simple_policy(input_data):
         # Your Rego rule: default allow = false; allow if input.user.role == "admin"
         user_role = input_data.get("user", {}).get("role", "")
         allowed = user_role == "admin"
-        logger.info(f"Fallback evaluation: user_role={user_role}, allowed={allowed}")
+        # Guarded so the f-string is never built while debug logging is off
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(f"Fallback evaluation: user_role={user_role}, allowed={allowed}")
         return allowed
     except Exception as e:
         logger.error(f"Error in fallback evaluation: {e}")
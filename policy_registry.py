@@ -0,0 +1,281 @@
+import os
+import threading
+import time
+from collections import deque
+from logger import get_logger
+from config import POLICY_DIR, POLICY_POOL_SIZE, POLICY_MEMORY_BUDGET, POLICY_ENTRYPOINT, POLICY_TIMEOUTS
+from wasm_engine import WasmEngine, PolicyNotLoadedError, wasm_engine
+from guest_eval import EntrypointNotFoundError
+from policy_evaluator import (
+    evaluate_versioned_on_engine, evaluate_batch_versioned_on_engine, count_decisions, log_decisions,
+)
+from metrics import decision_seconds, stage_seconds, decisions
+from tracing import tracer
+from decision_log import decision_logger
+from decision_cache import decision_cache, MISS
+
+logger = get_logger(__name__)
+
+
+class PolicyNotFoundError(LookupError):
+    """Raised when no registered policy serves the requested data path"""
+
+
+class PolicyStats:
+    """Evaluation count and latency for one policy"""
+
+    # Recent latencies kept for percentile estimates
+    WINDOW = 1024
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.evaluations = 0
+        self.errors = 0
+        self.total_seconds = 0.0
+        self.max_seconds = 0.0
+        self._recent = deque(maxlen=self.WINDOW)
+
+    def record(self, seconds, ok, count=1):
+        """Record `count` evaluations that took `seconds` in total"""
+        with self._lock:
+            self.evaluations += count
+            if not ok:
+                self.errors += count
+            self.total_seconds += seconds
+            # Batches contribute their per-decision mean
+            seconds /= count or 1
+            if seconds > self.max_seconds:
+                self.max_seconds = seconds
+            self._recent.append(seconds)
+
+    def snapshot(self):
+        with self._lock:
+            recent = sorted(self._recent)
+            evaluations = self.evaluations
+            snapshot = {
+                "evaluations": evaluations,
+                "errors": self.errors,
+                "mean_seconds": self.total_seconds / evaluations if evaluations else None,
+                "max_seconds": self.max_seconds,
+            }
+        for name, q in (("p50_seconds", 0.50), ("p99_seconds", 0.99)):
+            snapshot[name] = recent[min(len(recent) - 1, int(q * len(recent)))] if recent else None
+        return snapshot
+
+
+class RegisteredPolicy:
+    """A policy module known to the registry, loaded or not"""
+
+    def __init__(self, package, engine, pinned=False):
+        self.package = package
+        self.engine = engine
+        # Pinned policies (the default policy.wasm) are never evicted
+        self.pinned = pinned
+        self.stats = PolicyStats()
+        self.last_used = 0.0
+        self.load_lock = threading.Lock()
+
+
+class PolicyRegistry:
+    """Many policy modules, each with its own instance pool, routed by package path"""
+
+    def __init__(self, policy_dir=POLICY_DIR, memory_budget=POLICY_MEMORY_BUDGET,
+                 pool_size=POLICY_POOL_SIZE):
+        self.policy_dir = policy_dir
+        self.memory_budget = memory_budget
+        self.pool_size = pool_size
+        self._policies = {}
+        self._lock = threading.Lock()
+
+    def register(self, package, engine, pinned=False):
+        """Serve `package` (e.g. "authz/rbac") from an engine"""
+        if package in POLICY_TIMEOUTS:
+            engine.eval_timeout = POLICY_TIMEOUTS[package]
+        with self._lock:
+            self._policies[package] = RegisteredPolicy(package, engine, pinned)
+        engine.add_reload_listener(decision_cache.invalidate)
+
+    def discover(self):
+        """Register every <package>.wasm (with optional .data.json / .input_paths.json / .native_plan.json) without compiling it"""
+        if not os.path.isdir(self.policy_dir):
+            return
+        for root, _, files in os.walk(self.policy_dir):
+            for name in files:
+                if not name.endswith(".wasm"):
+                    continue
+                path = os.path.join(root, name)
+                package = os.path.relpath(path, self.policy_dir)[:-len(".wasm")].replace(os.sep, "/")
+                if package not in self._policies:
+                    stem = path[:-len(".wasm")]
+                    engine = WasmEngine(
+                        path, self.pool_size, lazy=True, entrypoint=None,
+                        data_path=stem + ".data.json", input_paths_path=stem + ".input_paths.json",
+                        native_plan_path=stem + ".native_plan.json",
+                    )
+                    self.register(package, engine)
+                    logger.info(f"Registered policy {package} from {path}")
+
+    def resolve(self, path):
+        """Map "authz/rbac/allow" to its policy (longest package prefix) and entrypoint"""
+        entrypoint = path.strip("/")
+        parts = entrypoint.split("/")
+        for i in range(len(parts) - 1, 0, -1):
+            policy = self._policies.get("/".join(parts[:i]))
+            if policy is not None:
+                return policy, entrypoint
+        raise PolicyNotFoundError(f"No policy serves data path '{entrypoint}'")
+
+    def evaluate(self, path, input_data, eval_timeout=None):
+        """Evaluate the rule at `path` and return its OPA result set"""
+        return self.evaluate_versioned(path, input_data, eval_timeout)[0]
+
+    def evaluate_versioned(self, path, input_data, eval_timeout=None):
+        """(OPA result set, version of the policy that decided it) for the rule at `path`"""
+        policy, entrypoint = self.resolve(path)
+        start = time.perf_counter()
+        ok = False
+        cache_hit = False
+        version = None
+        trace = None
+        input_bytes = None
+        try:
+            trace = tracer.start("opa.decision", entrypoint=entrypoint, policy=policy.package)
+            # Cold policies have no version yet, so they skip the cache until loaded;
+            # the whole input is encoded here only when it is the key itself
+            key = None
+            if decision_cache.enabled:
+                key, input_bytes = policy.engine.cache_key(entrypoint, input_data)
+                encoded = time.perf_counter()
+                stage_seconds["encode"].observe(encoded - start)
+                if trace is not None:
+                    attributes = {"bytes": len(input_bytes)} if input_bytes is not None else None
+                    trace.add("encode", start, encoded, attributes)
+            if key is not None:
+                result_set = decision_cache.get(key)
+                if result_set is not MISS:
+                    # Keys carry the version that decided them
+                    ok, cache_hit, version = True, True, key[0]
+                    count_decisions([result_set])
+                    return result_set, version
+            # Retry once if the policy was evicted between loading and checkout
+            for _ in range(2):
+                self._ensure_loaded(policy)
+                try:
+                    result_set, version = evaluate_versioned_on_engine(
+                        policy.engine, input_data, entrypoint, input_bytes, eval_timeout
+                    )
+                    ok = True
+                    # A reload between the key and the evaluation must not file this under the old version
+                    if key is not None and key[0] == version:
+                        decision_cache.put(key, result_set)
+                    count_decisions([result_set])
+                    return result_set, version
+                except PolicyNotLoadedError:
+                    continue
+                except EntrypointNotFoundError:
+                    # Only the entrypoint lookup; other KeyErrors are evaluation failures, not 404s
+                    raise PolicyNotFoundError(
+                        f"Policy {policy.package} has no entrypoint '{entrypoint}'"
+                    )
+            raise PolicyNotLoadedError(f"Policy {policy.package} was evicted during evaluation")
+        finally:
+            elapsed = time.perf_counter() - start
+            policy.stats.record(elapsed, ok)
+            decision_seconds.observe(elapsed)
+            if not ok:
+                decisions["error"].inc()
+                version = policy.engine.policy_version
+            if decision_logger.enabled:
+                if ok:
+                    log_decisions(path, [input_bytes], [result_set], elapsed, version)
+                else:
+                    decision_logger.log(path, "error", None, elapsed, version, input_bytes)
+            if trace is not None:
+                if cache_hit:
+                    trace.root.attributes["cache_hit"] = True
+                tracer.finish(trace, ok=ok, policy_version=version or "")
+
+    def evaluate_many(self, path, inputs, encoded=False, eval_timeout=None):
+        """Evaluate the rule at `path` for every input on one instance; result sets in order"""
+        return self.evaluate_many_versioned(path, inputs, encoded, eval_timeout)[0]
+
+    def evaluate_many_versioned(self, path, inputs, encoded=False, eval_timeout=None):
+        """(result sets in order, version of the policy that decided them) for the rule at `path`"""
+        policy, entrypoint = self.resolve(path)
+        start = time.perf_counter()
+        ok = False
+        try:
+            for _ in range(2):
+                self._ensure_loaded(policy)
+                try:
+                    result_sets, version = evaluate_batch_versioned_on_engine(
+                        policy.engine, inputs, entrypoint, encoded, eval_timeout
+                    )
+                    ok = True
+                    count_decisions(result_sets)
+                    if decision_logger.enabled:
+                        log_decisions(path, inputs, result_sets, time.perf_counter() - start, version)
+                    return result_sets, version
+                except PolicyNotLoadedError:
+                    continue
+                except EntrypointNotFoundError:
+                    # Only the entrypoint lookup; other KeyErrors are evaluation failures, not 404s
+                    raise PolicyNotFoundError(
+                        f"Policy {policy.package} has no entrypoint '{entrypoint}'"
+                    )
+            raise PolicyNotLoadedError(f"Policy {policy.package} was evicted during evaluation")
+        finally:
+            policy.stats.record(time.perf_counter() - start, ok, len(inputs))
+            if not ok:
+                decisions["error"].inc(len(inputs))
+
+    def _ensure_loaded(self, policy):
+        """Compile a cold policy on first use, then evict others if over budget"""
+        policy.last_used = time.monotonic()
+        if policy.engine.is_initialized():
+            return
+        with policy.load_lock:
+            if not policy.engine.is_initialized():
+                policy.engine.reload()
+                logger.info(f"Loaded policy {policy.package} ({policy.engine.policy_version})")
+        self._enforce_budget(keep=policy)
+
+    def _enforce_budget(self, keep):
+        """Unload least recently used, unpinned policies until under the memory budget"""
+        with self._lock:
+            loaded = [p for p in self._policies.values() if p.engine.is_initialized()]
+        total = sum(p.engine.memory_bytes() for p in loaded)
+        candidates = sorted(
+            (p for p in loaded if not p.pinned and p is not keep), key=lambda p: p.last_used
+        )
+        for victim in candidates:
+            if total <= self.memory_budget:
+                break
+            freed = victim.engine.memory_bytes()
+            # Detached now, drained in the background: the request that loaded `keep`
+            # must not wait out the victim's in-flight evaluations
+            victim.engine.unload(wait=False)
+            total -= freed
+            logger.info(f"Evicted cold policy {victim.package}, freed {freed} bytes")
+
+    def stats(self):
+        """Per-policy load state, memory and latency"""
+        with self._lock:
+            policies = list(self._policies.values())
+        return {
+            p.package: {
+                "loaded": p.engine.is_initialized(),
+                "pinned": p.pinned,
+                "version": p.engine.policy_version,
+                "memory_bytes": p.engine.memory_bytes(),
+                "pool": p.engine.get_stats(),
+                **p.stats.snapshot(),
+            }
+            for p in policies
+        }
+
+
+# Create a singleton registry; the default policy serves the package of POLICY_ENTRYPOINT
+policy_registry = PolicyRegistry()
+policy_registry.register(POLICY_ENTRYPOINT.rsplit("/", 1)[0], wasm_engine, pinned=True)
+policy_registry.discover()
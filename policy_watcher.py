@@ -0,0 +1,129 @@
+import os
+import shutil
+import tarfile
+import tempfile
+import threading
+from logger import get_logger
+from config import POLICY_WASM_PATH, POLICY_DATA_PATH, POLICY_BUNDLE_PATH, POLICY_WATCH_INTERVAL
+
+logger = get_logger(__name__)
+
+
+def _signature(path):
+    """(mtime, size) of a file, or None if it does not exist"""
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return (st.st_mtime_ns, st.st_size)
+
+
+def extract_bundle(bundle_path, dest_dir):
+    """Extract policy.wasm and data.json from an OPA bundle into dest_dir
+
+    Returns (wasm_path, data_path); data_path is None when the bundle has no data.
+    """
+    wanted = {"policy.wasm": None, "data.json": None}
+    with tarfile.open(bundle_path, "r:gz") as tar:
+        for member in tar.getmembers():
+            name = member.name.lstrip("./")
+            # Only top-level files; nested data.json files belong to other data paths
+            if member.isfile() and name in wanted:
+                dest = os.path.join(dest_dir, name)
+                with tar.extractfile(member) as src, open(dest, "wb") as out:
+                    shutil.copyfileobj(src, out)
+                wanted[name] = dest
+    if wanted["policy.wasm"] is None:
+        raise RuntimeError(f"No policy.wasm found in bundle {bundle_path}")
+    return wanted["policy.wasm"], wanted["data.json"]
+
+
+class PolicyWatcher:
+    """Polls the policy files and hot-swaps the engine when they change"""
+
+    def __init__(self, engine, wasm_path=POLICY_WASM_PATH, data_path=POLICY_DATA_PATH,
+                 bundle_path=POLICY_BUNDLE_PATH, interval=POLICY_WATCH_INTERVAL):
+        self.engine = engine
+        self.wasm_path = wasm_path
+        self.data_path = data_path
+        self.bundle_path = bundle_path
+        self.interval = interval
+        # Analysis files the engine reads next to the policy; a rebuild may change only these
+        self._sidecars = tuple(path for path in (engine.input_paths_path, engine.native_plan_path) if path)
+        self._watched = (wasm_path, data_path, bundle_path) + self._sidecars
+        self._seen = {path: _signature(path) for path in self._watched}
+        # Changed files wait one extra poll so half-written builds are never loaded
+        self._pending = {}
+        # Extracted bundle contents stay on disk while their policy serves, since
+        # replacement instances re-read data.json from there
+        self._bundle_dir = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """Start the background polling thread (no-op when the interval is 0)"""
+        if self.interval <= 0 or self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name="policy-watcher", daemon=True)
+        self._thread.start()
+        logger.info(f"Watching {', '.join(self._watched)} every {self.interval}s")
+
+    def stop(self):
+        """Stop polling and wait for an in-progress reload to finish"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.poll()
+
+    def poll(self):
+        """Check each file once and reload from any that changed and then settled"""
+        for path in self._watched:
+            signature = _signature(path)
+            if signature == self._seen[path]:
+                self._pending.pop(path, None)
+                continue
+            if signature is None:
+                # Removed mid-build; wait for it to reappear
+                continue
+            if self._pending.get(path) != signature:
+                self._pending[path] = signature
+                continue
+
+            self._seen[path] = signature
+            del self._pending[path]
+            self._reload_from(path)
+
+    def _reload_from(self, path):
+        try:
+            if path == self.bundle_path:
+                self._reload_from_bundle(path)
+            elif path in self._sidecars and self.engine.current is not None:
+                # Re-read alongside whatever policy serves now, bundle extraction included
+                current = self.engine.current
+                self.engine.reload(current.wasm_path, current.data_path)
+            else:
+                # policy.wasm or data.json changed; the engine re-reads both
+                self.engine.reload(self.wasm_path, self.data_path)
+        except Exception as e:
+            logger.error(
+                f"❌ Policy reload from {path} failed, still serving "
+                f"{self.engine.policy_version}: {e}"
+            )
+
+    def _reload_from_bundle(self, path):
+        bundle_dir = tempfile.mkdtemp(prefix="opa-bundle-")
+        swapped = False
+        try:
+            wasm_path, data_path = extract_bundle(path, bundle_dir)
+            swapped = self.engine.reload(wasm_path, data_path or self.data_path)
+        finally:
+            # Keep whichever extraction the engine now serves from
+            stale = self._bundle_dir if swapped else bundle_dir
+            if swapped:
+                self._bundle_dir = bundle_dir
+            if stale:
+                shutil.rmtree(stale, ignore_errors=True)
@@ -0,0 +1,200 @@
+import multiprocessing
+import os
+import shutil
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from logger import get_logger
+import config
+from config import PROCESS_POOL_WORKERS, PROCESS_POOL_CHUNK_SIZE, POLICY_ENTRYPOINT
+from json_codec import dumps
+
+logger = get_logger(__name__)
+
+# Set in each worker process by _init_worker
+_worker_registry = None
+
+# Policy versions whose files stay staged for workers still catching up to a reload
+_STAGED_VERSIONS = 3
+
+
+def _init_worker():
+    """Build the worker's own policy registry from the compiled-module cache"""
+    # Only helps when nothing imported the singletons yet; under spawn the parent's
+    # main module is re-imported first and usually has, with the parent's config.
+    # The engine singleton stays unloaded either way (OPA_PROCESS_POOL_WORKER)
+    config.INSTANCE_POOL_SIZE = 1
+    config.DECISION_LOG_PATH = ""
+    from decision_log import decision_logger
+    from wasm_engine import WasmEngine
+    from policy_registry import PolicyRegistry
+    # The parent logs every decision it hands out, so workers must not write the same file
+    decision_logger.shutdown()
+    # A worker evaluates one chunk at a time, so one instance per policy is enough
+    registry = PolicyRegistry(pool_size=1)
+    registry.register(POLICY_ENTRYPOINT.rsplit("/", 1)[0], WasmEngine(pool_size=1, lazy=True), pinned=True)
+    registry.discover()
+    global _worker_registry
+    _worker_registry = registry
+
+
+def _evaluate_chunk(path, serving, encoded_inputs, eval_timeout):
+    """Worker side: evaluate one chunk of pre-encoded inputs"""
+    policy, _ = _worker_registry.resolve(path)
+    if serving is not None:
+        # Follow the parent's hot reloads; a no-op once the versions match
+        version, wasm_path, data_path = serving
+        if policy.engine.policy_version != version:
+            policy.engine.reload(wasm_path, data_path)
+    return _worker_registry.evaluate_many(
+        path, encoded_inputs, encoded=True, eval_timeout=eval_timeout
+    )
+
+
+class ProcessPoolBackend:
+    """Shards batch evaluations across worker processes, each owning its own engines
+
+    Sidesteps the GIL for bulk workloads where JSON marshalling on the host
+    dominates. Workers start on first use and load policies from the module
+    cache the parent already populated.
+    """
+
+    def __init__(self, workers=PROCESS_POOL_WORKERS, chunk_size=PROCESS_POOL_CHUNK_SIZE):
+        self.workers = workers
+        self.chunk_size = chunk_size
+        self._executor = None
+        self._lock = threading.Lock()
+        # Policy version -> (wasm_path, data_path) staged for the workers, oldest first
+        self._staged = OrderedDict()
+        self._stage_dir = None
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                # Inherited by every worker: their engine singleton must not load the policy
+                # the parent serves, only to be replaced by the worker's own registry
+                os.environ["OPA_PROCESS_POOL_WORKER"] = "1"
+                # spawn: wasmtime engines and their threads do not survive fork
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=_init_worker,
+                )
+                logger.info(f"Started process pool backend with {self.workers} workers")
+            return self._executor
+
+    def iter_evaluate(self, path, inputs, eval_timeout=None):
+        """Yield result sets in input order as each chunk comes back from its worker"""
+        return self._iter_evaluate(path, inputs, eval_timeout, self._serving(path))
+
+    def _iter_evaluate(self, path, inputs, eval_timeout, serving):
+        from decision_log import decision_logger
+        from policy_evaluator import log_decisions
+        executor = self._get_executor()
+        submitted = time.perf_counter()
+        chunks = []
+        futures = []
+        for start in range(0, len(inputs), self.chunk_size):
+            # Shipped as compact JSON bytes, which pickle far faster than nested dicts
+            chunk = [dumps(item) for item in inputs[start:start + self.chunk_size]]
+            chunks.append(chunk)
+            futures.append(executor.submit(_evaluate_chunk, path, serving, chunk, eval_timeout))
+        try:
+            for chunk, future in zip(chunks, futures):
+                result_sets = future.result()
+                if decision_logger.enabled:
+                    log_decisions(path, chunk, result_sets, time.perf_counter() - submitted,
+                                  serving[0] if serving else None)
+                yield from result_sets
+        finally:
+            for future in futures:
+                future.cancel()
+
+    def evaluate_many(self, path, inputs, eval_timeout=None):
+        """Result sets for every input, in order"""
+        return list(self.iter_evaluate(path, inputs, eval_timeout))
+
+    def evaluate_many_versioned(self, path, inputs, eval_timeout=None):
+        """(result sets in order, version the workers were told to serve)"""
+        serving = self._serving(path)
+        result_sets = list(self._iter_evaluate(path, inputs, eval_timeout, serving))
+        return result_sets, serving[0] if serving else None
+
+    def shutdown(self):
+        """Stop the worker processes; the next call starts fresh ones"""
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True, cancel_futures=True)
+            logger.info("Stopped process pool backend")
+        with self._lock:
+            stage_dir, self._stage_dir = self._stage_dir, None
+            self._staged.clear()
+        if stage_dir is not None:
+            shutil.rmtree(stage_dir, ignore_errors=True)
+
+    def _serving(self, path):
+        """(version, wasm_path, data_path) the parent serves for `path`, if loaded"""
+        # Imported here, not at the top: workers import this module before _init_worker
+        # has sized their pools
+        from policy_registry import policy_registry
+        policy, _ = policy_registry.resolve(path)
+        for _ in range(2):
+            current = policy.engine.current
+            if current is None:
+                return None
+            try:
+                return (current.version, *self._stage(current))
+            except FileNotFoundError:
+                # Swapped out and its bundle extraction removed since the read; stage the new one
+                continue
+        raise RuntimeError(f"Policy files for {path} kept changing while staging them for workers")
+
+    def _stage(self, current):
+        """Paths the workers can reload `current` from for as long as they may need it
+
+        The parent may serve from an extracted bundle that the policy watcher
+        deletes on the next swap, while chunks stamped with that version are
+        still queued. Workers get hard links to the files (copies across
+        filesystems) under a directory this backend owns instead.
+        """
+        with self._lock:
+            staged = self._staged.get(current.version)
+            if staged is not None:
+                return staged
+            if self._stage_dir is None:
+                self._stage_dir = tempfile.mkdtemp(prefix="opa-workers-")
+            directory = os.path.join(self._stage_dir, current.version)
+            os.makedirs(directory, exist_ok=True)
+            staged = (
+                _link_or_copy(current.wasm_path, directory),
+                _link_or_copy(current.data_path, directory) if _exists(current.data_path) else None,
+            )
+            self._staged[current.version] = staged
+            while len(self._staged) > _STAGED_VERSIONS:
+                version, _ = self._staged.popitem(last=False)
+                shutil.rmtree(os.path.join(self._stage_dir, version), ignore_errors=True)
+            return staged
+
+
+def _exists(path):
+    return bool(path) and os.path.exists(path)
+
+
+def _link_or_copy(path, directory):
+    """Hard link `path` into `directory`, copying when it lives on another filesystem"""
+    dest = os.path.join(directory, os.path.basename(path))
+    if not os.path.exists(dest):
+        try:
+            os.link(path, dest)
+        except FileNotFoundError:
+            raise
+        except OSError:
+            shutil.copyfile(path, dest)
+    return dest
+
+
+# Create a singleton backend; no processes exist until it is first used
+process_backend = ProcessPoolBackend()
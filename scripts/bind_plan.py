@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+"""
+Bind an OPA IR plan to the policy.wasm built from the same sources
+
+`opa build -t plan` writes plan.json into its bundle. The service compiles the
+plans that stay within its supported subset into Python and serves them after
+they agree with WASM, but only when the plan was built alongside the exact
+policy.wasm being loaded; this records that pairing.
+
+Usage:
+    python3 scripts/bind_plan.py policy.wasm plan_bundle.tar.gz -o native_plan.json
+"""
+
+import argparse
+import hashlib
+import json
+import sys
+import tarfile
+
+
+def sha256_file(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def read_plan(path):
+    """plan.json from an opa build bundle, or a bare plan.json"""
+    if not tarfile.is_tarfile(path):
+        with open(path) as f:
+            return json.load(f)
+    with tarfile.open(path) as bundle:
+        for member in bundle.getmembers():
+            if member.name.lstrip("/") == "plan.json":
+                return json.load(bundle.extractfile(member))
+    raise SystemExit(f"❌ {path} has no plan.json")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("wasm", help="policy.wasm built from the same sources and entrypoints")
+    parser.add_argument("plan", help="bundle from opa build -t plan, or its plan.json")
+    parser.add_argument("-o", "--output", default="native_plan.json")
+    args = parser.parse_args()
+
+    plan = read_plan(args.plan)
+    doc = {
+        # The service ignores the plan for any other policy.wasm
+        "wasm_sha256": sha256_file(args.wasm),
+        "plan": plan,
+    }
+    with open(args.output, "w") as f:
+        json.dump(doc, f)
+    names = [p["name"] for p in (plan.get("plans") or {}).get("plans") or []]
+    print(f"✅ Wrote plans for {', '.join(names) or 'no entrypoints'} to {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
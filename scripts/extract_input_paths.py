@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+Record which input.* paths a policy reads, for projection-based decision cache keys
+
+Scans the Rego sources for references to `input` and writes, per entrypoint,
+the paths a decision can depend on. The service keys its decision cache on
+the input projected onto these paths, so fields the policy never reads (a
+request's `resource`, say) do not fragment the cache.
+
+The analysis is conservative:
+  * dynamic segments (input.items[i], input.user[_]) stop the path there, so
+    the whole subtree is kept
+  * a bare `input` (import input, `with input as`, `x := input`) disables
+    projection for the build
+  * every entrypoint gets the union of the paths read by all the sources, since
+    rules may call each other
+
+Usage:
+    python3 scripts/extract_input_paths.py policy.wasm example.rego -e authz/allow -o input_paths.json
+"""
+
+import argparse
+import hashlib
+import json
+import re
+import sys
+
+# Comments and string literals are skipped so `input` inside them is ignored
+_TOKEN = re.compile(
+    r'(?P<comment>#[^\n]*)'
+    r'|(?P<string>"(?:[^"\\\n]|\\.)*"|`[^`]*`)'
+    r'|(?<![\w.])input(?!\w)(?P<ref>(?:\s*\.\s*[A-Za-z_]\w*|\s*\[\s*"(?:[^"\\\n]|\\.)*"\s*\])*)'
+)
+_SEGMENT = re.compile(r'\.\s*(?P<field>[A-Za-z_]\w*)|\[\s*(?P<key>"(?:[^"\\\n]|\\.)*")\s*\]')
+
+
+def input_paths(source):
+    """Paths under `input` referenced by one Rego source, or None if it reads input whole"""
+    paths = set()
+    for match in _TOKEN.finditer(source):
+        ref = match.group("ref")
+        if ref is None:
+            continue
+        path = tuple(
+            seg.group("field") or json.loads(seg.group("key"))
+            for seg in _SEGMENT.finditer(ref)
+        )
+        if not path:
+            return None
+        paths.add(path)
+    return paths
+
+
+def sha256_file(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("wasm", help="policy.wasm the sources were compiled into")
+    parser.add_argument("sources", nargs="+", help="Rego source files")
+    parser.add_argument("-e", "--entrypoint", action="append", required=True,
+                        help="entrypoint passed to opa build (repeatable)")
+    parser.add_argument("-o", "--output", default="input_paths.json")
+    args = parser.parse_args()
+
+    paths = set()
+    for source in args.sources:
+        with open(source) as f:
+            found = input_paths(f.read())
+        if found is None:
+            print(f"⚠️  {source} reads input as a whole; cache keys will use the full input")
+            paths = None
+            break
+        paths |= found
+
+    listed = None if paths is None else [list(p) for p in sorted(paths)]
+    doc = {
+        # Ties the analysis to one build; the service ignores it for any other policy.wasm
+        "wasm_sha256": sha256_file(args.wasm),
+        "entrypoints": {entrypoint: listed for entrypoint in args.entrypoint},
+    }
+    with open(args.output, "w") as f:
+        json.dump(doc, f, indent=2)
+    print(f"✅ Wrote input paths for {', '.join(args.entrypoint)} to {args.output}: {listed}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
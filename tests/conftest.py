@@ -0,0 +1,29 @@
+import hashlib
+import json
+import os
+import sys
+from pathlib import Path
+
+import pytest
+
+# Tests compile fixture modules fresh; never read or write the shared module cache
+os.environ.setdefault("OPA_MODULE_CACHE_DIR", "")
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+FIXTURES = Path(__file__).resolve().parent / "fixtures"
+
+
+@pytest.fixture
+def admin_policy(tmp_path):
+    """policy.wasm and native_plan.json for fixtures/admin_policy.rego, as build_policy.sh lays them out"""
+    import wasmtime
+
+    wasm = wasmtime.wat2wasm((FIXTURES / "admin_policy.wat").read_text())
+    wasm_path = tmp_path / "policy.wasm"
+    wasm_path.write_bytes(wasm)
+    plan_path = tmp_path / "native_plan.json"
+    plan_path.write_text(json.dumps({
+        "wasm_sha256": hashlib.sha256(wasm).hexdigest(),
+        "plan": json.loads((FIXTURES / "admin_plan.json").read_text()),
+    }))
+    return wasm_path, plan_path
@@ -0,0 +1,85 @@
+;; Hand-written stand-in for `opa build -t wasm` of admin_policy.rego, so the
+;; tests need no OPA toolchain. It speaks the OPA WASM ABI 1.2 subset the engine
+;; uses; values are [pointer, length] pairs over their JSON text, and
+;; data.authz.allow is true exactly when the input's JSON is "admin".
+(module
+ (import "env" "memory" (memory 2))
+ (import "env" "opa_abort" (func $abort (param i32)))
+ (import "env" "opa_println" (func $println (param i32)))
+ (import "env" "opa_builtin0" (func $b0 (param i32 i32) (result i32)))
+ (import "env" "opa_builtin1" (func $b1 (param i32 i32 i32) (result i32)))
+ (import "env" "opa_builtin2" (func $b2 (param i32 i32 i32 i32) (result i32)))
+ (import "env" "opa_builtin3" (func $b3 (param i32 i32 i32 i32 i32) (result i32)))
+ (import "env" "opa_builtin4" (func $b4 (param i32 i32 i32 i32 i32 i32) (result i32)))
+ (global $heap (mut i32) (i32.const 4096))
+ (global (export "opa_wasm_abi_version") i32 (i32.const 1))
+ (global (export "opa_wasm_abi_minor_version") i32 (i32.const 2))
+ (data (i32.const 16) "{\22authz/allow\22:0}")
+ (data (i32.const 64) "[{\22result\22:true}]")
+ (data (i32.const 96) "[{\22result\22:false}]")
+ (data (i32.const 128) "{}")
+ (data (i32.const 136) "\22admin\22")
+ (func $malloc (export "opa_malloc") (param $n i32) (result i32)
+   (local $p i32)
+   (local.set $p (global.get $heap))
+   (global.set $heap (i32.add (global.get $heap) (i32.and (i32.add (local.get $n) (i32.const 7)) (i32.const -8))))
+   (block $ok
+     (br_if $ok (i32.le_u (global.get $heap) (i32.mul (memory.size) (i32.const 65536))))
+     (drop (memory.grow (i32.add (i32.div_u (i32.sub (global.get $heap) (i32.mul (memory.size) (i32.const 65536))) (i32.const 65536)) (i32.const 1)))))
+   (local.get $p))
+ (func (export "opa_free") (param i32))
+ (func (export "opa_heap_ptr_get") (result i32) (global.get $heap))
+ (func (export "opa_heap_ptr_set") (param i32) (global.set $heap (local.get 0)))
+ (func $mkval (param $p i32) (param $n i32) (result i32)
+   (local $v i32)
+   (local.set $v (call $malloc (i32.const 8)))
+   (i32.store (local.get $v) (local.get $p))
+   (i32.store offset=4 (local.get $v) (local.get $n))
+   (local.get $v))
+ (func (export "opa_json_parse") (param $p i32) (param $n i32) (result i32)
+   (local $c i32)
+   (local.set $c (call $malloc (local.get $n)))
+   (memory.copy (local.get $c) (local.get $p) (local.get $n))
+   (call $mkval (local.get $c) (local.get $n)))
+ (func (export "opa_value_parse") (param $p i32) (param $n i32) (result i32)
+   (call $mkval (local.get $p) (local.get $n)))
+ (func $dump (export "opa_json_dump") (param $v i32) (result i32)
+   (local $n i32) (local $d i32)
+   (local.set $n (i32.load offset=4 (local.get $v)))
+   (local.set $d (call $malloc (i32.add (local.get $n) (i32.const 1))))
+   (memory.copy (local.get $d) (i32.load (local.get $v)) (local.get $n))
+   (i32.store8 (i32.add (local.get $d) (local.get $n)) (i32.const 0))
+   (local.get $d))
+ (func (export "entrypoints") (result i32) (call $mkval (i32.const 16) (i32.const 17)))
+ (func (export "builtins") (result i32) (call $mkval (i32.const 128) (i32.const 2)))
+ ;; input == "admin": the JSON text is exactly the 7 bytes at 136
+ (func $is_admin (param $p i32) (param $n i32) (result i32)
+   (local $i i32)
+   (if (i32.ne (local.get $n) (i32.const 7)) (then (return (i32.const 0))))
+   (block $done
+     (loop $l
+       (br_if $done (i32.eq (local.get $i) (i32.const 7)))
+       (if (i32.ne (i32.load8_u (i32.add (local.get $p) (local.get $i)))
+                   (i32.load8_u (i32.add (i32.const 136) (local.get $i))))
+         (then (return (i32.const 0))))
+       (local.set $i (i32.add (local.get $i) (i32.const 1)))
+       (br $l)))
+   (i32.const 1))
+ (func $result (param $p i32) (param $n i32) (result i32)
+   (if (result i32) (call $is_admin (local.get $p) (local.get $n))
+     (then (call $mkval (i32.const 64) (i32.const 17)))
+     (else (call $mkval (i32.const 96) (i32.const 18)))))
+ (func (export "opa_eval_ctx_new") (result i32) (call $malloc (i32.const 16)))
+ (func (export "opa_eval_ctx_set_input") (param $c i32) (param $v i32) (i32.store (local.get $c) (local.get $v)))
+ (func (export "opa_eval_ctx_set_data") (param $c i32) (param $v i32) (i32.store offset=4 (local.get $c) (local.get $v)))
+ (func (export "opa_eval_ctx_set_entrypoint") (param $c i32) (param $e i32) (i32.store offset=8 (local.get $c) (local.get $e)))
+ (func (export "opa_eval_ctx_get_result") (param $c i32) (result i32) (i32.load offset=12 (local.get $c)))
+ (func (export "eval") (param $c i32) (result i32)
+   (local $v i32)
+   (local.set $v (i32.load (local.get $c)))
+   (i32.store offset=12 (local.get $c) (call $result (i32.load (local.get $v)) (i32.load offset=4 (local.get $v))))
+   (i32.const 0))
+ (func (export "opa_eval") (param i32 i32 i32) (param $in i32) (param $n i32) (param $h i32) (param i32) (result i32)
+   (global.set $heap (local.get $h))
+   (call $dump (call $result (local.get $in) (local.get $n))))
+)
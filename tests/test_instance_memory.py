@@ -0,0 +1,49 @@
+import json
+
+import pytest
+import wasmtime
+
+from guest_eval import evaluate_result_set
+from wasm_engine import WasmEngine, _recycle_reason
+
+ENTRYPOINT = "authz/allow"
+HEADROOM = 256 * 1024
+
+
+@pytest.fixture
+def large_data_engine(admin_policy, tmp_path, monkeypatch):
+    """An engine whose data.json alone is several times the watermark and the limit"""
+    monkeypatch.setattr("wasm_engine.INSTANCE_MEMORY_HIGH_WATERMARK", HEADROOM)
+    monkeypatch.setattr("wasm_engine.INSTANCE_MEMORY_LIMIT", 2 * HEADROOM)
+    data_path = tmp_path / "data.json"
+    data_path.write_text(json.dumps({"users": ["x" * 64] * (16 * HEADROOM // 64)}))
+    wasm_path, _ = admin_policy
+    engine = WasmEngine(
+        str(wasm_path), 1, entrypoint=ENTRYPOINT, data_path=str(data_path),
+        input_paths_path=None, native_plan_path=None,
+    )
+    yield engine
+    engine.unload()
+
+
+def test_data_larger_than_limits_loads_and_serves(large_data_engine):
+    assert large_data_engine.is_initialized()
+    with large_data_engine.checkout() as instance:
+        assert instance.initial_memory_bytes > 8 * HEADROOM
+        assert evaluate_result_set(instance, "admin", ENTRYPOINT) == [{"result": True}]
+        instance.memory_bytes = instance.memory.data_len(instance.store)
+        assert _recycle_reason(instance) is None
+
+
+def test_growth_past_watermark_recycles(large_data_engine):
+    with large_data_engine.checkout() as instance:
+        instance.memory_bytes = instance.initial_memory_bytes + HEADROOM + 1
+        assert _recycle_reason(instance) == "memory"
+        instance.memory_bytes = instance.initial_memory_bytes
+
+
+def test_limit_bounds_growth_after_load(large_data_engine):
+    with large_data_engine.checkout() as instance:
+        # The host-side grow for the input buffer is refused past the limit
+        with pytest.raises(wasmtime.WasmtimeError):
+            evaluate_result_set(instance, "x" * (4 * HEADROOM), ENTRYPOINT)
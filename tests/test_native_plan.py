@@ -0,0 +1,80 @@
+import pytest
+import wasmtime
+
+from guest_eval import evaluate_result_set
+from native_plan import DISABLED, TRUSTED, VERIFYING, NativeFallback, same_result
+from wasm_engine import WasmEngine
+
+ENTRYPOINT = "authz/allow"
+
+INPUTS = [
+    "admin", "Admin", "admin ", "", {}, [], None, True, False, 0, 1, 1.0,
+    ["admin"], {"user": "admin"}, {"admin": True}, "é", 2 ** 53,
+]
+
+
+@pytest.fixture
+def engine(admin_policy):
+    wasm_path, plan_path = admin_policy
+    engine = WasmEngine(
+        str(wasm_path), 1, entrypoint=ENTRYPOINT, data_path=None,
+        input_paths_path=None, native_plan_path=str(plan_path),
+    )
+    yield engine
+    engine.unload()
+
+
+def test_probes_verified_at_load(engine):
+    plan = engine.native_plan()
+    assert plan is not None
+    assert plan.state == VERIFYING
+    assert plan.agreed == len(plan.probes)
+
+
+def test_trusted_at_load_when_probes_suffice(admin_policy, monkeypatch):
+    monkeypatch.setattr("wasm_engine.NATIVE_VERIFY_SAMPLES", 1)
+    wasm_path, plan_path = admin_policy
+    engine = WasmEngine(
+        str(wasm_path), 1, entrypoint=ENTRYPOINT, data_path=None,
+        input_paths_path=None, native_plan_path=str(plan_path),
+    )
+    try:
+        assert engine.native_plan().state == TRUSTED
+    finally:
+        engine.unload()
+
+
+def test_plan_matches_wasm(engine):
+    plan = engine.native_plan()
+    instance = engine.current.pool.acquire()
+    try:
+        for value in INPUTS + plan.probes:
+            instance.arm_deadline(engine.eval_timeout)
+            want = evaluate_result_set(instance, value, ENTRYPOINT)
+            try:
+                got = plan.evaluate(value)
+            except NativeFallback:
+                continue
+            assert same_result(got, want), value
+            plan.shadow(value, want)
+    finally:
+        engine.current.pool.release(instance)
+    assert plan.state == VERIFYING
+
+
+def test_same_result_uses_rego_equality():
+    assert same_result([{"result": 1}], [{"result": 1.0}])
+    assert not same_result([{"result": True}], [{"result": 1}])
+    assert not same_result([{"result": False}], [{"result": 0}])
+
+
+def test_verify_probes_rethrows_traps(engine):
+    plan = engine.native_plan()
+    plan.state = VERIFYING
+
+    def trap(probe):
+        raise wasmtime.Trap("unreachable")
+
+    with pytest.raises(wasmtime.Trap):
+        plan.verify_probes(trap)
+    assert plan.state == DISABLED
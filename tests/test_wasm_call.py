@@ -0,0 +1,108 @@
+import pytest
+import wasmtime
+
+from wasm_call import I32Call, fast_func
+
+MODULE = """
+(module
+ (import "env" "host" (func $host (param i32) (result i32)))
+ (global $g (mut i32) (i32.const 0))
+ (func (export "add") (param i32 i32) (result i32) (i32.add (local.get 0) (local.get 1)))
+ (func (export "mix") (param i32 i32 i32) (result i32)
+   (i32.sub (i32.mul (local.get 0) (local.get 1)) (local.get 2)))
+ (func (export "set") (param i32) (global.set $g (local.get 0)))
+ (func (export "get") (result i32) (global.get $g))
+ (func (export "via_host") (param i32) (result i32) (call $host (local.get 0)))
+ (func (export "trap") (param i32) (result i32) unreachable)
+ (func (export "wide") (param i64) (result i64) (local.get 0))
+)
+"""
+
+VALUES = [0, 1, -1, 7, -42, 2 ** 31 - 1, -(2 ** 31), 65536, 123456789]
+
+
+class HostError(Exception):
+    pass
+
+
+@pytest.fixture
+def exports():
+    store = wasmtime.Store()
+    module = wasmtime.Module(store.engine, wasmtime.wat2wasm(MODULE))
+    i32 = wasmtime.ValType.i32()
+
+    def host(x):
+        if x < 0:
+            raise HostError(x)
+        return x * 2
+
+    linker = wasmtime.Linker(store.engine)
+    linker.define(store, "env", "host", wasmtime.Func(store, wasmtime.FuncType([i32], [i32]), host))
+    instance = linker.instantiate(store, module)
+    return store, instance.exports(store)
+
+
+def _pair(store, exports, name):
+    func = exports[name]
+    fast = fast_func(store, func)
+    assert isinstance(fast, I32Call)
+    return fast, func
+
+
+@pytest.mark.parametrize("name,arity", [("add", 2), ("mix", 3)])
+def test_results_match(exports, name, arity):
+    store, exports = exports
+    fast, func = _pair(store, exports, name)
+    for a in VALUES:
+        for b in VALUES:
+            args = (a, b, a ^ b)[:arity]
+            assert fast(store, *args) == func(store, *args), args
+
+
+def test_no_results_and_state(exports):
+    store, exports = exports
+    fast_set, func_set = _pair(store, exports, "set")
+    fast_get, func_get = _pair(store, exports, "get")
+    for value in VALUES:
+        assert fast_set(store, value) is None
+        assert func_get(store) == value
+        assert func_set(store, value + 1 if value < 2 ** 31 - 1 else 0) is None
+        assert fast_get(store) == func_get(store)
+
+
+def test_host_calls_and_their_exceptions(exports):
+    store, exports = exports
+    fast, func = _pair(store, exports, "via_host")
+    assert fast(store, 21) == func(store, 21) == 42
+    with pytest.raises(HostError):
+        func(store, -1)
+    with pytest.raises(HostError):
+        fast(store, -1)
+
+
+def test_traps(exports):
+    store, exports = exports
+    fast, func = _pair(store, exports, "trap")
+    with pytest.raises(wasmtime.Trap) as generic:
+        func(store, 0)
+    with pytest.raises(wasmtime.Trap) as unchecked:
+        fast(store, 0)
+    assert unchecked.value.trap_code == generic.value.trap_code
+    # The store stays usable after a trap on either path
+    add, _ = _pair(store, exports, "add")
+    assert add(store, 2, 3) == 5
+
+
+def test_argument_count_checked(exports):
+    store, exports = exports
+    fast, func = _pair(store, exports, "add")
+    with pytest.raises(wasmtime.WasmtimeError):
+        func(store, 1)
+    with pytest.raises(wasmtime.WasmtimeError):
+        fast(store, 1)
+
+
+def test_non_i32_exports_use_the_generic_call(exports):
+    store, exports = exports
+    func = exports["wide"]
+    assert fast_func(store, func) is func
@@ -0,0 +1,217 @@
+"""
+Per-stage tracing of decisions
+
+A decision entry point asks the tracer for a trace; the tracer returns None
+unless this decision is sampled, so untraced decisions pay for one attribute
+check and the stages pay for one context variable read. Stages record spans
+from timestamps the pipeline already takes for its metrics.
+
+Exporters receive finished traces; the file exporter writes one OTLP/JSON
+document per line (what an OpenTelemetry collector's file receiver reads),
+the memory exporter keeps the most recent traces for GET /debug-traces.
+Anything with an `export(trace)` method can be added with add_exporter().
+
+Sampling: OPA_TRACE_SAMPLE_RATE traces that fraction of decisions. With
+OPA_TRACE_SLOW_SECONDS set, every decision is traced and those at least that
+slow are exported too, so rare slow decisions are caught; that costs the
+span bookkeeping on every decision.
+"""
+import contextvars
+import json
+import os
+import random
+import threading
+import time
+from collections import deque
+from logger import get_logger
+from config import TRACE_SAMPLE_RATE, TRACE_SLOW_SECONDS, TRACE_EXPORTER, TRACE_FILE, TRACE_MEMORY_SIZE
+
+logger = get_logger(__name__)
+
+SERVICE_NAME = "opa-wasm"
+
+_current = contextvars.ContextVar("opa_trace", default=None)
+
+
+class Span:
+    """One timed stage; times are time.perf_counter() seconds"""
+
+    __slots__ = ("name", "span_id", "parent_id", "start", "end", "attributes")
+
+    def __init__(self, name, parent_id, start, end=None, attributes=None):
+        self.name = name
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent_id
+        self.start = start
+        self.end = end
+        self.attributes = attributes or {}
+
+
+class Trace:
+    """A root span for one decision and the stage spans recorded under it"""
+
+    def __init__(self, name, attributes, sampled):
+        self.trace_id = os.urandom(16).hex()
+        self.sampled = sampled
+        start = time.perf_counter()
+        # Maps perf_counter readings onto wall-clock nanoseconds for export
+        self._epoch_ns = time.time_ns() - int(start * 1e9)
+        self.root = Span(name, None, start, attributes=dict(attributes))
+        self.spans = []
+
+    def add(self, name, start, end, attributes=None):
+        self.spans.append(Span(name, self.root.span_id, start, end, attributes))
+
+    @property
+    def duration(self):
+        return (self.root.end or time.perf_counter()) - self.root.start
+
+    def to_otlp(self):
+        """This trace as an OTLP/JSON ExportTraceServiceRequest"""
+        spans = []
+        for span in [self.root] + self.spans:
+            otlp = {
+                "traceId": self.trace_id,
+                "spanId": span.span_id,
+                "name": span.name,
+                "kind": 1,
+                # OTLP/JSON carries 64-bit integers as strings
+                "startTimeUnixNano": str(self._epoch_ns + int(span.start * 1e9)),
+                "endTimeUnixNano": str(self._epoch_ns + int(span.end * 1e9)),
+                "attributes": [
+                    {"key": key, "value": _otlp_value(value)} for key, value in span.attributes.items()
+                ],
+            }
+            if span.parent_id:
+                otlp["parentSpanId"] = span.parent_id
+            spans.append(otlp)
+        return {
+            "resourceSpans": [{
+                "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": SERVICE_NAME}}]},
+                "scopeSpans": [{"scope": {"name": "opa_wasm.tracing"}, "spans": spans}],
+            }]
+        }
+
+
+def _otlp_value(value):
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+class MemoryExporter:
+    """Keeps the most recent traces in memory"""
+
+    def __init__(self, size=TRACE_MEMORY_SIZE):
+        self._traces = deque(maxlen=size)
+
+    def export(self, trace):
+        self._traces.append(trace)
+
+    def traces(self):
+        return list(self._traces)
+
+
+class FileExporter:
+    """Appends one OTLP/JSON document per trace to a file"""
+
+    def __init__(self, path=TRACE_FILE):
+        self.path = path
+        self._lock = threading.Lock()
+        self._file = open(path, "a", buffering=1)
+
+    def export(self, trace):
+        line = json.dumps(trace.to_otlp(), separators=(",", ":"))
+        with self._lock:
+            self._file.write(line + "\n")
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+
+class Tracer:
+    """Decides which decisions are traced and hands finished traces to exporters"""
+
+    def __init__(self, sample_rate=TRACE_SAMPLE_RATE, slow_seconds=TRACE_SLOW_SECONDS):
+        self.sample_rate = sample_rate
+        self.slow_seconds = slow_seconds
+        self.exporters = []
+        self.active = False
+        self.exported = 0
+
+    def add_exporter(self, exporter):
+        self.exporters.append(exporter)
+        self._update()
+
+    def configure(self, sample_rate=None, slow_seconds=None):
+        """Change sampling at runtime"""
+        if sample_rate is not None:
+            self.sample_rate = sample_rate
+        if slow_seconds is not None:
+            self.slow_seconds = slow_seconds
+        self._update()
+
+    def _update(self):
+        self.active = bool(self.exporters) and (self.sample_rate > 0 or self.slow_seconds > 0)
+
+    def start(self, name, **attributes):
+        """Begin tracing a decision in this context, or None when it is not traced"""
+        if not self.active:
+            return None
+        sampled = self.sample_rate >= 1 or random.random() < self.sample_rate
+        if not sampled and self.slow_seconds <= 0:
+            return None
+        trace = Trace(name, attributes, sampled)
+        trace.token = _current.set(trace)
+        return trace
+
+    def finish(self, trace, **attributes):
+        """End the trace started by start() and export it if sampled or slow"""
+        trace.root.end = time.perf_counter()
+        trace.root.attributes.update(attributes)
+        _current.reset(trace.token)
+        if not trace.sampled and trace.duration < self.slow_seconds:
+            return
+        self.exported += 1
+        for exporter in self.exporters:
+            try:
+                exporter.export(trace)
+            except Exception as e:
+                logger.error(f"Trace exporter {exporter} failed: {e}")
+
+    def shutdown(self):
+        """Stop tracing and close exporters that hold files"""
+        self.active = False
+        for exporter in self.exporters:
+            close = getattr(exporter, "close", None)
+            if close is not None:
+                close()
+
+
+def current():
+    """Trace of the decision running in this context, or None"""
+    return _current.get()
+
+
+def record(name, start, end, **attributes):
+    """Add a stage span to the current trace, if any; start and end are perf_counter() readings"""
+    trace = _current.get()
+    if trace is not None:
+        trace.add(name, start, end, attributes)
+
+
+# Create a singleton tracer with the exporter picked by OPA_TRACE_EXPORTER
+tracer = Tracer()
+memory_exporter = None
+if TRACE_EXPORTER == "memory":
+    memory_exporter = MemoryExporter()
+    tracer.add_exporter(memory_exporter)
+elif TRACE_EXPORTER == "file":
+    tracer.add_exporter(FileExporter())
+elif TRACE_EXPORTER:
+    logger.warning(f"Unknown OPA_TRACE_EXPORTER '{TRACE_EXPORTER}'; tracing disabled")
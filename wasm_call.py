@@ -0,0 +1,64 @@
+from ctypes import byref
+import wasmtime
+from logger import get_logger
+
+logger = get_logger(__name__)
+
+# Func.__call__ rebuilds the function type and re-checks every argument on each
+# call, which costs tens of microseconds. OPA exports only take and return i32,
+# so the raw unchecked call with a preallocated buffer is safe once the type is
+# verified here. These are wasmtime-py internals (pinned in requirements.txt);
+# without them every export falls back to the generic call.
+try:
+    from wasmtime import _ffi as ffi
+    from wasmtime._bindings import _wasmtime_func_call_unchecked
+    from wasmtime._func import enter_wasm
+except ImportError:
+    _wasmtime_func_call_unchecked = None
+
+
+class I32Call:
+    """Calls an all-i32 export through wasmtime's unchecked API with a reused buffer"""
+
+    __slots__ = ("func", "_context", "_func_ptr", "_buffer", "_nparams", "_nresults")
+
+    def __init__(self, store, func, nparams, nresults):
+        self.func = func
+        self._context = store._context()
+        self._func_ptr = byref(func._func)
+        # Arguments go in and the result comes back in the same slots
+        self._buffer = (ffi.wasmtime_val_raw_t * max(nparams, nresults, 1))()
+        self._nparams = nparams
+        self._nresults = nresults
+
+    def __call__(self, store, *args):
+        # Same signature as Func.__call__, so callers cannot tell the two apart
+        if len(args) != self._nparams:
+            raise wasmtime.WasmtimeError(
+                f"expected {self._nparams} arguments, got {len(args)}"
+            )
+        buffer = self._buffer
+        for i, arg in enumerate(args):
+            buffer[i].i32 = arg
+        with enter_wasm(store) as trap:
+            error = _wasmtime_func_call_unchecked(
+                self._context, self._func_ptr, buffer, len(buffer), trap
+            )
+            if error:
+                raise wasmtime.WasmtimeError._from_ptr(error)
+        if self._nresults:
+            return buffer[0].i32
+        return None
+
+
+def fast_func(store, func):
+    """Fast caller for an export that only uses i32, or the export itself otherwise"""
+    if _wasmtime_func_call_unchecked is None or not isinstance(func, wasmtime.Func):
+        return func
+    ty = func.type(store)
+    params, results = ty.params, ty.results
+    i32 = wasmtime.ValType.i32()
+    if len(results) > 1 or any(t != i32 for t in (*params, *results)):
+        logger.debug(f"Export with non-i32 signature {ty} uses the generic call path")
+        return func
+    return I32Call(store, func, len(params), len(results))
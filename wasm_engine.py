@@ -1,76 +1,609 @@
+import hashlib
+import math
+import os
+import threading
+import time
+from contextlib import contextmanager
 import wasmtime
-from logger import logger
-from config import POLICY_WASM_PATH
+from logger import get_logger
+from config import (
+    POLICY_WASM_PATH, POLICY_DATA_PATH, POLICY_INPUT_PATHS_PATH, POLICY_NATIVE_PLAN_PATH, POLICY_ENTRYPOINT, INSTANCE_POOL_SIZE, INSTANCE_POOL_TIMEOUT, MODULE_CACHE_DIR,
+    POLICY_DRAIN_TIMEOUT, EVALUATION_TIMEOUT, EPOCH_TICK_SECONDS,
+    INSTANCE_MEMORY_LIMIT, INSTANCE_MEMORY_HIGH_WATERMARK, INSTANCE_MAX_EVALUATIONS, PROCESS_POOL_WORKER,
+    NATIVE_FAST_PATH, NATIVE_VERIFY_SAMPLES, NATIVE_MAX_DATA_BYTES,
+)
+from instance_pool import InstancePool, PoolClosedError
+from module_cache import load_module
+from opa_abi import resolve_exports, PolicyAbortError
+from guest_memory import memory_view, read_cstring, write_at, ensure_capacity, stream_file
+from opa_builtins import BuiltinDispatcher, UnsupportedBuiltinError
+from input_projection import load_input_paths, project
+from native_plan import load_native_plans
+from guest_eval import evaluate_result_set
+from json_codec import canonical_dumps
+from decision_cache import decision_cache
+from metrics import pool_wait_seconds
+import tracing
+
+logger = get_logger(__name__)
+
+# Engine settings; part of the module cache key since they change the generated code
+ENGINE_SETTINGS = {
+    "cranelift_opt_level": "speed",
+    # Guest code checks the engine epoch so runaway evaluations can be interrupted
+    "epoch_interruption": True,
+}
+
+# Budget for instantiation and parsing data.json, which are not evaluations
+_LOAD_DEADLINE_SECONDS = 300.0
+
+
+def epoch_ticks(seconds):
+    """Epoch deadline covering at least `seconds`; no deadline (about a year) when <= 0"""
+    if not seconds or seconds <= 0:
+        seconds = 365 * 24 * 3600.0
+    # +1 since the current tick may end right after the deadline is armed
+    return math.ceil(seconds / EPOCH_TICK_SECONDS) + 1
+
+
+class EpochTicker:
+    """Single background thread advancing the engine epoch that guest deadlines count in"""
+
+    def __init__(self, engine, interval=EPOCH_TICK_SECONDS):
+        self.engine = engine
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="epoch-ticker", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.engine.increment_epoch()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+
+def create_engine():
+    """Build a wasmtime Engine from ENGINE_SETTINGS"""
+    config = wasmtime.Config()
+    for name, value in ENGINE_SETTINGS.items():
+        setattr(config, name, value)
+    return wasmtime.Engine(config)
+
+
+_shared_engine = None
+_shared_engine_lock = threading.Lock()
+_epoch_ticker = None
+
+
+def get_engine():
+    """Process-wide wasmtime Engine shared by every loaded policy, with its epoch ticker"""
+    global _shared_engine, _epoch_ticker
+    with _shared_engine_lock:
+        if _shared_engine is None:
+            _shared_engine = create_engine()
+            _epoch_ticker = EpochTicker(_shared_engine)
+        return _shared_engine
+
+
+def _file_sha256(path):
+    """Hash a file in chunks; missing files hash as empty"""
+    h = hashlib.sha256()
+    if path and os.path.exists(path):
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                h.update(chunk)
+    return h.hexdigest()
+
+
+def _version(sha256, data_sha256, sidecar_sha256):
+    """Short version string; changes with the policy, its data or the analysis files built with it"""
+    return hashlib.sha256(f"{sha256}:{data_sha256}:{sidecar_sha256}".encode()).hexdigest()[:12]
+
+
+def _memory_type(module):
+    """Memory limits requested by the module's env.memory import"""
+    for imp in module.imports:
+        if imp.module == "env" and imp.name == "memory":
+            return imp.type
+    return wasmtime.MemoryType(wasmtime.Limits(2, None))
+
+
+class PolicyInstance:
+    """One independent Store + instance pair with its own linear memory"""
+
+    def __init__(self, store, instance, memory, entrypoint=POLICY_ENTRYPOINT, data_path=None, version=None):
+        self.store = store
+        # Version of the loaded policy whose pool this instance belongs to
+        self.policy_version = version
+        self.instance = instance
+        self.memory = memory
+        # Every export the hot path needs, resolved once
+        self.abi = resolve_exports(instance.exports(store), store, memory, entrypoint)
+        # Writable view of linear memory, re-taken only when memory has grown
+        self._view = None
+        self._view_size = 0
+        # Data document parsed once and shared by every evaluation on this instance
+        if data_path and os.path.exists(data_path):
+            self.data_addr = self.load_json_file(data_path)
+        else:
+            self.data_addr = self.parse_json(b"{}")
+        # Allocations below this mark outlive evaluations; everything above is per-decision
+        self.base_heap_ptr = self.abi.heap_ptr_get(store)
+        # Linear memory size, refreshed whenever the instance goes back to its pool;
+        # only growth beyond the size once loaded counts toward the recycle watermark
+        self.memory_bytes = self.initial_memory_bytes = memory.data_len(store)
+        self.evaluations = 0
+        # Seconds each evaluation may run; set on checkout, re-armed before every evaluation
+        self.deadline_seconds = None
+        # BuiltinDispatcher behind the env.opa_builtin* imports; set by its bind()
+        self.builtins = None
+        # Input templates parsed below the heap snapshot, by template fingerprint
+        self.templates = {}
+
+    def arm_deadline(self, seconds=None):
+        """Interrupt guest code still running `seconds` from now (default: the last value)"""
+        if seconds is not None:
+            self.deadline_seconds = seconds
+        self.store.set_epoch_deadline(epoch_ticks(self.deadline_seconds))
+
+    def begin_evaluation(self):
+        """Start one evaluation: re-arm its deadline and fix the time its builtins see"""
+        self.arm_deadline()
+        self.evaluations += 1
+        if self.builtins is not None:
+            self.builtins.now_ns = time.time_ns()
+
+    def view(self, end=0):
+        """Writable view of linear memory covering at least addresses below `end`
+
+        Memory only grows, so the region above the heap snapshot is a reusable
+        input buffer that is as large as the largest input seen so far.
+        """
+        size = self.memory.data_len(self.store)
+        if end > size:
+            ensure_capacity(self.memory, self.store, end)
+            size = self.memory.data_len(self.store)
+        if size != self._view_size:
+            # Growth may move the buffer, so a view of the old size is stale
+            self._view = memory_view(self.memory, self.store)
+            self._view_size = size
+        return self._view
+
+    def write_input(self, raw, addr=None):
+        """Copy encoded input to `addr` (default: the heap snapshot) and return the address past it"""
+        addr = self.base_heap_ptr if addr is None else addr
+        return write_at(self.view(addr + len(raw)), addr, raw)
+
+    def parse_input(self, raw, addr=None):
+        """Parse encoded input placed at `addr` (default: the heap snapshot) into an OPA value
+
+        Unlike parse_json this needs no opa_malloc: the heap pointer is moved
+        past the input, and the next reset_heap releases it with everything else.
+        """
+        addr = self.base_heap_ptr if addr is None else addr
+        end = self.write_input(raw, addr)
+        self.abi.heap_ptr_set(self.store, (end + 7) & ~7)
+        value_addr = self.abi.json_parse(self.store, addr, len(raw))
+        if not value_addr:
+            raise RuntimeError("Failed to parse JSON in guest")
+        return value_addr
+
+    def parse_json(self, raw):
+        """Copy JSON bytes into freshly allocated guest memory and parse them into an OPA value"""
+        addr = self.abi.malloc(self.store, len(raw))
+        if not addr:
+            raise RuntimeError("Failed to allocate memory")
+        write_at(self.view(), addr, raw)
+        value_addr = self.abi.json_parse(self.store, addr, len(raw))
+        if not value_addr:
+            raise RuntimeError("Failed to parse JSON in guest")
+        return value_addr
+
+    def template_slots(self, template):
+        """Guest copy of an InputTemplate, parsed on first use and kept for the instance's life
+
+        Returns (skeleton value, [(path, default) per hole]) as guest addresses.
+        Must be called with the heap at the snapshot, before any per-decision
+        allocation, since the snapshot is raised above the new skeleton.
+        """
+        slots = self.templates.get(template.fingerprint)
+        if slots is not None:
+            return slots
+        if self.abi.value_add_path is None:
+            raise RuntimeError("Policy module does not export opa_value_add_path")
+        try:
+            value_addr = self.parse_json(template.base_bytes)
+            holes = []
+            for path_bytes, default_bytes in zip(template.path_bytes, template.default_bytes):
+                path_addr = self.parse_json(path_bytes)
+                default_addr = self.parse_json(default_bytes)
+                if self.abi.value_add_path(self.store, value_addr, path_addr, default_addr):
+                    raise RuntimeError(f"opa_value_add_path failed for template hole {path_bytes.decode()}")
+                holes.append((path_addr, default_addr))
+        except Exception:
+            self.reset_heap()
+            raise
+        self.base_heap_ptr = self.abi.heap_ptr_get(self.store)
+        slots = self.templates[template.fingerprint] = (value_addr, holes)
+        return slots
+
+    def load_json_file(self, path):
+        """Stream a JSON file into guest memory and parse it there, chunk by chunk"""
+        size = os.path.getsize(path)
+        addr = self.abi.malloc(self.store, size)
+        if not addr:
+            raise RuntimeError(f"Failed to allocate {size} bytes for {path}")
+        stream_file(self.memory, self.store, addr, path)
+        value_addr = self.abi.json_parse(self.store, addr, size)
+        if not value_addr:
+            raise RuntimeError(f"Failed to parse {path} in guest")
+        return value_addr
+
+    def reset_heap(self):
+        """Release every allocation made since the heap snapshot in one call"""
+        self.abi.heap_ptr_set(self.store, self.base_heap_ptr)
+
+
+def _recycle_reason(instance):
+    """Why a healthy instance is due for replacement, or None"""
+    if 0 < INSTANCE_MAX_EVALUATIONS <= instance.evaluations:
+        return "evaluations"
+    # Linear memory never shrinks, so an instance that grew stays large until replaced;
+    # measured from the loaded size so a large data document alone never triggers it
+    if 0 < INSTANCE_MEMORY_HIGH_WATERMARK < instance.memory_bytes - instance.initial_memory_bytes:
+        return "memory"
+    return None
+
+
+class PolicyNotLoadedError(RuntimeError):
+    """Raised when checking out from an engine whose policy is not (or no longer) loaded"""
+
+
+class EvaluationTimeoutError(TimeoutError):
+    """Raised when an evaluation runs past its deadline and is interrupted in the guest"""
+
+
+class LoadedPolicy:
+    """One compiled policy version together with its warmed instance pool"""
+
+    def __init__(self, wasm_path, data_path, module, sha256, data_sha256, sidecar_sha256, pool,
+                 input_paths=None, native_plans=None):
+        self.wasm_path = wasm_path
+        self.data_path = data_path
+        self.module = module
+        self.sha256 = sha256
+        self.data_sha256 = data_sha256
+        # input_paths.json and native_plan.json change decisions' cache keys and fast path
+        self.sidecar_sha256 = sidecar_sha256
+        self.version = _version(sha256, data_sha256, sidecar_sha256)
+        self.pool = pool
+        self.loaded_at = time.time()
+        # Entrypoint name -> trie of the input paths it reads; absent means the whole input
+        self.input_paths = input_paths or {}
+        # Entrypoint name -> NativePlan compiled from the IR plan, when the policy fits the subset
+        self.native_plans = native_plans or {}
+
+    def cache_input(self, entrypoint, input_data):
+        """(bytes identifying `input_data` to this policy, whether they are the full input)
+
+        Only the projection is encoded when the build recorded the paths the
+        entrypoint reads; otherwise the canonical encoding of the whole input.
+        """
+        trie = self.input_paths.get(entrypoint)
+        if trie is None:
+            return canonical_dumps(input_data), True
+        return canonical_dumps(project(input_data, trie)), False
+
 
-# TODO: Implement singleton pattern with thread safety
 # FIXME: Add proper error recovery mechanism
 class WasmEngine:
-    def __init__(self):
-        self.store = None
-        self.instance = None
-        # HACK: Initialize in constructor, should be lazy-loaded
-        self.initialize()
-    
+    def __init__(self, wasm_path=POLICY_WASM_PATH, pool_size=INSTANCE_POOL_SIZE, lazy=False,
+                 entrypoint=POLICY_ENTRYPOINT, data_path=POLICY_DATA_PATH,
+                 input_paths_path=POLICY_INPUT_PATHS_PATH, eval_timeout=EVALUATION_TIMEOUT,
+                 native_plan_path=POLICY_NATIVE_PLAN_PATH):
+        self.wasm_path = wasm_path
+        self.data_path = data_path
+        self.input_paths_path = input_paths_path
+        self.native_plan_path = native_plan_path
+        self.pool_size = pool_size
+        # Entrypoint used when callers do not name one; None requires them to
+        self.entrypoint = entrypoint
+        # Per-policy evaluation deadline in seconds; requests may only shorten it
+        self.eval_timeout = eval_timeout
+        self.engine = None
+        # Swapped as a single reference so readers never see a half-loaded policy
+        self.current = None
+        self._reload_lock = threading.Lock()
+        self._reload_listeners = []
+        if not lazy:
+            self.initialize()
+
     def initialize(self):
-        """Initialize OPA WASM module with wasmtime"""
+        """Compile the OPA WASM module once and fill the instance pool"""
         try:
-            # Create engine and store
-            engine = wasmtime.Engine()
-            self.store = wasmtime.Store(engine)
-            module = wasmtime.Module.from_file(engine, POLICY_WASM_PATH)
-            logger.info("✅ WASM module loaded successfully")
-            
-            # Define the host functions with correct signatures
-            # FIXME: opa_abort should read and log the abort message
-            def opa_abort(caller, msg_ptr, msg_len):
-                return None
-                
-            # TODO: Implement proper logging for opa_println
-            def opa_println(caller, msg_ptr, msg_len):
-                return 0
-            
-            # HACK: opa_builtin3 returns dummy value, needs proper implementation
-            def opa_builtin3(caller, builtin_id, ctx, addr):
-                return 0
-            
-            # Create proper function instantiations
-            abort_func = wasmtime.Func(self.store, 
-                wasmtime.FuncType([wasmtime.ValType.i32(), wasmtime.ValType.i32()], []),
-                opa_abort)
-                
-            println_func = wasmtime.Func(self.store, 
-                wasmtime.FuncType([wasmtime.ValType.i32(), wasmtime.ValType.i32()], [wasmtime.ValType.i32()]),
-                opa_println)
-                
-            builtin3_func = wasmtime.Func(self.store, 
-                wasmtime.FuncType([wasmtime.ValType.i32(), wasmtime.ValType.i32(), wasmtime.ValType.i32()], [wasmtime.ValType.i32()]),
-                opa_builtin3)
-            
-            # Link imports
-            linker = wasmtime.Linker(self.store)
-            linker.define("env", "opa_abort", abort_func)
-            linker.define("env", "opa_println", println_func) 
-            linker.define("env", "opa_builtin3", builtin3_func)
-            
-            # Create instance using linker
-            self.instance = linker.instantiate(module)
-            
-            logger.info("✅ OPA WASM initialized successfully")
-            
+            self.engine = get_engine()
+            self.current = self._load(self.wasm_path, self.data_path)
+            logger.info(f"✅ OPA WASM initialized successfully ({self.pool_size} instances)")
+
         except Exception as e:
+            # A later reload() can still bring the engine up once the policy exists
             logger.error(f"❌ Failed to initialize OPA WASM: {e}")
-            self.store = None
-            self.instance = None
-    
-    def get_exports(self):
-        """Get WASM exports if initialized"""
-        if not self.store or not self.instance:
+            self.current = None
+
+    def _sidecar_sha256(self):
+        """Combined hash of the input paths and native plan files next to the policy"""
+        return hashlib.sha256(
+            f"{_file_sha256(self.input_paths_path)}:{_file_sha256(self.native_plan_path)}".encode()
+        ).hexdigest()
+
+    def _load(self, wasm_path, data_path, data_sha256=None, sidecar_sha256=None):
+        """Compile (or load from cache) a module and warm a full pool for it"""
+        # Reuses a previously serialized compile of the same policy when available
+        module, sha256 = load_module(self.engine, wasm_path, MODULE_CACHE_DIR, ENGINE_SETTINGS)
+        logger.info("✅ WASM module loaded successfully")
+        if data_sha256 is None:
+            data_sha256 = _file_sha256(data_path)
+        if sidecar_sha256 is None:
+            sidecar_sha256 = self._sidecar_sha256()
+        memory_type = _memory_type(module)
+        version = _version(sha256, data_sha256, sidecar_sha256)
+        pool = InstancePool(
+            lambda: self._instantiate(module, memory_type, data_path, version),
+            self.pool_size,
+            INSTANCE_POOL_TIMEOUT,
+        )
+        # Only trusted when generated from this exact policy.wasm
+        input_paths = load_input_paths(self.input_paths_path, sha256)
+        native_plans = {}
+        if NATIVE_FAST_PATH:
+            native_plans = load_native_plans(
+                self.native_plan_path, sha256, data_path, NATIVE_VERIFY_SAMPLES, NATIVE_MAX_DATA_BYTES
+            )
+            if native_plans:
+                logger.info(f"Compiled native plans for {', '.join(sorted(native_plans))}; verifying against WASM")
+                self._verify_native_plans(pool, native_plans)
+        return LoadedPolicy(
+            wasm_path, data_path, module, sha256, data_sha256, sidecar_sha256, pool, input_paths, native_plans
+        )
+
+    def _verify_native_plans(self, pool, native_plans):
+        """Run each plan's load-time probes in WASM on the new pool, before any request reaches it"""
+        for name, plan in native_plans.items():
+            instance = pool.acquire()
+            instance.arm_deadline(self.eval_timeout)
+            try:
+                plan.verify_probes(lambda probe: evaluate_result_set(instance, probe, name))
+            except (wasmtime.Trap, UnsupportedBuiltinError, PolicyAbortError):
+                # As in checkout: an instance whose guest state is unknown never serves again
+                pool.discard(instance)
+                instance = None
+            finally:
+                if instance is not None:
+                    pool.release(instance)
+
+    def reload(self, wasm_path=None, data_path=None):
+        """Load a new policy off the request path and atomically swap it in
+
+        Returns True if a new version went live. The previous pool is drained so
+        in-flight evaluations finish on the version they started with.
+        """
+        wasm_path = wasm_path or self.wasm_path
+        data_path = data_path or self.data_path
+        with self._reload_lock:
+            if self.engine is None:
+                self.engine = get_engine()
+
+            sha256 = _file_sha256(wasm_path)
+            data_sha256 = _file_sha256(data_path)
+            sidecar_sha256 = self._sidecar_sha256()
+            old = self.current
+            if old is not None and (old.sha256, old.data_sha256, old.sidecar_sha256) == (
+                    sha256, data_sha256, sidecar_sha256):
+                return False
+
+            new = self._load(wasm_path, data_path, data_sha256, sidecar_sha256)
+            self.current = new
+            logger.info(
+                f"Policy reloaded: {old.version if old else 'none'} -> {new.version}"
+            )
+            if old is not None:
+                self._notify_reload(old.version)
+                old.pool.drain(POLICY_DRAIN_TIMEOUT)
+            return True
+
+    def unload(self, wait=True):
+        """Drop the loaded policy and its pool; the next reload() brings it back
+
+        New checkouts fail at once either way; with wait=False the old pool
+        drains on a background thread instead of the caller's.
+        """
+        with self._reload_lock:
+            old = self.current
+            self.current = None
+        # Nothing is invalidated: the same version may be loaded again unchanged
+        if old is None:
+            return
+        if wait:
+            self._drain(old)
+        else:
+            threading.Thread(target=self._drain, args=(old,), name="policy-drain", daemon=True).start()
+
+    def _drain(self, old):
+        old.pool.drain(POLICY_DRAIN_TIMEOUT)
+        logger.info(f"Unloaded policy {old.version} from {old.wasm_path}")
+
+    def add_reload_listener(self, callback):
+        """Call `callback(version)` with the outgoing version whenever a reload replaces it"""
+        self._reload_listeners.append(callback)
+
+    def _notify_reload(self, version):
+        for callback in self._reload_listeners:
+            try:
+                callback(version)
+            except Exception as e:
+                logger.error(f"Reload listener {callback} failed: {e}")
+
+    def _instantiate(self, module, memory_type, data_path, version=None):
+        """Create a new Store and instance from an already compiled module"""
+        store = wasmtime.Store(self.engine)
+        # Epoch interruption is always on, so even loading needs a deadline
+        store.set_epoch_deadline(epoch_ticks(_LOAD_DEADLINE_SECONDS))
+        # OPA modules import their linear memory, so every store gets its own
+        memory = wasmtime.Memory(store, memory_type)
+
+        i32 = wasmtime.ValType.i32()
+
+        def guest_string(addr):
+            try:
+                return read_cstring(memory, store, addr).decode("utf-8", "replace")
+            except ValueError as e:
+                return f"<unreadable: {e}>"
+
+        # Raised through the guest call, so checkout discards the instance it unwound
+        def opa_abort(addr):
+            raise PolicyAbortError(f"Policy aborted: {guest_string(addr)}")
+
+        # Rego print() output
+        def opa_println(addr):
+            logger.info(f"OPA print: {guest_string(addr)}")
+
+        # Bound to the instance below, once its builtins() export has been read
+        opa_builtin = BuiltinDispatcher()
+
+        linker = wasmtime.Linker(self.engine)
+        linker.define(store, "env", "memory", memory)
+        linker.define(store, "env", "opa_abort", wasmtime.Func(store, wasmtime.FuncType([i32], []), opa_abort))
+        linker.define(store, "env", "opa_println", wasmtime.Func(store, wasmtime.FuncType([i32], []), opa_println))
+        for arity in range(5):
+            builtin_type = wasmtime.FuncType([i32] * (arity + 2), [i32])
+            linker.define(store, "env", f"opa_builtin{arity}", wasmtime.Func(store, builtin_type, opa_builtin))
+
+        instance = linker.instantiate(store, module)
+        policy_instance = PolicyInstance(store, instance, memory, self.entrypoint, data_path, version)
+        if INSTANCE_MEMORY_LIMIT > 0:
+            # Applied once data is loaded, so the limit bounds evaluations whatever data.json weighs;
+            # memory.grow fails past it, so a runaway evaluation traps instead of eating the host
+            store.set_limits(memory_size=policy_instance.initial_memory_bytes + INSTANCE_MEMORY_LIMIT)
+        opa_builtin.bind(policy_instance)
+        return policy_instance
+
+    @contextmanager
+    def checkout(self, timeout=None, eval_timeout=None):
+        """Check out a pooled instance for exclusive use by one evaluation
+
+        Guest calls are interrupted after `eval_timeout` seconds (never longer
+        than the policy's own limit); an interrupted or otherwise trapped
+        instance is discarded and replaced rather than returned to the pool.
+        """
+        while True:
+            policy = self.current
+            if policy is None:
+                raise PolicyNotLoadedError(f"Policy {self.wasm_path} is not loaded")
+            try:
+                waiting = time.perf_counter()
+                instance = policy.pool.acquire(timeout)
+                acquired = time.perf_counter()
+                pool_wait_seconds.observe(acquired - waiting)
+                tracing.record("pool_wait", waiting, acquired)
+                break
+            except PoolClosedError:
+                # Lost a race with a reload; retry against the new policy
+                continue
+        deadline = self.eval_timeout
+        if eval_timeout is not None and (deadline is None or deadline <= 0 or eval_timeout < deadline):
+            deadline = eval_timeout
+        try:
+            instance.arm_deadline(deadline)
+            yield instance
+        except UnsupportedBuiltinError as e:
+            # The guest was unwound mid-call, so it is discarded like a trapped one
+            policy.pool.discard(instance)
+            instance = None
+            logger.error(f"Policy {policy.version} called a builtin with no host implementation: {e}")
+            raise
+        except PolicyAbortError as e:
+            policy.pool.discard(instance)
+            instance = None
+            logger.error(f"{e} on {policy.version}; instance recycled")
+            raise
+        except wasmtime.Trap as e:
+            # Guest state after a trap is unknown, so the instance never serves again
+            policy.pool.discard(instance)
+            instance = None
+            if e.trap_code == wasmtime.TrapCode.INTERRUPT:
+                logger.warning(f"⏱️ Evaluation on {policy.version} exceeded {deadline}s; instance recycled")
+                raise EvaluationTimeoutError(f"Evaluation exceeded its {deadline}s deadline") from e
+            logger.error(f"Guest trapped on {policy.version}; instance recycled: {e}")
+            raise
+        finally:
+            if instance is not None:
+                instance.memory_bytes = instance.memory.data_len(instance.store)
+                reason = _recycle_reason(instance)
+                if reason:
+                    # Replaced in the background; this instance serves until then
+                    policy.pool.recycle(instance, reason)
+                policy.pool.release(instance)
+
+    @property
+    def policy_version(self):
+        """Short hash of the policy currently serving, or None"""
+        return self.current.version if self.current else None
+
+    def cache_key(self, entrypoint, input_data):
+        """(decision cache key, canonical input bytes or None) for the serving policy
+
+        The key is None when nothing is loaded. The bytes are returned only when
+        the key was built from the whole input, so a miss can hand them to the
+        guest instead of encoding again; a projected key leaves encoding the
+        input to the evaluation, which the native path skips entirely.
+        """
+        policy = self.current
+        if policy is None:
+            return None, None
+        # Version and projection come from the same snapshot, so a concurrent swap cannot mix them
+        key_bytes, whole = policy.cache_input(entrypoint or self.entrypoint, input_data)
+        return decision_cache.key(policy.version, entrypoint, key_bytes), key_bytes if whole else None
+
+    def native_plan(self, entrypoint=None):
+        """NativePlan of the serving policy for `entrypoint`, in whatever state, or None"""
+        policy = self.current
+        if policy is None:
+            return None
+        return policy.native_plans.get(entrypoint or self.entrypoint)
+
+    def get_export_names(self):
+        """Names of the functions and globals exported by the policy module"""
+        if not self.current:
             return None
-        return self.instance.exports(self.store)
-    
+        return [export.name for export in self.current.module.exports]
+
+    def memory_bytes(self):
+        """Linear memory held by every instance of the loaded policy"""
+        policy = self.current
+        if policy is None:
+            return 0
+        return sum(instance.memory_bytes for instance in policy.pool.instances())
+
+    def get_stats(self):
+        """Instance pool metrics with per-instance memory and evaluation counts, or None"""
+        policy = self.current
+        if not policy:
+            return None
+        stats = policy.pool.stats()
+        stats["instances"] = [
+            {"memory_bytes": instance.memory_bytes, "evaluations": instance.evaluations}
+            for instance in policy.pool.instances()
+        ]
+        if policy.native_plans:
+            stats["native"] = {name: plan.stats() for name, plan in policy.native_plans.items()}
+        return stats
+
     def is_initialized(self):
         """Check if the WASM engine is initialized"""
-        return self.store is not None and self.instance is not None
+        return self.current is not None
 
-# Create a singleton instance
-wasm_engine = WasmEngine()
+# Create a singleton instance; process backend workers build their own engines instead
+wasm_engine = WasmEngine(lazy=PROCESS_POOL_WORKER)